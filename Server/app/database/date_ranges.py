@@ -0,0 +1,58 @@
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Query, status
+
+from app.database.db_config import now_brt
+
+
+def resolve_date_range(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Converte os filtros de período em um intervalo semiaberto [início, fim) sobre a coluna de data,
+    que o banco resolve pelo índice (extract('year'/'month', coluna) obriga a ler todas as linhas).
+    Mês sem ano usa o ano corrente; date_to é inclusivo.
+    """
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="date_from deve ser anterior a date_to.")
+
+    start = end = None
+    if month or year:
+        year = year or now_brt().year
+        if month:
+            start = datetime(year, month, 1)
+            end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+        else:
+            start, end = datetime(year, 1, 1), datetime(year + 1, 1, 1)
+
+    if date_from:
+        day_start = datetime.combine(date_from, time.min)
+        start = max(start, day_start) if start else day_start
+    if date_to:
+        day_end = datetime.combine(date_to + timedelta(days=1), time.min)
+        end = min(end, day_end) if end else day_end
+    return start, end
+
+
+class DateRangeParams:
+    """Dependência com os filtros de período (?date_from=&date_to=&month=&year=)."""
+
+    def __init__(
+        self,
+        date_from: Optional[date] = Query(None, description="Data inicial (inclusiva)"),
+        date_to: Optional[date] = Query(None, description="Data final (inclusiva)"),
+        month: Optional[int] = Query(None, ge=1, le=12, description="Filtrar por mês (1-12)"),
+        year: Optional[int] = Query(None, description="Filtrar por ano"),
+    ):
+        self.start, self.end = resolve_date_range(date_from, date_to, month, year)
+
+    def apply(self, query, column):
+        if self.start is not None:
+            query = query.filter(column >= self.start)
+        if self.end is not None:
+            query = query.filter(column < self.end)
+        return query
@@ -1,15 +1,49 @@
 from datetime import datetime
+import os
 import pytz
+from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-# Substitua pelos seus dados do XAMPP/MySQL
-DATABASE_URL = "mysql+pymysql://root:@localhost:3306/prjgogift"
+from app.database.pool_metrics import InstrumentedQueuePool, InstrumentedAsyncQueuePool, get_pool_metrics
 
-engine = create_engine(DATABASE_URL)
+load_dotenv()
+
+# Substitua pelos seus dados do XAMPP/MySQL (ou defina DATABASE_URL no .env)
+DATABASE_URL = os.getenv("DATABASE_URL") or "mysql+pymysql://root:@localhost:3306/prjgogift"
+# Mesmo banco, com driver assíncrono (aiomysql) para as rotas async
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL.replace("+pymysql", "+aiomysql")
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    return value.strip().lower() in ("1", "true", "yes", "on") if value not in (None, "") else default
+
+# Configuração do pool (por processo). Dimensione pensando em: workers do uvicorn x (pool_size + max_overflow)
+# <= max_connections do MySQL. pool_recycle deve ficar abaixo do wait_timeout do MySQL.
+POOL_SETTINGS = {
+    "pool_size": _env_int("DB_POOL_SIZE", 5),
+    "max_overflow": _env_int("DB_MAX_OVERFLOW", 10),
+    "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+    "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+    "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+}
+
+engine = create_engine(DATABASE_URL, poolclass=InstrumentedQueuePool, pool_logging_name="sync", **POOL_SETTINGS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, pool_logging_name="async", **POOL_SETTINGS)
+# expire_on_commit=False: em AsyncSession um atributo expirado não pode ser recarregado implicitamente
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+sync_pool_metrics = get_pool_metrics("sync").attach(engine)
+async_pool_metrics = get_pool_metrics("async").attach(async_engine.sync_engine)
+
 Base = declarative_base()
 
 def get_db():
@@ -19,10 +53,13 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 TIMEZONE = pytz.timezone('America/Sao_Paulo')
 
 def now_brt():
     """Retorna o datetime atual no fuso horário de São Paulo (BRT)."""
     utc_now = datetime.utcnow().replace(tzinfo=pytz.utc)
-    return utc_now.astimezone(TIMEZONE)
- 
\ No newline at end of file
+    return utc_now.astimezone(TIMEZONE)
\ No newline at end of file
@@ -4,10 +4,12 @@ from app.models import giftcard_orm
 from app.models import enterprise_orm
 from app.models import categories_orm
 from app.models import order_orm
+from app.database.migrations import run_migrations
 
 def init_db():
     print("Criando tabelas no banco de dados...")
     Base.metadata.create_all(bind=engine)
+    run_migrations()
     print("Banco de dados inicializado com sucesso.")
 
 if __name__ == "__main__":
@@ -0,0 +1,268 @@
+import logging
+from typing import Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session, selectinload
+
+from app.database.db_config import SessionLocal
+from app.enums.code_status import CodeStatus
+from app.models.giftcard_orm import RegisterGiftCardORM, GiftCardCodeORM
+from app.models.order_orm import (
+    OrderORM, OrderItemORM, OrderGiftItemORM, OrderStatus, OrderItemStatus, IssuedCodeORM, IssuedCodeStatus,
+    StockReservationORM
+)
+from app.services.code_service import split_codes
+from app.services.inventory_service import sync_inventory
+from app.services.rating_service import recompute_rating_aggregates
+from app.services.sales_service import recompute_units_sold, refresh_best_sellers
+from app.services.enterprise_stats_service import rebuild_enterprise_stats
+from app.services.stock_service import reserve_stock, return_stock_batch, sum_quantities
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def backfill_issued_codes(db: Session) -> Tuple[int, int]:
+    """
+    Popula issued_codes a partir das colunas ';' antigas (final_giftcard_codes,
+    used_codes e order_gift_items.codes). Idempotente: códigos já migrados (por produto) são ignorados.
+    O mesmo código do mesmo produto em outro item de pedido não cabe no ledger: a linha é descartada
+    e registrada no log com os dois itens. Retorna (criados, descartados).
+    """
+    # (produto, código) -> item de pedido que ficou com o código
+    existing = {
+        (giftcard_id, code): order_item_id
+        for giftcard_id, code, order_item_id in db.query(
+            IssuedCodeORM.register_giftcard_id, IssuedCodeORM.code, IssuedCodeORM.order_item_id
+        )
+    }
+    created = 0
+    dropped = 0
+
+    def add(code, giftcard_id, order_item_id, gift_item_id=None, used=False):
+        nonlocal created, dropped
+        kept_item_id = existing.get((giftcard_id, code))
+        if kept_item_id is not None:
+            if kept_item_id != order_item_id:
+                dropped += 1
+                logger.warning(
+                    f"issued_codes: código '{code}' do produto {giftcard_id} repetido; linha do item {order_item_id} "
+                    f"descartada (mantido o item {kept_item_id})."
+                )
+            return
+        existing[(giftcard_id, code)] = order_item_id
+        db.add(IssuedCodeORM(
+            code=code,
+            register_giftcard_id=giftcard_id,
+            order_item_id=order_item_id,
+            gift_item_id=gift_item_id,
+            status=IssuedCodeStatus.USED if used else IssuedCodeStatus.VALID
+        ))
+        created += 1
+
+    # 1. Códigos dos presentes (ainda não utilizados)
+    gift_items = db.query(OrderGiftItemORM, OrderItemORM.register_giftcard_id).join(
+        OrderItemORM, OrderGiftItemORM.order_item_id == OrderItemORM.id
+    ).filter(OrderGiftItemORM.codes.isnot(None)).yield_per(BATCH_SIZE)
+    for gift_item, giftcard_id in gift_items:
+        for code in split_codes(gift_item.codes):
+            add(code, giftcard_id, gift_item.order_item_id, gift_item_id=gift_item.id)
+
+    # 2. Códigos do comprador e códigos já utilizados (de qualquer dono)
+    items = db.query(OrderItemORM).filter(
+        (OrderItemORM.final_giftcard_codes.isnot(None)) | (OrderItemORM.used_codes.isnot(None))
+    ).yield_per(BATCH_SIZE)
+    for item in items:
+        for code in split_codes(item.final_giftcard_codes):
+            add(code, item.register_giftcard_id, item.id)
+        for code in split_codes(item.used_codes):
+            add(code, item.register_giftcard_id, item.id, used=True)
+
+    db.flush()
+    return created, dropped
+
+
+def widen_giftcard_codes_column(db: Session) -> None:
+    """register_giftcards.codes era VARCHAR(1000); passa a TEXT para não limitar o estoque de códigos."""
+    bind = db.get_bind()
+    if bind.dialect.name != "mysql":
+        return
+    columns = {c["name"]: c for c in inspect(bind).get_columns("register_giftcards")}
+    if "TEXT" not in str(columns["codes"]["type"]).upper():
+        db.execute(text("ALTER TABLE register_giftcards MODIFY codes TEXT NULL"))
+
+
+def widen_order_item_status_enum(db: Session) -> None:
+    """No MySQL o status do item é um ENUM nativo: inclui OUT_OF_STOCK (venda aprovada sem estoque)."""
+    bind = db.get_bind()
+    if bind.dialect.name != "mysql":
+        return
+    columns = {c["name"]: c for c in inspect(bind).get_columns("order_items")}
+    if "OUT_OF_STOCK" not in str(columns["status"]["type"]):
+        values = ", ".join(f"'{status.value}'" for status in OrderItemStatus)
+        db.execute(text(f"ALTER TABLE order_items MODIFY status ENUM({values}) NOT NULL"))
+
+
+def add_missing_column(db: Session, table: str, column: str, ddl: str) -> bool:
+    """create_all não altera tabelas existentes; adiciona a coluna se ela ainda não existir."""
+    columns = {c["name"] for c in inspect(db.get_bind()).get_columns(table)}
+    if column in columns:
+        return False
+    db.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+    return True
+
+
+def add_rating_aggregate_columns(db: Session) -> None:
+    add_missing_column(db, "register_giftcards", "rating_sum", "INTEGER NOT NULL DEFAULT 0")
+    add_missing_column(db, "register_giftcards", "rating_count", "INTEGER NOT NULL DEFAULT 0")
+
+
+def add_units_sold_column(db: Session) -> None:
+    add_missing_column(db, "register_giftcards", "units_sold", "INTEGER NOT NULL DEFAULT 0")
+
+
+def add_reserved_stock_column(db: Session) -> None:
+    """quantityreserved passa a somar as reservas dos pedidos pendentes; parte das que já existem."""
+    if add_missing_column(db, "register_giftcards", "quantityreserved", "INTEGER NOT NULL DEFAULT 0"):
+        db.execute(text(
+            "UPDATE register_giftcards SET quantityreserved = "
+            "(SELECT COALESCE(SUM(stock_reservations.quantity), 0) FROM stock_reservations "
+            "WHERE stock_reservations.register_giftcard_id = register_giftcards.id)"
+        ))
+
+
+def add_missing_index(db: Session, table: str, name: str, columns: list, unique: bool = False) -> bool:
+    """create_all também não cria índices novos em tabelas existentes."""
+    indexes = {index["name"] for index in inspect(db.get_bind()).get_indexes(table)}
+    if name in indexes:
+        return False
+    db.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({', '.join(columns)})"))
+    return True
+
+
+def add_report_indexes(db: Session) -> None:
+    add_missing_index(db, "order_items", "ix_order_items_enterprise_order", ["enterprise_id", "order_id"])
+    add_missing_index(db, "orders", "ix_orders_status_created_at", ["status", "created_at"])
+
+
+def add_analytics_watermark_columns(db: Session) -> None:
+    add_missing_column(db, "order_items", "updated_at", "DATETIME NULL")
+    add_missing_index(db, "orders", "ix_orders_updated_at", ["updated_at"])
+    add_missing_index(db, "order_items", "ix_order_items_updated_at", ["updated_at"])
+
+
+def scope_issued_codes_to_giftcard(db: Session) -> None:
+    """
+    issued_codes.code era único no sistema todo, mas códigos pré-definidos só são únicos por produto:
+    dois produtos com "PROMO10" faziam a aprovação do segundo pedido falhar. A unicidade passa a ser
+    (register_giftcard_id, code), com o produto copiado do item do pedido.
+    """
+    bind = db.get_bind()
+    if add_missing_column(db, "issued_codes", "register_giftcard_id", "CHAR(36) NULL"):
+        db.execute(text(
+            "UPDATE issued_codes SET register_giftcard_id = "
+            "(SELECT order_items.register_giftcard_id FROM order_items WHERE order_items.id = issued_codes.order_item_id)"
+        ))
+
+    indexes = {index["name"]: index for index in inspect(bind).get_indexes("issued_codes")}
+    old = indexes.get("ix_issued_codes_code")
+    if old is not None and old["unique"]:
+        on_table = " ON issued_codes" if bind.dialect.name == "mysql" else ""
+        db.execute(text(f"DROP INDEX ix_issued_codes_code{on_table}"))
+        db.execute(text("CREATE INDEX ix_issued_codes_code ON issued_codes (code)"))
+    add_missing_index(db, "issued_codes", "uq_issued_codes_giftcard_code", ["register_giftcard_id", "code"], unique=True)
+
+
+def backfill_code_inventory(db: Session) -> int:
+    """
+    Importa os códigos pré-definidos de cada produto para giftcard_codes e marca como SOLD
+    os que já foram emitidos em pedidos. Idempotente.
+    """
+    giftcards = db.query(RegisterGiftCardORM).filter(
+        RegisterGiftCardORM.generaterandomly == False,
+        RegisterGiftCardORM.codes.isnot(None)
+    ).all()
+
+    sold = 0
+    for giftcard in giftcards:
+        sync_inventory(db, giftcard)
+
+        issued = dict(
+            db.query(IssuedCodeORM.code, IssuedCodeORM.order_item_id)
+            .join(OrderItemORM, IssuedCodeORM.order_item_id == OrderItemORM.id)
+            .filter(OrderItemORM.register_giftcard_id == giftcard.id)
+        )
+        if not issued:
+            continue
+
+        inventory = db.query(GiftCardCodeORM).filter(
+            GiftCardCodeORM.register_giftcard_id == giftcard.id,
+            GiftCardCodeORM.status == CodeStatus.AVAILABLE,
+            GiftCardCodeORM.code.in_(list(issued))
+        )
+        for code_row in inventory:
+            code_row.status = CodeStatus.SOLD
+            code_row.order_item_id = issued[code_row.code]
+            sold += 1
+
+    db.flush()
+    return sold
+
+
+def hold_pending_orders(db: Session) -> int:
+    """
+    Pedidos PENDING de antes das reservas já baixaram o estoque no checkout: devolve as unidades e cria
+    as reservas, para que aprovação e expiração sigam o fluxo novo. Idempotente (todo pedido criado com
+    reservas as mantém enquanto estiver PENDING). Sem disponível para reservar, o pedido fica sem
+    reserva e a aprovação trata a falta.
+    """
+    pending = db.query(OrderORM).options(selectinload(OrderORM.items)).filter(
+        OrderORM.status == OrderStatus.PENDING,
+        ~db.query(StockReservationORM).filter(StockReservationORM.order_id == OrderORM.id).exists()
+    ).all()
+    for order in pending:
+        quantities = sum_quantities(order.items)
+        return_stock_batch(db, quantities)
+        if quantities and reserve_stock(db, order.id, quantities) is not None:
+            logger.warning(f"stock_reservations: pedido {order.id} ficou sem reserva (estoque insuficiente).")
+    return len(pending)
+
+
+def run_migrations():
+    db = SessionLocal()
+    try:
+        # Alterações de schema antes dos backfills, que já consultam as tabelas pelo ORM
+        widen_giftcard_codes_column(db)
+        widen_order_item_status_enum(db)
+        add_rating_aggregate_columns(db)
+        add_units_sold_column(db)
+        add_reserved_stock_column(db)
+        add_report_indexes(db)
+        add_analytics_watermark_columns(db)
+        scope_issued_codes_to_giftcard(db)
+
+        created, dropped = backfill_issued_codes(db)
+        print(f"issued_codes: {created} código(s) migrado(s), {dropped} repetido(s) descartado(s) (ver log).")
+        sold = backfill_code_inventory(db)
+        print(f"giftcard_codes: estoque importado, {sold} código(s) marcado(s) como vendido(s).")
+        fixed = recompute_rating_aggregates(db)
+        print(f"register_giftcards: agregados de avaliação recalculados em {fixed} produto(s).")
+        fixed = recompute_units_sold(db)
+        print(f"register_giftcards: units_sold recalculado em {fixed} produto(s).")
+        changed = refresh_best_sellers(db)
+        print(f"best_sellers: ranking de mais vendidos materializado ({changed} linha(s) alterada(s)).")
+        rebuilt = rebuild_enterprise_stats(db)
+        print(f"enterprise_stats: estatísticas de {rebuilt} empresa(s) reconstruídas a partir de order_items.")
+        held = hold_pending_orders(db)
+        print(f"stock_reservations: {held} pedido(s) pendente(s) passaram de baixa de estoque para reserva.")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    run_migrations()
@@ -0,0 +1,131 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Response, status
+from sqlalchemy import literal, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# As listas continuam sendo o corpo da resposta; o cursor da próxima página vai no cabeçalho
+# (ausente na última página). O cliente repete a chamada com ?cursor=<valor>.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Codificação com tipo para que o valor volte ao banco exatamente como saiu
+_ENCODERS = (
+    (datetime, "dt", lambda v: v.isoformat(), datetime.fromisoformat),
+    (date, "d", lambda v: v.isoformat(), date.fromisoformat),
+    (Decimal, "dec", str, Decimal),
+    (uuid.UUID, "uuid", str, uuid.UUID),
+    (bool, "b", bool, bool),
+    (int, "i", int, int),
+    (float, "f", float, float),
+    (str, "s", str, str),
+)
+_DECODERS = {tag: decode for _, tag, _, decode in _ENCODERS}
+
+
+class PageParams:
+    """Dependência com os parâmetros de paginação (?limit=&cursor=)."""
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None, description="Valor do cabeçalho X-Next-Cursor da página anterior"),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+
+    def after(self) -> Optional[list]:
+        return decode_cursor(self.cursor) if self.cursor else None
+
+
+class OptionalPageParams(PageParams):
+    """
+    Paginação opcional, para as listas do próprio usuário e do admin: sem ?limit nem ?cursor a
+    resposta traz todas as linhas (o cliente Angular ainda não segue o X-Next-Cursor). Com
+    ?cursor e sem ?limit, as páginas têm o tamanho padrão.
+    """
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Sem limit nem cursor: lista completa"),
+        cursor: Optional[str] = Query(None, description="Valor do cabeçalho X-Next-Cursor da página anterior"),
+    ):
+        self.limit = DEFAULT_PAGE_SIZE if limit is None and cursor else limit
+        self.cursor = cursor
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    encoded = []
+    for value in values:
+        for python_type, tag, encode, _ in _ENCODERS:
+            if isinstance(value, python_type):
+                encoded.append([tag, encode(value)])
+                break
+        else:
+            raise TypeError(f"Tipo não suportado no cursor: {type(value).__name__}")
+    return base64.urlsafe_b64encode(json.dumps(encoded, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return [_DECODERS[tag](value) for tag, value in json.loads(raw)]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor de paginação inválido.")
+
+
+def keyset_statement(query, page: PageParams, columns: Sequence, descending: bool):
+    """
+    Ordena por `columns` (a última deve ser única, ex.: o id) e filtra as linhas depois
+    do cursor com uma comparação de tupla, que usa o índice em vez de pular N linhas.
+    As colunas de ordenação são selecionadas junto para montar o próximo cursor.
+    """
+    after = page.after()
+    if after is not None:
+        if len(after) != len(columns):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor de paginação inválido.")
+        key = tuple_(*columns)
+        last = tuple_(*(literal(value, type_=column.type) for column, value in zip(columns, after)))
+        query = query.filter(key < last if descending else key > last)
+    ordering = [column.desc() if descending else column.asc() for column in columns]
+    query = query.add_columns(*columns).order_by(*ordering)
+    # limit None (OptionalPageParams sem parâmetros): lista completa, sem próxima página
+    return query if page.limit is None else query.limit(page.limit + 1)
+
+
+def _split_page(rows, page: PageParams, columns: Sequence) -> Tuple[List, Optional[str]]:
+    if page.limit is None:
+        return [row[0] for row in rows], None
+    width = len(columns)
+    items = [row[0] for row in rows[:page.limit]]
+    next_cursor = encode_cursor(tuple(rows[page.limit - 1][-width:])) if len(rows) > page.limit else None
+    return items, next_cursor
+
+
+def paginate(db: Session, query, page: PageParams, columns: Sequence, descending: bool = True) -> Tuple[List, Optional[str]]:
+    """Executa `select(Entidade)` paginado por keyset. Retorna (itens, próximo cursor ou None)."""
+    rows = db.execute(keyset_statement(query, page, columns, descending)).all()
+    return _split_page(rows, page, columns)
+
+
+async def paginate_async(db: AsyncSession, query, page: PageParams, columns: Sequence, descending: bool = True) -> Tuple[List, Optional[str]]:
+    rows = (await db.execute(keyset_statement(query, page, columns, descending))).all()
+    return _split_page(rows, page, columns)
+
+
+def next_cursor_headers(next_cursor: Optional[str]) -> dict:
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
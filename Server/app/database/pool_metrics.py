@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """Contadores de uso de um pool de conexões, alimentados pelos eventos do pool."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.connections_created = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def _increment(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def attach(self, engine):
+        """Registra os listeners no pool do engine (sobrevivem a engine.dispose())."""
+        pool = engine.pool
+        event.listen(pool, "connect", lambda *args: self._increment("connections_created"))
+        event.listen(pool, "checkout", lambda *args: self._increment("checkouts"))
+        event.listen(pool, "checkin", lambda *args: self._increment("checkins"))
+        event.listen(pool, "invalidate", lambda *args: self._increment("invalidations"))
+        return self
+
+    def snapshot(self, engine) -> Dict:
+        pool = engine.pool
+        with self._lock:
+            data = {
+                "connections_created": self.connections_created,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_time_avg_ms": round(self.wait_time_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+            }
+        if isinstance(pool, QueuePool):
+            data.update({
+                "pool_size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                # QueuePool.overflow() é negativo enquanto o pool base não está cheio
+                "overflow": max(pool.overflow(), 0),
+            })
+        return data
+
+
+# Métricas por nome de pool (pool_logging_name do engine)
+POOL_METRICS: Dict[str, PoolMetrics] = {}
+
+
+def get_pool_metrics(name: str) -> PoolMetrics:
+    if name not in POOL_METRICS:
+        POOL_METRICS[name] = PoolMetrics(name)
+    return POOL_METRICS[name]
+
+
+class _TimedCheckoutMixin:
+    """Mede quanto tempo cada checkout esperou por uma conexão e conta os timeouts do pool."""
+
+    def _do_get(self):
+        metrics = get_pool_metrics(self._orig_logging_name or "default")
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            metrics.record_timeout()
+            logger.warning(f"Pool '{metrics.name}' esgotado: timeout aguardando conexão.")
+            raise
+        finally:
+            metrics.record_wait(time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
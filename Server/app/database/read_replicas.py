@@ -0,0 +1,108 @@
+import os
+import random
+from typing import List
+
+from fastapi import Request
+from sqlalchemy import create_engine, Insert, Update, Delete
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database.db_config import engine, async_engine, POOL_SETTINGS
+from app.database.pool_metrics import InstrumentedQueuePool, InstrumentedAsyncQueuePool, get_pool_metrics
+
+# URLs das réplicas de leitura separadas por vírgula. Vazio = todas as leituras vão para o primário.
+REPLICA_DATABASE_URLS = [url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()]
+ASYNC_REPLICA_DATABASE_URLS = [
+    url.strip() for url in os.getenv("ASYNC_REPLICA_DATABASE_URLS", "").split(",") if url.strip()
+] or [url.replace("+pymysql", "+aiomysql") for url in REPLICA_DATABASE_URLS]
+
+# Cabeçalho que o cliente envia logo após uma escrita para ler do primário (read-your-writes)
+READ_PRIMARY_HEADER = "X-Read-Primary"
+
+replica_engines = []
+async_replica_engines = []
+replica_pool_metrics = {}
+for index, url in enumerate(REPLICA_DATABASE_URLS):
+    name = f"replica-{index}"
+    replica_engine = create_engine(url, poolclass=InstrumentedQueuePool, pool_logging_name=name, **POOL_SETTINGS)
+    replica_engines.append(replica_engine)
+    replica_pool_metrics[name] = (get_pool_metrics(name).attach(replica_engine), replica_engine)
+for index, url in enumerate(ASYNC_REPLICA_DATABASE_URLS):
+    name = f"async-replica-{index}"
+    replica_engine = create_async_engine(url, poolclass=InstrumentedAsyncQueuePool, pool_logging_name=name, **POOL_SETTINGS)
+    async_replica_engines.append(replica_engine)
+    replica_pool_metrics[name] = (get_pool_metrics(name).attach(replica_engine.sync_engine), replica_engine.sync_engine)
+
+
+def _is_write(clause) -> bool:
+    if isinstance(clause, (Insert, Update, Delete)):
+        return True
+    # SELECT ... FOR UPDATE precisa do lock no primário
+    return getattr(clause, "_for_update_arg", None) is not None
+
+
+class RoutingSession(Session):
+    """
+    Envia leituras para uma réplica e todo o resto para o primário.
+    A réplica é sorteada na primeira leitura e usada pela sessão inteira (uma conexão só e leituras
+    consistentes entre si, sem alternar entre réplicas com atrasos diferentes).
+    Depois da primeira escrita (ou com info["use_primary"]) a sessão fica presa ao primário,
+    garantindo que ela leia o que acabou de escrever.
+    """
+    primary_engine = engine
+    replicas: List = replica_engines
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or _is_write(clause):
+            self.info["use_primary"] = True
+        if self.info.get("use_primary") or not self.replicas:
+            return self.primary_engine
+        replica = self.info.get("replica")
+        if replica is None:
+            replica = self.info["replica"] = random.choice(self.replicas)
+        return replica
+
+
+class AsyncRoutingSession(RoutingSession):
+    primary_engine = async_engine.sync_engine
+    replicas = [replica.sync_engine for replica in async_replica_engines]
+
+
+ReadSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+AsyncReadSessionLocal = async_sessionmaker(
+    class_=AsyncSession, sync_session_class=AsyncRoutingSession, autoflush=False, expire_on_commit=False
+)
+
+
+def _wants_primary(request: Request) -> bool:
+    return request.headers.get(READ_PRIMARY_HEADER, "").lower() in ("1", "true", "yes")
+
+
+def use_primary(db):
+    """Força as próximas leituras da sessão (sync ou async) a irem para o primário."""
+    session = db.sync_session if isinstance(db, AsyncSession) else db
+    session.info["use_primary"] = True
+    return db
+
+
+def reads_primary(db) -> bool:
+    """Indica se a sessão foi marcada para ler do primário (ex.: cabeçalho X-Read-Primary)."""
+    session = db.sync_session if isinstance(db, AsyncSession) else db
+    return bool(session.info.get("use_primary"))
+
+
+def get_read_db(request: Request):
+    db = ReadSessionLocal()
+    if _wants_primary(request):
+        use_primary(db)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db(request: Request):
+    async with AsyncReadSessionLocal() as db:
+        if _wants_primary(request):
+            use_primary(db)
+        yield db
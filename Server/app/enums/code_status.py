@@ -0,0 +1,6 @@
+from enum import Enum
+
+class CodeStatus(str, Enum):
+    AVAILABLE = "AVAILABLE"
+    RESERVED = "RESERVED"
+    SOLD = "SOLD"
\ No newline at end of file
@@ -2,10 +2,19 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import os
+import asyncio
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from app.services.order_cleanup_service import cancel_expired_pending_orders 
+from app.services.rating_service import recompute_rating_aggregates_job, rebuild_top_rated
+from app.services.sales_service import refresh_best_sellers_job
+from app.services.analytics_export_service import ANALYTICS_EXPORT_DIR, export_analytics_job
+from app.database.pagination import NEXT_CURSOR_HEADER
+from app.services.search_service import rebuild_search_index
+from app.services.payment_gateway import payment_gateway
+from app.services.webhook_inbox_service import webhook_inbox, purge_processed_webhooks
+from app.services.email_service import wait_handed_off_emails
 
 # Carrega as variáveis de ambiente do arquivo .env ANTES de qualquer outra importação de rotas
 load_dotenv() 
@@ -14,15 +23,37 @@ scheduler = AsyncIOScheduler()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Índice de busca em memória: montado na subida e reconstruído periodicamente
+    # para incorporar escritas feitas por outros workers
+    await asyncio.to_thread(rebuild_search_index)
+    scheduler.add_job(rebuild_search_index, 'interval', minutes=10, id="search_index_job")
+    # Ranking de mais bem avaliados: idem, e o rebuild também atualiza a média global da nota bayesiana
+    await asyncio.to_thread(rebuild_top_rated)
+    scheduler.add_job(rebuild_top_rated, 'interval', minutes=10, id="top_rated_job")
     # Inicia o agendador quando a aplicação sobe
     scheduler.add_job(cancel_expired_pending_orders, 'interval', minutes=1, id="cancel_orders_job")
+    # Corrige divergências dos agregados de avaliação fora do horário de pico
+    scheduler.add_job(recompute_rating_aggregates_job, 'cron', hour=4, id="rating_recompute_job")
+    # Ranking de mais vendidos: os incrementos vêm da aprovação; aqui saem as vendas fora das janelas 7d/30d
+    scheduler.add_job(refresh_best_sellers_job, 'interval', minutes=15, id="best_sellers_job")
+    # Exportação analítica (Parquet) de madrugada, para o financeiro não consultar o banco no horário comercial
+    if ANALYTICS_EXPORT_DIR:
+        scheduler.add_job(export_analytics_job, 'cron', hour=3, id="analytics_export_job")
+    # Caixa de entrada do webhook: eventos DONE antigos saem uma vez por dia
+    scheduler.add_job(purge_processed_webhooks, 'cron', hour=2, id="webhook_inbox_purge_job")
     scheduler.start()
+    # Workers que processam as notificações de pagamento gravadas pelo webhook
+    webhook_inbox.start(mercadopago_routes.process_payment_event)
     yield
     # Para o agendador quando a aplicação desce
     scheduler.shutdown()
+    await webhook_inbox.stop()
+    await wait_handed_off_emails()
+    # Fecha as conexões keep-alive com o gateway de pagamento
+    await payment_gateway.aclose()
 
 # Importe todas as suas rotas
-from app.routes import auth_routes, category_routes, order_routes,user_routes, giftcard_routes, enterprise_routes, mercadopago_routes, chatbot_routes, validation_routes
+from app.routes import auth_routes, category_routes, order_routes,user_routes, giftcard_routes, enterprise_routes, mercadopago_routes, chatbot_routes, validation_routes, metrics_routes
 
 app = FastAPI(
     title="GoGift API",
@@ -43,6 +74,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # --- PASTA DE UPLOADS ---
@@ -64,6 +96,7 @@ app.include_router(chatbot_routes.router)
 app.include_router(category_routes.router)
 app.include_router(order_routes.router)
 app.include_router(validation_routes.router)
+app.include_router(metrics_routes.router)
 
 @app.get("/", tags=["Root"])
 async def read_root():
@@ -1,5 +1,5 @@
 from enum import Enum
-from sqlalchemy import Column, Integer, String, Enum as SqlEnum, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Enum as SqlEnum, Date, DateTime, ForeignKey, Boolean, Numeric
 from app.enums.roles import Role
 from app.database.db_config import Base, now_brt
 from datetime import datetime
@@ -26,4 +26,35 @@ class EmpresaORM(Base):
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False, unique=True)
     low_stock_notified = Column(Boolean, default=False, nullable=False)
     
-    user = relationship("UserORM", back_populates="enterprise_details", lazy="joined")
\ No newline at end of file
+    user = relationship("UserORM", back_populates="enterprise_details", lazy="joined")
+
+
+class EnterpriseStatsORM(Base):
+    """
+    Totais de vendas da empresa para o dashboard, mantidos na mesma transação do checkout,
+    da aprovação, da rejeição e da expiração (ver enterprise_stats_service).
+    """
+    __tablename__ = "enterprise_stats"
+
+    enterprise_id = Column(Integer, ForeignKey("enterprise.id"), primary_key=True)
+    items_count = Column(Integer, default=0, server_default="0", nullable=False)        # itens em qualquer status
+    approved_items = Column(Integer, default=0, server_default="0", nullable=False)
+    approved_units = Column(Integer, default=0, server_default="0", nullable=False)
+    sales_value = Column(Numeric(12, 2), default=0, server_default="0", nullable=False)  # seller_amount aprovado
+    rejected_items = Column(Integer, default=0, server_default="0", nullable=False)     # REJECTED e REFUNDED
+    expired_items = Column(Integer, default=0, server_default="0", nullable=False)
+    updated_at = Column(DateTime, default=now_brt, onupdate=now_brt)
+
+
+class EnterpriseDailyStatsORM(Base):
+    """Mesmos contadores de enterprise_stats por dia (data de criação do pedido)."""
+    __tablename__ = "enterprise_daily_stats"
+
+    enterprise_id = Column(Integer, ForeignKey("enterprise.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    items_count = Column(Integer, default=0, server_default="0", nullable=False)
+    approved_items = Column(Integer, default=0, server_default="0", nullable=False)
+    approved_units = Column(Integer, default=0, server_default="0", nullable=False)
+    sales_value = Column(Numeric(12, 2), default=0, server_default="0", nullable=False)
+    rejected_items = Column(Integer, default=0, server_default="0", nullable=False)
+    expired_items = Column(Integer, default=0, server_default="0", nullable=False)
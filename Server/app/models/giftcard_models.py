@@ -40,7 +40,11 @@ class RegisterGiftCard(BaseModel):
     ativo: bool = True
     validade: Optional[date] = None
     description: Optional[str] = None
+    # Estoque bruto (inclui as unidades reservadas por pedidos pendentes); o que ainda pode ser
+    # comprado é quantity_for_sale = quantityavailable - quantityreserved
     quantityavailable: int
+    quantityreserved: int = 0
+    quantity_for_sale: int = 0
     generaterandomly: bool = False
     codes: Optional[str] = None
     imageUrl: Optional[str] = None
@@ -55,6 +59,11 @@ class RegisterGiftCard(BaseModel):
     class Config:
         from_attributes = True
 
+class Suggestion(BaseModel):
+    type: str  # "giftcard" ou "category"
+    id: str
+    text: str
+
 class SoldGiftCard(BaseModel):
     id: UUID
     code: str
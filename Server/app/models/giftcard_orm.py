@@ -1,13 +1,14 @@
 import uuid
 from sqlalchemy import (
     Column, Integer, String, Boolean, ForeignKey,
-    CHAR, TypeDecorator, Numeric, Date, DateTime, Enum as SqlEnum
+    CHAR, TypeDecorator, Numeric, Date, DateTime, Text, Index, UniqueConstraint, Enum as SqlEnum
 )
 from sqlalchemy.orm import relationship
 from app.database.db_config import Base, now_brt
 from datetime import datetime
 
 from app.enums.sold_status import SoldStatus
+from app.enums.code_status import CodeStatus
 
 class GUID(TypeDecorator):
     impl = CHAR(36)
@@ -33,11 +34,18 @@ class RegisterGiftCardORM(Base):
     ativo = Column(Boolean, default=True, nullable=False)
     validade = Column(Date, nullable=True)
     description = Column(String(255), nullable=True)
+    # Estoque bruto; quantityreserved soma as reservas dos pedidos pendentes (ver stock_service)
     quantityavailable = Column(Integer, nullable=False)
+    quantityreserved = Column(Integer, default=0, server_default="0", nullable=False)
     generaterandomly = Column(Boolean, default=False)
-    codes = Column(String(1000), nullable=True) 
+    codes = Column(Text, nullable=True) 
     imageUrl = Column(String(255), nullable=True)
     low_stock_notified = Column(Boolean, default=False, nullable=False)
+    # Agregados das avaliações, mantidos por rate_gift_card (ver rating_service)
+    rating_sum = Column(Integer, default=0, server_default="0", nullable=False)
+    rating_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Unidades vendidas em pedidos aprovados (ver sales_service)
+    units_sold = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=now_brt)
     updated_at = Column(DateTime, default=now_brt, onupdate=now_brt)
 
@@ -48,21 +56,25 @@ class RegisterGiftCardORM(Base):
     sold_cards = relationship("SoldGiftCardORM", back_populates="original_giftcard", cascade="all, delete-orphan")
     
     reviews = relationship("GiftCardReviewORM", back_populates="giftcard", cascade="all, delete-orphan")
+    inventory_codes = relationship("GiftCardCodeORM", back_populates="giftcard", cascade="all, delete-orphan")
+
+    @property
+    def quantity_for_sale(self):
+        return max(0, (self.quantityavailable or 0) - (self.quantityreserved or 0))
 
     @property
     def has_sales(self):
-        return len(self.sold_cards) > 0
+        return (self.units_sold or 0) > 0
 
     @property
     def average_rating(self):
-        if not self.reviews:
+        if not self.rating_count:
             return 0.0
-        total = sum(r.rating for r in self.reviews)
-        return round(total / len(self.reviews), 1)
+        return round(self.rating_sum / self.rating_count, 1)
 
     @property
     def total_reviews(self):
-        return len(self.reviews)
+        return self.rating_count or 0
 
 
 class GiftCardReviewORM(Base):
@@ -79,6 +91,28 @@ class GiftCardReviewORM(Base):
     giftcard = relationship("RegisterGiftCardORM", back_populates="reviews")
 
 
+class GiftCardCodeORM(Base):
+    """
+    Estoque de códigos pré-definidos (generaterandomly=False). O checkout reserva as linhas
+    AVAILABLE do produto e a aprovação do pagamento as marca como SOLD.
+    """
+    __tablename__ = "giftcard_codes"
+    __table_args__ = (
+        UniqueConstraint("register_giftcard_id", "code", name="uq_giftcard_codes_giftcard_code"),
+        Index("ix_giftcard_codes_giftcard_status", "register_giftcard_id", "status"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    register_giftcard_id = Column(GUID(), ForeignKey("register_giftcards.id"), nullable=False)
+    code = Column(String(100), nullable=False)
+    status = Column(SqlEnum(CodeStatus), nullable=False, default=CodeStatus.AVAILABLE)
+    order_item_id = Column(GUID(), ForeignKey("order_items.id"), nullable=True, index=True)
+    reserved_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=now_brt)
+
+    giftcard = relationship("RegisterGiftCardORM", back_populates="inventory_codes")
+
+
 class SoldGiftCardORM(Base):
     __tablename__ = "sold_giftcards"
 
@@ -95,4 +129,21 @@ class SoldGiftCardORM(Base):
     transaction_id = Column(String(255), index=True, nullable=True)
 
     original_giftcard = relationship("RegisterGiftCardORM", back_populates="sold_cards")
-    owner = relationship("UserORM", back_populates="purchased_giftcards")
\ No newline at end of file
+    owner = relationship("UserORM", back_populates="purchased_giftcards")
+
+class BestSellerORM(Base):
+    """
+    Ranking materializado de mais vendidos por período ('all', '30d', '7d').
+    Incrementado na aprovação do pedido e recalculado pelo scheduler (ver sales_service).
+    """
+    __tablename__ = "best_sellers"
+    __table_args__ = (
+        Index("ix_best_sellers_period_units", "period", "units"),
+    )
+
+    period = Column(String(8), primary_key=True)
+    register_giftcard_id = Column(GUID(), ForeignKey("register_giftcards.id"), primary_key=True)
+    units = Column(Integer, default=0, server_default="0", nullable=False)
+    updated_at = Column(DateTime, default=now_brt, onupdate=now_brt)
+
+    giftcard = relationship("RegisterGiftCardORM")
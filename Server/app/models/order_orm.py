@@ -1,6 +1,6 @@
 import uuid
 from sqlalchemy import (
-    Column, Integer, String, ForeignKey, Numeric, DateTime, Enum as SqlEnum
+    Column, Integer, String, ForeignKey, Numeric, DateTime, Text, Index, UniqueConstraint, Enum as SqlEnum
 )
 from sqlalchemy.orm import relationship
 from app.database.db_config import Base, now_brt
@@ -19,9 +19,27 @@ class OrderItemStatus(str, Enum):
     VALID = "VALID"     
     USED = "USED"       
     PARTIALLY_USED = "PARTIALLY_USED" 
+    # Pago, mas aprovado sem estoque: nenhum código emitido, aguarda reembolso ou reposição
+    OUT_OF_STOCK = "OUT_OF_STOCK"
+
+class IssuedCodeStatus(str, Enum):
+    VALID = "VALID"
+    USED = "USED"
+
+class WebhookEventStatus(str, Enum):
+    PENDING = "PENDING"
+    PROCESSING = "PROCESSING"
+    DONE = "DONE"
+    DEAD = "DEAD"
 
 class OrderORM(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Relatórios filtram por status e período (ver date_ranges)
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        # Exportação analítica incremental (marca d'água em updated_at)
+        Index("ix_orders_updated_at", "updated_at"),
+    )
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -37,6 +55,11 @@ class OrderORM(Base):
 
 class OrderItemORM(Base):
     __tablename__ = "order_items"
+    __table_args__ = (
+        # Vendas da empresa: filtra pela empresa e junta com orders sem voltar à tabela
+        Index("ix_order_items_enterprise_order", "enterprise_id", "order_id"),
+        Index("ix_order_items_updated_at", "updated_at"),
+    )
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     order_id = Column(GUID(), ForeignKey("orders.id"), nullable=False)
@@ -50,12 +73,15 @@ class OrderItemORM(Base):
     final_giftcard_codes = Column(String(1000), nullable=True) 
     used_codes = Column(String(1000), nullable=True)
     status = Column(SqlEnum(OrderItemStatus), nullable=False, default=OrderItemStatus.VALID)
+    # Baixa de códigos muda o item sem tocar no pedido; a exportação analítica precisa enxergar isso
+    updated_at = Column(DateTime, default=now_brt, onupdate=now_brt)
     
     order = relationship("OrderORM", back_populates="items")
     original_giftcard = relationship("RegisterGiftCardORM")
     enterprise = relationship("EmpresaORM")
 
     gift_items = relationship("OrderGiftItemORM", back_populates="order_item", cascade="all, delete-orphan")
+    issued_codes = relationship("IssuedCodeORM", back_populates="order_item", cascade="all, delete-orphan")
 
 class OrderGiftItemORM(Base):
     __tablename__ = "order_gift_items"
@@ -70,4 +96,84 @@ class OrderGiftItemORM(Base):
     
     codes = Column(String(1000), nullable=True) 
 
-    order_item = relationship("OrderItemORM", back_populates="gift_items")
\ No newline at end of file
+    order_item = relationship("OrderItemORM", back_populates="gift_items")
+    issued_codes = relationship("IssuedCodeORM", back_populates="gift_item")
+
+class IssuedCodeORM(Base):
+    """
+    Um registro por código emitido. É a fonte de verdade para consulta e baixa;
+    as colunas ';' de OrderItemORM/OrderGiftItemORM são mantidas apenas para exibição.
+    """
+    __tablename__ = "issued_codes"
+    __table_args__ = (
+        # Códigos pré-definidos são da empresa e só são únicos por produto (como em giftcard_codes)
+        Index("uq_issued_codes_giftcard_code", "register_giftcard_id", "code", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    code = Column(String(100), nullable=False, index=True)
+    register_giftcard_id = Column(GUID(), ForeignKey("register_giftcards.id"), nullable=False)
+    order_item_id = Column(GUID(), ForeignKey("order_items.id"), nullable=False, index=True)
+    gift_item_id = Column(Integer, ForeignKey("order_gift_items.id"), nullable=True, index=True)
+    status = Column(SqlEnum(IssuedCodeStatus), nullable=False, default=IssuedCodeStatus.VALID)
+    created_at = Column(DateTime, default=now_brt)
+    redeemed_at = Column(DateTime, nullable=True)
+    redeemed_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    order_item = relationship("OrderItemORM", back_populates="issued_codes")
+    gift_item = relationship("OrderGiftItemORM", back_populates="issued_codes")
+
+class StockReservationORM(Base):
+    """
+    Reserva de estoque de um pedido pendente, também somada em register_giftcards.quantityreserved.
+    Disponível = quantityavailable - quantityreserved; o estoque do produto só é baixado na aprovação
+    e a reserva dura até o pedido ser fechado (ver stock_service).
+    """
+    __tablename__ = "stock_reservations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(GUID(), ForeignKey("orders.id"), nullable=False, index=True)
+    register_giftcard_id = Column(GUID(), ForeignKey("register_giftcards.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=now_brt)
+
+class WebhookEventORM(Base):
+    """
+    Caixa de entrada das notificações do Mercado Pago: o webhook só grava o evento e responde;
+    os workers de webhook_inbox_service processam, com novas tentativas e estado DEAD no fim.
+    """
+    __tablename__ = "webhook_inbox"
+    __table_args__ = (
+        # Workers buscam o próximo evento pronto; o webhook confere se já há um pendente do pagamento
+        Index("ix_webhook_inbox_status_next_attempt", "status", "next_attempt_at"),
+        Index("ix_webhook_inbox_payment_status", "payment_id", "status"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    payment_id = Column(String(64), nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(SqlEnum(WebhookEventStatus), nullable=False, default=WebhookEventStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, nullable=False, default=now_brt)
+    next_attempt_at = Column(DateTime, nullable=False, default=now_brt)
+    # Prazo do worker que pegou o evento; vencido (worker caiu), o evento volta para a fila
+    locked_until = Column(DateTime, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+
+class ProcessedPaymentEventORM(Base):
+    """
+    (payment_id, status) já aplicados a um pedido. Notificações repetidas do Mercado Pago são
+    descartadas por aqui, sem consultar o gateway nem carregar o pedido (ver payment_events_service).
+    """
+    __tablename__ = "processed_payment_events"
+    __table_args__ = (
+        UniqueConstraint("payment_id", "status", name="uq_processed_payment_events_payment_status"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    payment_id = Column(String(64), nullable=False)
+    status = Column(String(32), nullable=False)
+    order_id = Column(GUID(), ForeignKey("orders.id"), nullable=True)
+    processed_at = Column(DateTime, nullable=False, default=now_brt)
@@ -6,6 +6,8 @@ from app.database.db_config import get_db
 from app.models.categories_orm import CategoriesORM 
 from app.models.categories_models import Category, CategoryCreate
 from app.auth.auth_bearer import get_current_admin
+from app.services.search_service import search_index, suggest_index
+from app.services.cache_service import invalidate_giftcards, CATALOG_LISTS_TAG
 
 router = APIRouter(
     prefix="/categories",
@@ -29,6 +31,7 @@ async def create_category(
     db.add(new_category)
     db.commit()
     db.refresh(new_category)
+    suggest_index.put("category", new_category.id, new_category.name)
     return new_category
 
 # --- Rota de Admin para Atualizar Categoria ---
@@ -46,6 +49,11 @@ async def update_category(
     db_category.name = category_update.name
     db.commit()
     db.refresh(db_category)
+
+    # O nome da categoria é indexado na busca e aparece nas respostas do catálogo
+    affected_ids = search_index.rename_category(category_id, db_category.name)
+    suggest_index.put("category", category_id, db_category.name)
+    await invalidate_giftcards(affected_ids, CATALOG_LISTS_TAG)
     return db_category
 
 @router.delete("/{category_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -60,4 +68,5 @@ async def delete_category(
         
     db.delete(db_category)
     db.commit()
+    suggest_index.discard("category", category_id)
     return None
\ No newline at end of file
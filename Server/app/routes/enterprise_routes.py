@@ -1,25 +1,33 @@
+from datetime import date, timedelta
 from decimal import Decimal
 import traceback
-from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks, Query
+from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks, Query, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy import extract, func, case, select
+from sqlalchemy import func, case, select
 from sqlalchemy.orm import Session, selectinload, joinedload
-from typing import List, Optional
+from typing import List, Literal, Optional
 import uuid
 
-from app.database.db_config import get_db
+from app.database.db_config import get_db, now_brt
+from app.database.date_ranges import DateRangeParams
+from app.database.pagination import OptionalPageParams, paginate, set_next_cursor
+from app.database.read_replicas import get_read_db
 from app.auth.auth_bearer import get_current_admin
 from app.models.giftcard_orm import RegisterGiftCardORM
-from app.models.order_orm import OrderORM, OrderItemORM, OrderStatus, OrderItemStatus
+from app.models.order_orm import OrderORM, OrderItemORM
 from app.models.order_models import OrderItemSchema
 from app.security import enterprise_required, get_current_user
 
-from app.models.enterprise_orm import EmpresaORM, EnterpriseStatus
+from app.models.enterprise_orm import EmpresaORM, EnterpriseDailyStatsORM, EnterpriseStatsORM, EnterpriseStatus
 from app.models.enterprise_models import EnterpriseCreate, EnterpriseRejection, EnterpriseResponse
 from app.models.user_orm import UserORM
 from app.enums.roles import Role
 
 from app.services.email_service import send_email_with_template
+from app.services.report_service import (
+    ENTERPRISE_SALES_COLUMNS, EXPORT_MEDIA_TYPES, enterprise_sales_export_query, filter_enterprise_sales, stream_rows,
+)
 
 import logging
 import traceback
@@ -32,12 +40,27 @@ router = APIRouter(
     tags=["Enterprise"]
 )
 
+# Ordem das vendas da empresa (o id do item desempata itens do mesmo pedido)
+SALES_ORDER = (OrderORM.created_at, OrderItemORM.id)
+
 class EnterpriseDashboardStats(BaseModel):
     total_sales_count: int
     total_sales_value: Decimal
     total_products_count: int
     total_stock_count: int
 
+class EnterpriseDailyStats(BaseModel):
+    day: date
+    items_count: int
+    approved_items: int
+    approved_units: int
+    sales_value: Decimal
+    rejected_items: int
+    expired_items: int
+
+    class Config:
+        from_attributes = True
+
 @router.get("/pending", response_model=List[EnterpriseResponse])
 async def get_pending_enterprises(
     db: Session = Depends(get_db),
@@ -79,38 +102,20 @@ async def get_enterprise_dashboard_stats(
     user_id = current_user.id
 
     try:
-        # 1. Total de Vendas (contagem de itens de pedidos pertencentes à empresa)
-        total_sales_count = db.query(
-            func.coalesce(func.count(OrderItemORM.id), 0)
-        ).filter(
-            OrderItemORM.enterprise_id == enterprise_id
-        ).scalar()
-
-        # 2. Valor Total Recebido
-        total_sales_value = db.query(
-            func.coalesce(func.sum(OrderItemORM.seller_amount), Decimal('0.00'))
-        ).join(OrderORM).filter( 
-            OrderItemORM.enterprise_id == enterprise_id,
-            OrderORM.status == OrderStatus.APPROVED 
-        ).scalar()
-
-        # 3. Total de Produtos Cadastrados 
-        total_products_count = db.query(
-            func.coalesce(func.count(RegisterGiftCardORM.id), 0)
-        ).filter(
-            RegisterGiftCardORM.user_id == user_id
-        ).scalar()
+        # 1. Vendas: uma linha do rollup enterprise_stats (mantido no checkout/aprovação/rejeição/expiração)
+        sales = db.get(EnterpriseStatsORM, enterprise_id)
 
-        # 4. Total em Estoque
-        total_stock_count = db.query(
+        # 2. Produtos e estoque: uma agregação sobre o catálogo da empresa (não cresce com as vendas)
+        total_products_count, total_stock_count = db.query(
+            func.count(RegisterGiftCardORM.id),
             func.coalesce(func.sum(RegisterGiftCardORM.quantityavailable), 0)
         ).filter(
             RegisterGiftCardORM.user_id == user_id
-        ).scalar()
+        ).one()
 
         stats_data = {
-            "total_sales_count": total_sales_count,
-            "total_sales_value": total_sales_value,
+            "total_sales_count": sales.items_count if sales else 0,
+            "total_sales_value": sales.sales_value if sales else Decimal("0.00"),
             "total_products_count": total_products_count,
             "total_stock_count": total_stock_count
         }
@@ -122,6 +127,24 @@ async def get_enterprise_dashboard_stats(
             detail="Erro interno ao calcular estatísticas do dashboard."
         )
 
+@router.get("/dashboard-stats/daily", response_model=List[EnterpriseDailyStats])
+async def get_enterprise_daily_stats(
+    days: int = Query(30, ge=1, le=366, description="Quantidade de dias até hoje"),
+    db: Session = Depends(get_db),
+    current_user: UserORM = Depends(enterprise_required)
+):
+    if not current_user.enterprise_details:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Detalhes da empresa não encontrados para este usuário."
+        )
+
+    since = now_brt().date() - timedelta(days=days - 1)
+    return db.query(EnterpriseDailyStatsORM).filter(
+        EnterpriseDailyStatsORM.enterprise_id == current_user.enterprise_details.id,
+        EnterpriseDailyStatsORM.day >= since
+    ).order_by(EnterpriseDailyStatsORM.day).all()
+
 @router.get("/me", response_model=EnterpriseResponse)
 async def get_my_enterprise_details(
     db: Session = Depends(get_db),
@@ -223,38 +246,47 @@ async def reject_enterprise(
     )
     return db_enterprise
 
+def enterprise_sales_query(enterprise_id: int, product_id: Optional[uuid.UUID] = None, period: Optional[DateRangeParams] = None):
+    query = select(OrderItemORM).options(
+        selectinload(OrderItemORM.order).selectinload(OrderORM.owner),
+        selectinload(OrderItemORM.original_giftcard)
+    )
+    return filter_enterprise_sales(query, enterprise_id, product_id, period)
+
 @router.get("/enterprise/sales", response_model=List[OrderItemSchema])
 async def get_enterprise_sales(
+    response: Response,
     product_id: Optional[uuid.UUID] = Query(None, description="Filtrar por ID do Gift Card (RegisterGiftCardORM)"),
-    month: Optional[int] = Query(None, ge=1, le=12, description="Filtrar por mês (1-12)"),
-    year: Optional[int] = Query(None, description="Filtrar por ano"),
-    db: Session = Depends(get_db),
+    period: DateRangeParams = Depends(),
+    page: OptionalPageParams = Depends(),
+    db: Session = Depends(get_read_db),
     current_user: UserORM = Depends(enterprise_required) 
 ):
     if not current_user.enterprise_details:
          raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Detalhes da empresa não encontrados para este usuário.")
     enterprise_id = current_user.enterprise_details.id
 
-    query = db.query(OrderItemORM).filter(OrderItemORM.enterprise_id == enterprise_id, OrderORM.status == OrderStatus.APPROVED)
+    query = enterprise_sales_query(enterprise_id, product_id, period)
+    sales_items, next_cursor = paginate(db, query, page, SALES_ORDER)
+    set_next_cursor(response, next_cursor)
 
-    query = query.options(
-        selectinload(OrderItemORM.order).selectinload(OrderORM.owner),
-        selectinload(OrderItemORM.original_giftcard)
-    )
+    return sales_items
 
-    if product_id:
-        query = query.filter(OrderItemORM.register_giftcard_id == product_id)
-    if year:
-        query = query.join(OrderORM).filter(extract('year', OrderORM.created_at) == year)
-    if month:
-         if not year: 
-             query = query.join(OrderORM)
-         query = query.filter(extract('month', OrderORM.created_at) == month)
-
-    if not year and not month:
-        query = query.join(OrderORM)
-    query = query.order_by(OrderORM.created_at.desc())
-
-    sales_items = query.all()
+@router.get("/enterprise/sales/export")
+async def export_enterprise_sales(
+    product_id: Optional[uuid.UUID] = Query(None, description="Filtrar por ID do Gift Card (RegisterGiftCardORM)"),
+    period: DateRangeParams = Depends(),
+    format: Literal["csv", "ndjson"] = Query("csv"),
+    current_user: UserORM = Depends(enterprise_required)
+):
+    """Histórico completo de vendas da empresa, em streaming (mesmos filtros de /enterprise/sales)."""
+    if not current_user.enterprise_details:
+         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Detalhes da empresa não encontrados para este usuário.")
 
-    return sales_items
\ No newline at end of file
+    query = enterprise_sales_export_query(current_user.enterprise_details.id, product_id, period)
+    header = [name for name, _ in ENTERPRISE_SALES_COLUMNS]
+    return StreamingResponse(
+        stream_rows(query, header, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="vendas.{format}"'},
+    )
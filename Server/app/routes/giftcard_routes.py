@@ -1,9 +1,11 @@
+import asyncio
 import uuid
 import os
-from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File, Form
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import asc, func, desc
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status, UploadFile, File, Form
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import select
+from typing import List, Literal, Optional
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import date, datetime
 from sqlalchemy.exc import IntegrityError
@@ -11,13 +13,24 @@ from PIL import Image, ImageOps
 from nsfw_image_detector import NSFWDetector
 from io import BytesIO
 
-from app.database.db_config import get_db
+from app.database.db_config import get_async_db
+from app.database.pagination import OptionalPageParams, PageParams, encode_cursor, next_cursor_headers, paginate_async, set_next_cursor
+from app.database.read_replicas import get_async_read_db, reads_primary
 from app.enums.sold_status import SoldStatus
 from app.models.giftcard_orm import GiftCardReviewORM, RegisterGiftCardORM, SoldGiftCardORM
-from app.models.giftcard_models import RegisterGiftCard, ReviewCreate, ReviewResponse, SoldGiftCardDetails
+from app.models.giftcard_models import RegisterGiftCard, ReviewCreate, ReviewResponse, SoldGiftCardDetails, Suggestion
 from app.models.order_orm import OrderItemORM, OrderORM, OrderStatus
 from app.models.user_orm import UserORM
 from app.security import get_current_user, enterprise_required
+from app.services.inventory_service import sync_inventory
+from app.services.rating_service import AVERAGE_RATING, add_rating, top_rated_board
+from app.services.sales_service import sample_active_giftcard_ids, top_best_seller_ids
+from app.services.search_service import search_index, suggest_index, index_giftcard, unindex_giftcard
+from app.services.stock_service import set_stock
+from app.services.cache_service import (
+    cached_json, invalidate, invalidate_giftcards, giftcard_tag,
+    CATALOG_LISTS_TAG, TOP_RATED_TAG, BEST_SELLERS_TAG,
+)
 
 router = APIRouter(
     prefix="/giftcards",
@@ -31,6 +44,34 @@ if not os.path.exists(UPLOAD_DIRECTORY):
 
 nsfw_detector = NSFWDetector()
 
+# Relações usadas pelo schema RegisterGiftCard. Com AsyncSession não há lazy load durante
+# a serialização, então são carregadas aqui. has_sales, average_rating e total_reviews
+# vêm das colunas units_sold, rating_sum e rating_count.
+GIFTCARD_LOAD_OPTIONS = (
+    joinedload(RegisterGiftCardORM.category),
+)
+
+# Ordem padrão das listagens paginadas por cursor (o id desempata produtos criados no mesmo instante)
+NEWEST_FIRST = (RegisterGiftCardORM.created_at, RegisterGiftCardORM.id)
+
+BEST_SELLERS_LIMIT = 5
+TOP_RATED_MAX = 20
+
+async def get_giftcard_with_relations(db: AsyncSession, giftcard_id) -> Optional[RegisterGiftCardORM]:
+    result = await db.execute(
+        select(RegisterGiftCardORM).options(*GIFTCARD_LOAD_OPTIONS).filter(RegisterGiftCardORM.id == giftcard_id)
+    )
+    return result.scalars().first()
+
+def serialize_giftcards(giftcards) -> list:
+    return [RegisterGiftCard.model_validate(gc).model_dump(mode="json") for gc in giftcards]
+
+def listing_tags(*extra_tags: str):
+    """Tags de uma listagem em cache: a tag geral de listagens mais a de cada produto exibido."""
+    def tags(content: list) -> list:
+        return [CATALOG_LISTS_TAG, *extra_tags, *(giftcard_tag(item["id"]) for item in content)]
+    return tags
+
 # --- DEFINIÇÃO DE TAXAS ---
 PLATFORM_COMMISSION_PERCENTAGE = Decimal("0.03")
 
@@ -75,7 +116,7 @@ async def create_giftcard(
     generaterandomly: bool = Form(False),
     codes: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: UserORM = Depends(enterprise_required),
 ):
     try:
@@ -126,8 +167,13 @@ async def create_giftcard(
         category_id=category_id
     )
     db.add(db_giftcard)
-    db.commit()
-    db.refresh(db_giftcard)
+    await db.flush()
+    await db.run_sync(sync_inventory, db_giftcard)
+    await db.commit()
+    await invalidate(CATALOG_LISTS_TAG)
+    db_giftcard = await get_giftcard_with_relations(db, db_giftcard.id)
+    index_giftcard(db_giftcard)
+    top_rated_board.upsert(db_giftcard)
     return db_giftcard
 
 @router.put("/{giftcard_id}", response_model=RegisterGiftCard)
@@ -144,26 +190,32 @@ async def update_giftcard(
     generaterandomly: bool = Form(False),
     codes: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_giftcard = db.query(RegisterGiftCardORM).options(
-        joinedload(RegisterGiftCardORM.sold_cards)
-    ).filter(RegisterGiftCardORM.id == giftcard_id).first()
+    db_giftcard = await get_giftcard_with_relations(db, giftcard_id)
     
     if db_giftcard is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Gift Card not found")
     if db_giftcard.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to perform this action")
     
-    has_sales = len(db_giftcard.sold_cards) > 0
-    
-    if has_sales:
+    if db_giftcard.has_sales:
         if db_giftcard.title != title:
              raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Não é possível alterar o Título de um produto que já possui vendas.")
         
         if db_giftcard.desired_amount != desired_amount:
              raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Não é possível alterar o Valor de um produto que já possui vendas.")
 
+    if quantityavailable < 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A quantidade disponível não pode ser negativa.")
+    # Estoque lido agora: a gravação no fim só vale se ninguém o alterou no meio (venda, devolução)
+    seen_quantity = db_giftcard.quantityavailable
+    if quantityavailable != seen_quantity and quantityavailable < db_giftcard.quantityreserved:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"{db_giftcard.quantityreserved} unidade(s) estão reservadas por pedidos pendentes; o estoque não pode ficar abaixo disso."
+        )
+
     try:
         selling_price = calculate_selling_price(desired_amount)
         if selling_price <= 0:
@@ -208,32 +260,52 @@ async def update_giftcard(
     db_giftcard.validade = validade
     db_giftcard.ativo = ativo
     db_giftcard.description = description
-    db_giftcard.quantityavailable = quantityavailable
     db_giftcard.generaterandomly = generaterandomly
     db_giftcard.codes = codes
     db_giftcard.imageUrl = image_url
     db_giftcard.category_id = category_id
+    await db.run_sync(sync_inventory, db_giftcard)
+    # Estoque por UPDATE condicional (e não pelo flush do ORM): não sobrescreve uma venda concorrente
+    if quantityavailable != seen_quantity and not await db.run_sync(set_stock, db_giftcard.id, seen_quantity, quantityavailable):
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="O estoque do produto mudou durante a edição (venda, devolução ou reserva). Recarregue e tente novamente."
+        )
 
-    db.commit()
-    db.refresh(db_giftcard)
+    await db.commit()
+    await invalidate_giftcards([db_giftcard.id], CATALOG_LISTS_TAG)
+    await db.refresh(db_giftcard, ["quantityavailable", "quantityreserved"])
+    db_giftcard = await get_giftcard_with_relations(db, db_giftcard.id)
+    index_giftcard(db_giftcard)
+    top_rated_board.upsert(db_giftcard)
     return db_giftcard
 
+async def refresh_rating(db: AsyncSession, product: RegisterGiftCardORM):
+    """Depois de gravar uma avaliação: relê os agregados e atualiza cache, índice de busca e ranking."""
+    await db.refresh(product, ["rating_sum", "rating_count", "ativo", "category_id"])
+    search_index.update_rating(product.id, product.average_rating)
+    top_rated_board.upsert(product)
+    await invalidate_giftcards([product.id], TOP_RATED_TAG)
+
 @router.post("/{giftcard_id}/rate", response_model=ReviewResponse)
 async def rate_gift_card(
     giftcard_id: uuid.UUID,
     review: ReviewCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: UserORM = Depends(get_current_user)
 ):
-    product = db.query(RegisterGiftCardORM).filter(RegisterGiftCardORM.id == giftcard_id).first()
+    product = await db.get(RegisterGiftCardORM, giftcard_id)
     if not product:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
 
-    has_purchased = db.query(OrderItemORM).join(OrderORM).filter(
-        OrderItemORM.register_giftcard_id == giftcard_id,
-        OrderORM.owner_id == current_user.id,
-        OrderORM.status == OrderStatus.APPROVED
-    ).first()
+    has_purchased = (await db.execute(
+        select(OrderItemORM.id).join(OrderORM).filter(
+            OrderItemORM.register_giftcard_id == giftcard_id,
+            OrderORM.owner_id == current_user.id,
+            OrderORM.status == OrderStatus.APPROVED
+        ).limit(1)
+    )).first()
 
     if not has_purchased:
         raise HTTPException(
@@ -241,17 +313,21 @@ async def rate_gift_card(
             detail="Você só pode avaliar produtos que comprou e cujo pagamento foi aprovado."
         )
 
-    existing_review = db.query(GiftCardReviewORM).filter(
-        GiftCardReviewORM.giftcard_id == giftcard_id,
-        GiftCardReviewORM.user_id == current_user.id
-    ).first()
+    # Trava a avaliação existente para que a diferença de nota aplicada nos agregados seja exata
+    existing_review = (await db.execute(
+        select(GiftCardReviewORM).filter(
+            GiftCardReviewORM.giftcard_id == giftcard_id,
+            GiftCardReviewORM.user_id == current_user.id
+        ).with_for_update()
+    )).scalars().first()
 
     if existing_review:
+        await db.run_sync(add_rating, giftcard_id, review.rating - existing_review.rating)
         existing_review.rating = review.rating
         existing_review.comment = review.comment
         existing_review.created_at = datetime.utcnow()
-        db.commit()
-        db.refresh(existing_review)
+        await db.commit()
+        await refresh_rating(db, product)
         return ReviewResponse(
             id=existing_review.id, rating=existing_review.rating, 
             comment=existing_review.comment, created_at=existing_review.created_at, 
@@ -265,8 +341,10 @@ async def rate_gift_card(
         comment=review.comment
     )
     db.add(new_review)
-    db.commit()
-    db.refresh(new_review)
+    await db.run_sync(add_rating, giftcard_id, review.rating, 1)
+    await db.commit()
+    await refresh_rating(db, product)
+    await db.refresh(new_review)
     
     return ReviewResponse(
         id=new_review.id, rating=new_review.rating, 
@@ -275,135 +353,175 @@ async def rate_gift_card(
     )
 
 @router.get("/top-rated/", response_model=List[RegisterGiftCard])
-def get_top_rated_giftcards(db: Session = Depends(get_db)):
-    query = db.query(
-        RegisterGiftCardORM,
-        func.coalesce(func.avg(GiftCardReviewORM.rating), 0).label('avg_rating')
-    ).outerjoin(GiftCardReviewORM).group_by(RegisterGiftCardORM.id)
-    
-    query = query.filter(RegisterGiftCardORM.ativo == True)
-    
-    query = query.order_by(desc('avg_rating'))
-    
-    results = query.limit(5).all() 
-    
-    giftcards = []
-    for gc, avg in results:
+async def get_top_rated_giftcards(
+    category_id: Optional[int] = Query(None),
+    limit: int = Query(5, ge=1, le=TOP_RATED_MAX),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    async def load():
+        # Posições vêm do ranking bayesiano em memória; o banco só entrega os produtos por id
+        page_ids = top_rated_board.top(limit, category_id)
+        if not page_ids:
+            return []
+        result = await db.execute(
+            select(RegisterGiftCardORM).options(*GIFTCARD_LOAD_OPTIONS).filter(RegisterGiftCardORM.id.in_(page_ids))
+        )
+        by_id = {gc.id: gc for gc in result.scalars().all()}
+        return serialize_giftcards(by_id[gc_id] for gc_id in page_ids if gc_id in by_id)
 
-        giftcards.append(gc)
-        
-    return giftcards
+    key = f"giftcards:top-rated:{category_id}:{limit}"
+    return await cached_json(key, load, tags=listing_tags(TOP_RATED_TAG), refresh=reads_primary(db))
 
 @router.get("/me", response_model=List[RegisterGiftCard])
-def read_my_giftcards(current_user: UserORM = Depends(get_current_user), db: Session = Depends(get_db)):
-     return db.query(RegisterGiftCardORM).options(
-         joinedload(RegisterGiftCardORM.category),
-         joinedload(RegisterGiftCardORM.sold_cards),
-         joinedload(RegisterGiftCardORM.reviews)
-     ).filter(RegisterGiftCardORM.user_id == current_user.id).all()
+async def read_my_giftcards(
+    response: Response,
+    page: OptionalPageParams = Depends(),
+    current_user: UserORM = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+     giftcards, next_cursor = await paginate_async(
+         db,
+         select(RegisterGiftCardORM).options(*GIFTCARD_LOAD_OPTIONS)
+         .filter(RegisterGiftCardORM.user_id == current_user.id),
+         page, NEWEST_FIRST,
+     )
+     set_next_cursor(response, next_cursor)
+     return giftcards
+
+@router.get("/suggest", response_model=List[Suggestion])
+async def suggest_giftcards(q: str = Query(..., min_length=1), limit: int = Query(8, ge=1, le=20)):
+    # Autocomplete por tecla: responde só do índice em memória, sem tocar no banco
+    return suggest_index.suggest(q, limit)
 
 @router.get("/search/", response_model=List[RegisterGiftCard])
-def search_giftcards(
+async def search_giftcards(
     q: Optional[str] = None,
     category_id: Optional[int] = Query(None),
     min_price: Optional[Decimal] = Query(None),
     max_price: Optional[Decimal] = Query(None),
     sort_by: Optional[str] = Query(None), 
-    db: Session = Depends(get_db)
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    query = db.query(RegisterGiftCardORM).options(joinedload(RegisterGiftCardORM.category)).filter(RegisterGiftCardORM.ativo == True)
-  
-    if q:
-        search_term = f"%{q}%"
-        query = query.filter(RegisterGiftCardORM.title.ilike(search_term))
-    
+    # Os mesmos filtros valem para a releitura dos resultados do índice: ele só é atualizado depois
+    # do commit, então um produto recém-desativado ou com preço/categoria alterados ainda pode aparecer nele
+    filters = [RegisterGiftCardORM.ativo == True]
     if category_id:
-        query = query.filter(RegisterGiftCardORM.category_id == category_id)
-
+        filters.append(RegisterGiftCardORM.category_id == category_id)
     if min_price is not None:
-        query = query.filter(RegisterGiftCardORM.valor >= min_price)
+        filters.append(RegisterGiftCardORM.valor >= min_price)
     if max_price is not None:
-        query = query.filter(RegisterGiftCardORM.valor <= max_price)
-
-    if sort_by == "price_asc":
-        query = query.order_by(asc(RegisterGiftCardORM.valor))
-    elif sort_by == "price_desc":
-        query = query.order_by(desc(RegisterGiftCardORM.valor))
-    elif sort_by == "nota_desc":
-        query = query.outerjoin(GiftCardReviewORM)\
-                     .group_by(RegisterGiftCardORM.id)\
-                     .order_by(desc(func.avg(GiftCardReviewORM.rating)))
-    
-    return query.all()
+        filters.append(RegisterGiftCardORM.valor <= max_price)
+
+    async def load():
+        if q:
+            # Busca textual pelo índice invertido (título, descrição e categoria, sem acentos, BM25).
+            # Termos comuns pontuam dezenas de milhares de postings (~50 ms): roda numa thread
+            # para não parar o event loop do worker
+            try:
+                page_ids, next_key = await asyncio.to_thread(
+                    search_index.search, q, category_id, min_price, max_price, sort_by, page.limit, page.after()
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            if not page_ids:
+                return []
+            result = await db.execute(
+                select(RegisterGiftCardORM).options(*GIFTCARD_LOAD_OPTIONS).filter(RegisterGiftCardORM.id.in_(page_ids), *filters)
+            )
+            by_id = {gc.id: gc for gc in result.scalars().all()}
+            content = serialize_giftcards(by_id[gc_id] for gc_id in page_ids if gc_id in by_id)
+            return content, next_cursor_headers(encode_cursor(next_key) if next_key else None)
+
+        query = select(RegisterGiftCardORM).options(*GIFTCARD_LOAD_OPTIONS).filter(*filters)
+
+        # O id desempata a ordenação para o cursor não pular nem repetir produtos
+        descending = True
+        if sort_by == "price_asc":
+            columns, descending = (RegisterGiftCardORM.valor, RegisterGiftCardORM.id), False
+        elif sort_by == "price_desc":
+            columns = (RegisterGiftCardORM.valor, RegisterGiftCardORM.id)
+        elif sort_by == "nota_desc":
+            columns = (AVERAGE_RATING, RegisterGiftCardORM.id)
+        else:
+            columns = NEWEST_FIRST
+
+        giftcards, next_cursor = await paginate_async(db, query, page, columns, descending)
+        return serialize_giftcards(giftcards), next_cursor_headers(next_cursor)
+
+    # Ordenação por nota muda com qualquer avaliação nova, não só dos produtos já listados
+    extra_tags = (TOP_RATED_TAG,) if sort_by == "nota_desc" else ()
+    key = f"giftcards:search:{(q or '').lower()}:{category_id}:{min_price}:{max_price}:{sort_by}:{page.limit}:{page.cursor}"
+    return await cached_json(key, load, tags=listing_tags(*extra_tags), refresh=reads_primary(db))
 
 @router.get("/category/{category_id}", response_model=List[RegisterGiftCard])
-def get_giftcards_by_category(category_id: int, db: Session = Depends(get_db)):
-    giftcards = db.query(RegisterGiftCardORM).options(joinedload(RegisterGiftCardORM.category)).filter(RegisterGiftCardORM.category_id == category_id, RegisterGiftCardORM.ativo == True).all()
-    return giftcards
+async def get_giftcards_by_category(category_id: int, page: PageParams = Depends(), db: AsyncSession = Depends(get_async_read_db)):
+    async def load():
+        giftcards, next_cursor = await paginate_async(
+            db,
+            select(RegisterGiftCardORM).options(*GIFTCARD_LOAD_OPTIONS)
+            .filter(RegisterGiftCardORM.category_id == category_id, RegisterGiftCardORM.ativo == True),
+            page, NEWEST_FIRST,
+        )
+        return serialize_giftcards(giftcards), next_cursor_headers(next_cursor)
+
+    key = f"giftcards:category:{category_id}:{page.limit}:{page.cursor}"
+    return await cached_json(key, load, tags=listing_tags(), refresh=reads_primary(db))
 
 
 @router.get("/", response_model=List[RegisterGiftCard])
-def read_all_giftcards(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    giftcards = db.query(RegisterGiftCardORM).options(joinedload(RegisterGiftCardORM.category)).filter(RegisterGiftCardORM.ativo == True).offset(skip).limit(limit).all()
+async def read_all_giftcards(page: PageParams = Depends(), db: AsyncSession = Depends(get_async_read_db)):
+    async def load():
+        giftcards, next_cursor = await paginate_async(
+            db,
+            select(RegisterGiftCardORM).options(*GIFTCARD_LOAD_OPTIONS).filter(RegisterGiftCardORM.ativo == True),
+            page, NEWEST_FIRST,
+        )
+        return serialize_giftcards(giftcards), next_cursor_headers(next_cursor)
 
-    return giftcards
+    key = f"giftcards:all:{page.limit}:{page.cursor}"
+    return await cached_json(key, load, tags=listing_tags(), refresh=reads_primary(db))
 
 @router.get("/best-sellers", response_model=List[RegisterGiftCard])
-def get_best_sellers(db: Session = Depends(get_db)):
-    # Busca os top 5 produtos mais vendidos (soma da quantidade em pedidos APROVADOS)
-    best_sellers_query = db.query(RegisterGiftCardORM)\
-        .join(OrderItemORM, RegisterGiftCardORM.id == OrderItemORM.register_giftcard_id)\
-        .join(OrderORM, OrderItemORM.order_id == OrderORM.id)\
-        .filter(
-            OrderORM.status == OrderStatus.APPROVED,
-            RegisterGiftCardORM.ativo == True
-        )\
-        .group_by(RegisterGiftCardORM.id)\
-        .order_by(desc(func.sum(OrderItemORM.quantity)))\
-        .limit(5)
-        
-    best_sellers = best_sellers_query.all()
+async def get_best_sellers(
+    period: Literal["all", "30d", "7d"] = Query("all", description="Janela do ranking: desde sempre, 30 ou 7 dias"),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    async def load():
+        # Top 5 lido do ranking materializado (best_sellers), completado com uma amostra aleatória
+        ranked_ids = await db.run_sync(top_best_seller_ids, period, BEST_SELLERS_LIMIT)
+        fill_ids = await db.run_sync(sample_active_giftcard_ids, BEST_SELLERS_LIMIT - len(ranked_ids), ranked_ids)
+        page_ids = ranked_ids + fill_ids
+        if not page_ids:
+            return []
+
+        result = await db.execute(
+            select(RegisterGiftCardORM).options(*GIFTCARD_LOAD_OPTIONS).filter(RegisterGiftCardORM.id.in_(page_ids))
+        )
+        by_id = {gc.id: gc for gc in result.scalars().all()}
+        return serialize_giftcards(by_id[gc_id] for gc_id in page_ids if gc_id in by_id)
 
-    if len(best_sellers) < 5:
-        needed = 5 - len(best_sellers)
-        existing_ids = [p.id for p in best_sellers]
-        
-        random_fill = db.query(RegisterGiftCardORM)\
-            .filter(
-                RegisterGiftCardORM.ativo == True,
-                RegisterGiftCardORM.id.notin_(existing_ids)
-            )\
-            .order_by(func.rand())\
-            .limit(needed)\
-            .all()
-            
-        best_sellers.extend(random_fill)
-        
-    return best_sellers
+    key = f"giftcards:best-sellers:{period}"
+    return await cached_json(key, load, tags=listing_tags(BEST_SELLERS_TAG), refresh=reads_primary(db))
 
 @router.get("/{giftcard_id}", response_model=RegisterGiftCard)
-def read_giftcard_by_id(giftcard_id: uuid.UUID, db: Session = Depends(get_db)):
-    db_giftcard = db.query(RegisterGiftCardORM).options(
-        joinedload(RegisterGiftCardORM.category),
-        joinedload(RegisterGiftCardORM.sold_cards),
-        joinedload(RegisterGiftCardORM.reviews)
-    ).filter(RegisterGiftCardORM.id == giftcard_id).first()
-    
-    if db_giftcard is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Gift Card not found")
-    return db_giftcard
+async def read_giftcard_by_id(giftcard_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
+    async def load():
+        db_giftcard = await get_giftcard_with_relations(db, giftcard_id)
+
+        if db_giftcard is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Gift Card not found")
+        return serialize_giftcards([db_giftcard])[0]
+
+    return await cached_json(f"giftcard:{giftcard_id}", load, tags=[giftcard_tag(giftcard_id)])
 
 @router.delete("/{giftcard_id}", response_model=RegisterGiftCard)
-def delete_giftcard(
+async def delete_giftcard(
     giftcard_id: uuid.UUID, 
     current_user: dict = Depends(enterprise_required),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    db_giftcard = db.query(RegisterGiftCardORM).options(
-        joinedload(RegisterGiftCardORM.sold_cards),
-        joinedload(RegisterGiftCardORM.category),
-        joinedload(RegisterGiftCardORM.reviews)
-    ).filter(RegisterGiftCardORM.id == giftcard_id).first()
+    db_giftcard = await get_giftcard_with_relations(db, giftcard_id)
     
     if db_giftcard is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Gift Card not found")
@@ -411,7 +529,7 @@ def delete_giftcard(
     if db_giftcard.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to perform this action")
 
-    if len(db_giftcard.sold_cards) > 0:
+    if db_giftcard.has_sales:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, 
             detail="Este Gift Card possui vendas registradas e não pode ser excluído."
@@ -426,8 +544,11 @@ def delete_giftcard(
             image_to_remove = image_path
 
     try:
-        db.delete(db_giftcard)
-        db.commit()
+        await db.delete(db_giftcard)
+        await db.commit()
+        await invalidate_giftcards([giftcard_id], CATALOG_LISTS_TAG)
+        unindex_giftcard(giftcard_id)
+        top_rated_board.remove(giftcard_id)
 
         if image_to_remove:
             try:
@@ -437,7 +558,7 @@ def delete_giftcard(
                 pass
 
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, 
             detail="Este produto está vinculado a pedidos existentes e não pode ser excluído."
@@ -446,8 +567,8 @@ def delete_giftcard(
     return response_data
 
 @router.get("/codes/{giftcard_id}", response_model=List[str])
-def get_giftcard_codes(giftcard_id: uuid.UUID, db: Session = Depends(get_db)):
-    db_giftcard = db.query(RegisterGiftCardORM).filter(RegisterGiftCardORM.id == giftcard_id).first()
+async def get_giftcard_codes(giftcard_id: uuid.UUID, db: AsyncSession = Depends(get_async_db)):
+    db_giftcard = await db.get(RegisterGiftCardORM, giftcard_id)
     if db_giftcard is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Gift Card not found")
     if not db_giftcard.codes:
@@ -457,10 +578,12 @@ def get_giftcard_codes(giftcard_id: uuid.UUID, db: Session = Depends(get_db)):
 
 
 @router.get("/validate/{code}", response_model=SoldGiftCardDetails)
-def validate_giftcard_code(code: str, db: Session = Depends(get_db), current_user: UserORM = Depends(enterprise_required)):
-    sold_giftcard = db.query(SoldGiftCardORM)\
-        .options(joinedload(SoldGiftCardORM.owner), joinedload(SoldGiftCardORM.original_giftcard))\
-        .filter(SoldGiftCardORM.code == code).first()
+async def validate_giftcard_code(code: str, db: AsyncSession = Depends(get_async_db), current_user: UserORM = Depends(enterprise_required)):
+    sold_giftcard = (await db.execute(
+        select(SoldGiftCardORM)
+        .options(joinedload(SoldGiftCardORM.owner), joinedload(SoldGiftCardORM.original_giftcard))
+        .filter(SoldGiftCardORM.code == code)
+    )).scalars().first()
 
     if not sold_giftcard:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Gift Card não encontrado.")
@@ -481,10 +604,12 @@ def validate_giftcard_code(code: str, db: Session = Depends(get_db), current_use
 
 # ROTA VALIDAÇÃO
 @router.put("/validate/{code}/use", response_model=SoldGiftCardDetails)
-def mark_giftcard_as_used(code: str, db: Session = Depends(get_db), current_user: UserORM = Depends(enterprise_required)):
-    sold_giftcard = db.query(SoldGiftCardORM)\
-        .options(joinedload(SoldGiftCardORM.owner), joinedload(SoldGiftCardORM.original_giftcard))\
-        .filter(SoldGiftCardORM.code == code).first()
+async def mark_giftcard_as_used(code: str, db: AsyncSession = Depends(get_async_db), current_user: UserORM = Depends(enterprise_required)):
+    sold_giftcard = (await db.execute(
+        select(SoldGiftCardORM)
+        .options(joinedload(SoldGiftCardORM.owner), joinedload(SoldGiftCardORM.original_giftcard))
+        .filter(SoldGiftCardORM.code == code)
+    )).scalars().first()
 
     if not sold_giftcard:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Gift Card não encontrado.")
@@ -496,8 +621,7 @@ def mark_giftcard_as_used(code: str, db: Session = Depends(get_db), current_user
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Este Gift Card já foi utilizado.")
 
     sold_giftcard.status = SoldStatus.USED
-    db.commit()
-    db.refresh(sold_giftcard)
+    await db.commit()
 
     return SoldGiftCardDetails(
         id=sold_giftcard.id,
@@ -512,14 +636,22 @@ def mark_giftcard_as_used(code: str, db: Session = Depends(get_db), current_user
     
 # ROTA PARA HISTÓRICO
 @router.get("/used/me", response_model=List[SoldGiftCardDetails])
-def get_my_used_giftcards(db: Session = Depends(get_db), current_user: UserORM = Depends(enterprise_required)):
-    used_giftcards = db.query(SoldGiftCardORM)\
-        .join(RegisterGiftCardORM)\
-        .options(joinedload(SoldGiftCardORM.owner), joinedload(SoldGiftCardORM.original_giftcard))\
-        .filter(RegisterGiftCardORM.user_id == current_user.id)\
-        .filter(SoldGiftCardORM.status == SoldStatus.USED)\
-        .order_by(desc(SoldGiftCardORM.purchase_date))\
-        .all()
+async def get_my_used_giftcards(
+    response: Response,
+    page: OptionalPageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserORM = Depends(enterprise_required),
+):
+    used_giftcards, next_cursor = await paginate_async(
+        db,
+        select(SoldGiftCardORM)
+        .join(RegisterGiftCardORM)
+        .options(joinedload(SoldGiftCardORM.owner), joinedload(SoldGiftCardORM.original_giftcard))
+        .filter(RegisterGiftCardORM.user_id == current_user.id)
+        .filter(SoldGiftCardORM.status == SoldStatus.USED),
+        page, (SoldGiftCardORM.purchase_date, SoldGiftCardORM.id),
+    )
+    set_next_cursor(response, next_cursor)
 
     return [
         SoldGiftCardDetails(
@@ -1,21 +1,32 @@
-import mercadopago
+import asyncio
 import os
 import uuid
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, BackgroundTasks
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime, timedelta, timezone
 
-from app.database.db_config import get_db
+from app.database.db_config import get_db, get_async_db, AsyncSessionLocal
 from app.models.giftcard_orm import RegisterGiftCardORM
 from app.models.user_orm import UserORM
 from app.security import get_current_user
 from app.services.email_service import send_email_with_template
-from app.models.order_orm import OrderORM, OrderItemORM, OrderStatus, OrderGiftItemORM
+from app.models.order_orm import OrderORM, OrderItemORM, OrderStatus, OrderGiftItemORM, WebhookEventORM
 from app.services.order_cleanup_service import process_successful_order
+from app.services.inventory_service import reserve_codes, release_reserved_codes
+from app.services.stock_service import reserve_stock, release_reservations
+from app.services.enterprise_stats_service import record_checkout, record_closed
+from app.services.cache_service import invalidate_giftcards, BEST_SELLERS_TAG
+from app.services.payment_gateway import payment_gateway, PaymentGatewayError
+from app.services.webhook_inbox_service import enqueue_webhook, webhook_inbox
+from app.services.payment_events_service import (
+    payment_closed, seen_in_cache, already_processed, record_processed, remember_processed
+)
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -24,11 +35,6 @@ router = APIRouter(
     tags=["MercadoPago"],
 )
 
-access_token = os.getenv("MERCADOPAGO_ACCESS_TOKEN")
-if not access_token:
-    logging.error("Variável de ambiente MERCADOPAGO_ACCESS_TOKEN não foi definida!")
-    raise RuntimeError("MERCADOPAGO_ACCESS_TOKEN não configurada.")
-sdk = mercadopago.SDK(access_token)
 
 # --- SCHEMAS ATUALIZADOS PARA PRESENTES ---
 class GiftRecipient(BaseModel):
@@ -106,49 +112,49 @@ def send_payment_rejected_email(background_tasks: BackgroundTasks, order: OrderO
     )
 
 # --- ROTA DE CRIAÇÃO DE PREFERÊNCIA (CHECKOUT) ---
-@router.post("/create_preference_cart", status_code=status.HTTP_201_CREATED)
-async def create_preference_cart(
-    cart: CartCheckout,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: UserORM = Depends(get_current_user)
-):
-    if not cart.items:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="O carrinho não pode estar vazio.")
-
+def place_pending_order(db: Session, cart: CartCheckout, current_user: UserORM, giftcards_stock_to_update: dict):
+    """
+    Fase no banco do checkout: grava o pedido PENDING com itens, presentes, reservas de estoque e de
+    códigos, e confirma. Síncrona (sessão síncrona): a rota a executa em uma thread para não travar o event loop.
+    Devolve o pedido, o id dele e os itens da preferência e do e-mail.
+    """
     items_subtotal = Decimal("0.0")
-    order_items_to_create = [] 
     items_for_email = []
     preference_items = []
 
     try:
-        for item in cart.items:
-            # --- VALIDAÇÃO DE PRESENTES ---
-            total_gifts_qty = sum(g.quantity for g in item.gifts)
-            if total_gifts_qty > item.quantity:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST, 
-                    detail=f"A quantidade de presentes ({total_gifts_qty}) excede a quantidade total do item ({item.quantity})."
-                )
-            # ------------------------------
-
-            db_giftcard = db.query(RegisterGiftCardORM).options(
-                joinedload(RegisterGiftCardORM.user).joinedload(UserORM.enterprise_details)
-            ).filter(RegisterGiftCardORM.id == item.product_id).with_for_update().first()
-
+        # Sem trava aqui: os produtos só são travados em reserve_stock, no fim da transação
+        giftcards = db.query(RegisterGiftCardORM).options(
+            selectinload(RegisterGiftCardORM.user).selectinload(UserORM.enterprise_details)
+        ).filter(
+            RegisterGiftCardORM.id.in_(list(giftcards_stock_to_update))
+        ).all()
+        giftcards_by_id = {giftcard.id: giftcard for giftcard in giftcards}
+
+        for product_id, quantity in giftcards_stock_to_update.items():
+            db_giftcard = giftcards_by_id.get(product_id)
             if not db_giftcard:
-                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Gift Card com ID {item.product_id} não encontrado.")
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Gift Card com ID {product_id} não encontrado.")
 
             if not db_giftcard.user or not db_giftcard.user.enterprise_details:
                 logging.error(f"Giftcard {db_giftcard.id} não possui uma empresa associada.")
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Este item não pode ser vendido.")
 
             if not db_giftcard.ativo:
-                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Gift Card com ID {item.product_id} não está disponível.")
-            
-            if db_giftcard.quantityavailable < item.quantity:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Estoque insuficiente para '{db_giftcard.title}'.")
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Gift Card com ID {product_id} não está disponível.")
+
+        new_order = OrderORM(
+            id=uuid.uuid4(),
+            owner_id=current_user.id,
+            status=OrderStatus.PENDING
+        )
+        new_order.owner = current_user
 
+        # Ids gerados aqui: itens e presentes vão para o banco em lote, sem flush por item
+        created_order_items = []
+        gift_rows = []
+        for item in cart.items:
+            db_giftcard = giftcards_by_id[item.product_id]
             item_selling_price = db_giftcard.valor 
             item_total = item_selling_price * item.quantity
             items_subtotal += item_total
@@ -166,19 +172,25 @@ async def create_preference_cart(
                 "subtotal": float(item_total)
             })
 
-            item_enterprise_id = db_giftcard.user.enterprise_details.id
-            item_desired_amount = db_giftcard.desired_amount
-            
-            # Prepara dados do item para criação posterior (Agrupado)
-            order_items_to_create.append({
-                "giftcard_id": db_giftcard.id,
-                "enterprise_id": item_enterprise_id,
-                "quantity": item.quantity, # Quantidade total
-                "unit_price": item_selling_price,
-                "seller_amount": item_desired_amount,
-                "giftcard_instance": db_giftcard,
-                "gifts": item.gifts # Lista de presentes para salvar
-            })
+            new_order_item = OrderItemORM(
+                id=uuid.uuid4(),
+                order_id=new_order.id,
+                register_giftcard_id=db_giftcard.id,
+                enterprise_id=db_giftcard.user.enterprise_details.id,
+                quantity=item.quantity, # Quantidade total
+                unit_price=item_selling_price,
+                seller_amount=db_giftcard.desired_amount
+            )
+            created_order_items.append(new_order_item)
+
+            # Presentes vinculados a este item
+            gift_rows.extend({
+                "order_item_id": new_order_item.id,
+                "recipient_name": gift.name,
+                "recipient_email": gift.email,
+                "quantity": gift.quantity,
+                "message": gift.message
+            } for gift in item.gifts)
 
         service_fee = items_subtotal * Decimal("0.05")
         
@@ -189,90 +201,34 @@ async def create_preference_cart(
             "currency_id": "BRL"
         })
         
-        final_total_amount = items_subtotal + service_fee
+        new_order.total_amount = items_subtotal + service_fee
 
-        new_order = OrderORM(
-            owner_id=current_user.id,
-            total_amount=final_total_amount,
-            status=OrderStatus.PENDING
-        )
         db.add(new_order)
-        db.flush() # Gera ID do pedido
-        new_order.owner = current_user
-
-        giftcards_stock_to_update = {} 
-
-        if order_items_to_create:
-            for item_data in order_items_to_create:
-                # 1. Cria o Item do Pedido
-                new_order_item = OrderItemORM(
-                    order_id=new_order.id,
-                    register_giftcard_id=item_data["giftcard_id"],
-                    enterprise_id=item_data["enterprise_id"],
-                    quantity=item_data["quantity"],
-                    unit_price=item_data["unit_price"],
-                    seller_amount=item_data["seller_amount"]
-                )
-                db.add(new_order_item)
-                db.flush() # Gera ID do item para relacionar os presentes
-
-                # 2. Salva os Presentes vinculados a este item
-                for gift in item_data["gifts"]:
-                    new_gift_entry = OrderGiftItemORM(
-                        order_item_id=new_order_item.id,
-                        recipient_name=gift.name,
-                        recipient_email=gift.email,
-                        quantity=gift.quantity,
-                        message=gift.message
-                    )
-                    db.add(new_gift_entry)
-
-                # Contabiliza estoque para baixa
-                gc_id = item_data["giftcard_id"]
-                giftcards_stock_to_update[gc_id] = giftcards_stock_to_update.get(gc_id, 0) + item_data["quantity"]
-
-            # Atualiza estoque no banco
-            for gc_id, qty_reduce in giftcards_stock_to_update.items():
-                 giftcard_instance = next((item["giftcard_instance"] for item in order_items_to_create if item["giftcard_id"] == gc_id), None)
-                 if giftcard_instance:
-                     current_quantity = db.query(RegisterGiftCardORM.quantityavailable).filter(RegisterGiftCardORM.id == gc_id).scalar()
-                     if current_quantity is not None and current_quantity >= qty_reduce:
-                         giftcard_instance.quantityavailable = current_quantity - qty_reduce
-                     else:
-                         db.rollback()
-                         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Erro de concorrência no estoque para '{giftcard_instance.title}'. Tente novamente.")
-                 else:
-                     db.query(RegisterGiftCardORM).filter(RegisterGiftCardORM.id == gc_id).update({"quantityavailable": RegisterGiftCardORM.quantityavailable - qty_reduce}, synchronize_session=False)
-
-        send_payment_pending_email(background_tasks, new_order, items_for_email)
-
-        base_url = os.getenv("FRONTEND_URL", "http://localhost:4200")
-        expiration_time = datetime.now(timezone.utc) + timedelta(minutes=5)
-        expiration_time_iso = expiration_time.isoformat("T", "milliseconds").replace('+00:00', 'Z')
-
-        preference_data = {
-            "items": preference_items,
-            "back_urls": {"success": f"{base_url}/profile?status=approved", "failure": f"{base_url}/cart", "pending": f"{base_url}/profile"},
-            "auto_return": "approved",
-            "external_reference": str(new_order.id),
-            "notification_url": f"{os.getenv('BACKEND_PUBLIC_URL')}/api/mercadopago/webhook",
-            "expires": True,
-            "date_of_expiration": expiration_time_iso,
-            "payment_methods": {
-                "excluded_payment_types": [
-                    { "id": "ticket" } 
-                ]
-            }
-        }
-
-        preference_response = sdk.preference().create(preference_data)
-        if not (preference_response and preference_response.get("status") in [200, 201]):
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Erro ao criar preferência de pagamento.")
-
-        new_order.mercadopago_transaction_id = preference_response["response"].get("id")
+        db.add_all(created_order_items)
+        db.flush()
+        if gift_rows:
+            db.execute(insert(OrderGiftItemORM), gift_rows)
+
+        # Códigos pré-definidos: reserva as linhas do estoque de códigos para cada item
+        for new_order_item in created_order_items:
+            giftcard_instance = giftcards_by_id[new_order_item.register_giftcard_id]
+            if not giftcard_instance.generaterandomly:
+                reserved = reserve_codes(db, giftcard_instance.id, new_order_item.id, new_order_item.quantity)
+                if reserved < new_order_item.quantity:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Estoque de códigos insuficiente para '{giftcard_instance.title}'.")
+
+        record_checkout(db, new_order, created_order_items)
+
+        # Reserva de estoque por último: a trava dos produtos (em ordem de id, sem deadlock entre
+        # carrinhos) vai da conferência do disponível até o commit logo abaixo, e nada mais
+        missing_id = reserve_stock(db, new_order.id, giftcards_stock_to_update)
+        if missing_id is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Estoque insuficiente para '{giftcards_by_id[missing_id].title}'.")
+
+        # A chamada ao Mercado Pago acontece fora da transação
+        order_id = new_order.id
         db.commit()
-
-        return {"preference_id": preference_response["response"]["id"], "init_point": preference_response["response"]["init_point"]}
+        return new_order, order_id, preference_items, items_for_email
 
     except HTTPException as http_exc:
         db.rollback()
@@ -283,74 +239,186 @@ async def create_preference_cart(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Erro interno ao processar o pedido.")
 
 
+@router.post("/create_preference_cart", status_code=status.HTTP_201_CREATED)
+async def create_preference_cart(
+    cart: CartCheckout,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: UserORM = Depends(get_current_user)
+):
+    if not cart.items:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="O carrinho não pode estar vazio.")
+
+    # --- VALIDAÇÃO DE PRESENTES (antes de tocar no banco) ---
+    for item in cart.items:
+        total_gifts_qty = sum(g.quantity for g in item.gifts)
+        if total_gifts_qty > item.quantity:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, 
+                detail=f"A quantidade de presentes ({total_gifts_qty}) excede a quantidade total do item ({item.quantity})."
+            )
+
+    # Quantidade total por produto (o mesmo produto pode aparecer em mais de uma linha do carrinho)
+    giftcards_stock_to_update = {}
+    for item in cart.items:
+        giftcards_stock_to_update[item.product_id] = giftcards_stock_to_update.get(item.product_id, 0) + item.quantity
+
+    new_order, order_id, preference_items, items_for_email = await asyncio.to_thread(
+        place_pending_order, db, cart, current_user, giftcards_stock_to_update
+    )
+
+    base_url = os.getenv("FRONTEND_URL", "http://localhost:4200")
+    expiration_time = datetime.now(timezone.utc) + timedelta(minutes=5)
+    expiration_time_iso = expiration_time.isoformat("T", "milliseconds").replace('+00:00', 'Z')
+
+    preference_data = {
+        "items": preference_items,
+        "back_urls": {"success": f"{base_url}/profile?status=approved", "failure": f"{base_url}/cart", "pending": f"{base_url}/profile"},
+        "auto_return": "approved",
+        "external_reference": str(order_id),
+        "notification_url": f"{os.getenv('BACKEND_PUBLIC_URL')}/api/mercadopago/webhook",
+        "expires": True,
+        "date_of_expiration": expiration_time_iso,
+        "payment_methods": {
+            "excluded_payment_types": [
+                { "id": "ticket" } 
+            ]
+        }
+    }
+
+    try:
+        # O id do pedido como chave de idempotência: uma nova tentativa não cria outra preferência
+        preference = await payment_gateway.create_preference(preference_data, idempotency_key=str(order_id))
+    except PaymentGatewayError as e:
+        logging.error(f"Erro ao criar preferência do pedido {order_id} no Mercado Pago: {e}")
+        # Compensação: o pedido já foi gravado, então libera a reserva e os códigos e o encerra
+        await asyncio.to_thread(cancel_unpaid_checkout, db, order_id)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Erro ao criar preferência de pagamento.")
+
+    await asyncio.to_thread(save_preference_id, db, new_order, preference.get("id"), background_tasks, items_for_email)
+
+    return {"preference_id": preference["id"], "init_point": preference["init_point"]}
+
+
+def save_preference_id(db: Session, order: OrderORM, preference_id, background_tasks: BackgroundTasks, items_for_email: List[dict]) -> None:
+    order.mercadopago_transaction_id = preference_id
+    db.commit()
+    # O e-mail lê o pedido expirado pelo commit: recarrega aqui, ainda na thread
+    send_payment_pending_email(background_tasks, order, items_for_email)
+
+
+def cancel_unpaid_checkout(db: Session, order_id) -> None:
+    """
+    Desfaz um checkout já confirmado cuja preferência não pôde ser criada. Se até isso falhar,
+    o pedido continua PENDING e a reserva expira sozinha.
+    """
+    try:
+        order = db.query(OrderORM).options(selectinload(OrderORM.items)).filter(
+            OrderORM.id == order_id, OrderORM.status == OrderStatus.PENDING
+        ).with_for_update().first()
+        if not order:
+            return
+        order.status = OrderStatus.REJECTED
+        release_reservations(db, order.id)
+        release_reserved_codes(db, [item.id for item in order.items])
+        record_closed(db, order)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Erro ao desfazer o checkout do pedido {order_id}: {e}", exc_info=True)
+
+
 # --- WEBHOOK ---
 @router.post("/webhook")
-async def mercadopago_webhook(request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    body = await request.json()
-    if body.get("type") != "payment":
+async def mercadopago_webhook(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Só valida e grava a notificação na caixa de entrada; o processamento fica com os workers (webhook_inbox)."""
+    try:
+        body = await request.json()
+    except ValueError:
+        return Response(status_code=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(body, dict) or body.get("type") != "payment":
         return Response(status_code=status.HTTP_200_OK)
 
-    payment_id = body.get("data", {}).get("id")
+    payment_id = (body.get("data") or {}).get("id")
     if not payment_id:
         return Response(status_code=status.HTTP_400_BAD_REQUEST)
 
     try:
-        payment_info_response = sdk.payment().get(payment_id)
-        if not payment_info_response or payment_info_response.get("status") not in [200, 201]:
-            logging.error(f"Não foi possível obter informações do Payment ID {payment_id}.")
-            return Response(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        payment_info = payment_info_response["response"]
-        order_id_str = payment_info.get("external_reference")
-        payment_status = payment_info.get("status")
-
-        # Carrega pedido com todas as relações necessárias, incluindo os presentes
-        order = db.query(OrderORM).options(
-            joinedload(OrderORM.items).joinedload(OrderItemORM.original_giftcard),
-            joinedload(OrderORM.items).joinedload(OrderItemORM.gift_items), # Carrega os presentes
-            joinedload(OrderORM.owner)
-        ).filter(OrderORM.id == order_id_str).first()
-
-        if not order or order.status != OrderStatus.PENDING:
-            logging.warning(f"Pedido {order_id_str} não encontrado ou já processado.")
+        # Pagamento já aplicado com status final: entrega repetida, nem entra na fila
+        if await payment_closed(db, str(payment_id)):
+            webhook_inbox.stats.record("duplicates")
             return Response(status_code=status.HTTP_200_OK)
-
-        order.mercadopago_transaction_id = str(payment_info.get("id"))
-
-        if payment_status == "approved":
-            # --- CHAMA A LÓGICA CENTRALIZADA DE PROCESSAMENTO E DISTRIBUIÇÃO ---
-            await process_successful_order(db, order, payment_info, background_tasks)
-            
-            # Envia confirmação para o comprador (com o que sobrou para ele)
-            send_purchase_confirmation_email(background_tasks, order)
-
-        elif payment_status in ["rejected", "cancelled", "refunded", "charged_back"]:
-            original_status = order.status
-            order.status = OrderStatus.REJECTED if payment_status not in ["refunded", "charged_back"] else OrderStatus.REFUNDED
-            order.net_amount = None
-
-            if original_status == OrderStatus.PENDING:
-                # Devolve estoque
-                giftcards_stock_to_return = {}
-                for item in order.items:
-                    gc_id = item.register_giftcard_id
-                    giftcards_stock_to_return[gc_id] = giftcards_stock_to_return.get(gc_id, 0) + item.quantity
-
-                for gc_id, qty_return in giftcards_stock_to_return.items():
-                    db.query(RegisterGiftCardORM).filter(RegisterGiftCardORM.id == gc_id).update(
-                        {"quantityavailable": RegisterGiftCardORM.quantityavailable + qty_return},
-                        synchronize_session='fetch'
-                    )
-
-            rejection_reason = payment_info.get("status_detail", "Motivo não especificado.")
-            if order.status == OrderStatus.REJECTED:
-                 send_payment_rejected_email(background_tasks, order, rejection_reason)
-
-        db.commit()
-
+        await enqueue_webhook(db, str(payment_id), body)
     except Exception as e:
-        db.rollback()
-        logging.critical(f"Erro CRÍTICO no webhook para payment_id {payment_id}: {e}", exc_info=True)
+        await db.rollback()
+        logging.critical(f"Erro ao gravar o webhook do payment_id {payment_id}: {e}", exc_info=True)
         return Response(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    return Response(status_code=status.HTTP_200_OK)
\ No newline at end of file
+    return Response(status_code=status.HTTP_200_OK)
+
+
+async def process_payment_event(event: WebhookEventORM, background_tasks: BackgroundTasks) -> None:
+    """
+    Handler dos workers de webhook_inbox: consulta o pagamento e aplica o status ao pedido.
+    Cada (payment_id, status) é aplicado uma vez só (processed_payment_events).
+    Qualquer exceção (gateway fora, erro de banco) volta o evento para a fila com nova tentativa.
+    """
+    payment_info = await payment_gateway.get_payment(event.payment_id)
+    order_id_str = payment_info.get("external_reference")
+    payment_status = payment_info.get("status")
+    if await seen_in_cache(event.payment_id, payment_status):
+        return
+
+    async with webhook_inbox.order_locks.hold(str(order_id_str)):
+        async with AsyncSessionLocal() as db:
+            # Trava a linha do pedido: workers de outros processos esperam aqui
+            await db.execute(select(OrderORM.id).filter(OrderORM.id == order_id_str).with_for_update())
+            # Conferido sob a trava: outro worker pode ter aplicado o mesmo status enquanto esperávamos
+            if await already_processed(db, event.payment_id, payment_status):
+                return
+
+            # Carrega pedido com todas as relações necessárias, incluindo os presentes
+            order = (await db.execute(select(OrderORM).options(
+                selectinload(OrderORM.items).joinedload(OrderItemORM.original_giftcard),
+                selectinload(OrderORM.items).selectinload(OrderItemORM.gift_items), # Carrega os presentes
+                joinedload(OrderORM.owner)
+            ).filter(OrderORM.id == order_id_str))).scalars().first()
+
+            if not order or order.status != OrderStatus.PENDING:
+                logging.warning(f"Pedido {order_id_str} não encontrado ou já processado.")
+                record_processed(db, event.payment_id, payment_status, order.id if order else None)
+                await db.commit()
+                await remember_processed(event.payment_id, payment_status)
+                return
+
+            order.mercadopago_transaction_id = str(payment_info.get("id"))
+
+            if payment_status == "approved":
+                # --- CHAMA A LÓGICA CENTRALIZADA DE PROCESSAMENTO E DISTRIBUIÇÃO ---
+                await db.run_sync(process_successful_order, order, payment_info, background_tasks)
+
+                # Envia confirmação para o comprador (com o que sobrou para ele)
+                send_purchase_confirmation_email(background_tasks, order)
+
+            elif payment_status in ["rejected", "cancelled", "refunded", "charged_back"]:
+                order.status = OrderStatus.REJECTED if payment_status not in ["refunded", "charged_back"] else OrderStatus.REFUNDED
+                order.net_amount = None
+
+                # Libera a reserva (o estoque do produto não chegou a ser baixado)
+                await db.run_sync(release_reservations, order.id)
+
+                # Devolve os códigos pré-definidos reservados
+                await db.run_sync(release_reserved_codes, [item.id for item in order.items])
+                await db.run_sync(record_closed, order)
+
+                rejection_reason = payment_info.get("status_detail", "Motivo não especificado.")
+                if order.status == OrderStatus.REJECTED:
+                    send_payment_rejected_email(background_tasks, order, rejection_reason)
+
+            record_processed(db, event.payment_id, payment_status, order.id)
+            await db.commit()
+        await remember_processed(event.payment_id, payment_status)
+
+    # Só a aprovação muda o estoque dos produtos e o ranking de vendas
+    if order.status == OrderStatus.APPROVED:
+        await invalidate_giftcards([item.register_giftcard_id for item in order.items], BEST_SELLERS_TAG)
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.auth_bearer import get_current_admin
+from app.database.db_config import engine, async_engine, get_async_db, sync_pool_metrics, async_pool_metrics
+from app.database.read_replicas import replica_pool_metrics
+from app.models.giftcard_orm import RegisterGiftCardORM
+from app.models.order_orm import OrderItemORM, OrderItemStatus
+from app.services.cache_service import catalog_cache, CACHE_BACKEND
+from app.services.webhook_inbox_service import webhook_inbox
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"]
+)
+
+# --- Rota de Admin: uso dos pools de conexão do banco ---
+@router.get("/db-pool")
+async def get_db_pool_metrics(admin_user: dict = Depends(get_current_admin)):
+    pools = {
+        "sync": sync_pool_metrics.snapshot(engine),
+        "async": async_pool_metrics.snapshot(async_engine.sync_engine),
+    }
+    for name, (metrics, replica_engine) in replica_pool_metrics.items():
+        pools[name] = metrics.snapshot(replica_engine)
+    return pools
+
+# --- Rota de Admin: acertos/erros do cache do catálogo ---
+@router.get("/cache")
+async def get_cache_metrics(admin_user: dict = Depends(get_current_admin)):
+    return {
+        "backend": CACHE_BACKEND,
+        "entries": await catalog_cache.size(),
+        **catalog_cache.stats.snapshot(),
+    }
+
+# --- Rota de Admin: fila de webhooks (profundidade, atraso e eventos desistidos) ---
+@router.get("/webhooks")
+async def get_webhook_metrics(admin_user: dict = Depends(get_current_admin)):
+    return await webhook_inbox.metrics()
+
+# --- Rota de Admin: itens pagos que ficaram sem estoque (sem códigos, aguardando reembolso/reposição) ---
+@router.get("/stock")
+async def get_stock_metrics(db: AsyncSession = Depends(get_async_db), admin_user: dict = Depends(get_current_admin)):
+    out_of_stock = OrderItemORM.status == OrderItemStatus.OUT_OF_STOCK
+    total = await db.scalar(select(func.count()).select_from(OrderItemORM).where(out_of_stock))
+    items = (await db.execute(
+        select(
+            OrderItemORM.id, OrderItemORM.order_id, OrderItemORM.register_giftcard_id,
+            RegisterGiftCardORM.title, OrderItemORM.quantity, OrderItemORM.updated_at
+        )
+        .join(RegisterGiftCardORM, OrderItemORM.register_giftcard_id == RegisterGiftCardORM.id)
+        .where(out_of_stock)
+        .order_by(OrderItemORM.updated_at.desc())
+        .limit(100)
+    )).all()
+    return {
+        "out_of_stock_items": total,
+        "items": [
+            {
+                "order_item_id": item_id, "order_id": order_id, "giftcard_id": giftcard_id,
+                "title": title, "quantity": quantity, "updated_at": updated_at,
+            }
+            for item_id, order_id, giftcard_id, title, quantity, updated_at in items
+        ],
+    }
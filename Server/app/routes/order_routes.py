@@ -1,41 +1,57 @@
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import extract
-from sqlalchemy.orm import Session, joinedload
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from typing import List, Literal, Optional
 
 from app.auth.auth_bearer import get_current_admin
-from app.database.db_config import get_db
+from app.database.db_config import get_async_db
+from app.database.date_ranges import DateRangeParams
+from app.database.pagination import OptionalPageParams, paginate_async, set_next_cursor
+from app.database.read_replicas import get_async_read_db
 from app.models.giftcard_orm import GiftCardReviewORM
 from app.security import get_current_user
 from app.models.user_orm import UserORM
 from app.models.order_orm import OrderORM, OrderItemORM 
 from app.models.order_models import OrderSchema
+from app.services.report_service import (
+    ADMIN_ORDERS_COLUMNS, EXPORT_MEDIA_TYPES, admin_orders_export_query, filter_admin_orders, stream_rows,
+)
 
 router = APIRouter(
     prefix="/orders",
     tags=["Orders"]
 )
 
+# Ordem das listagens de pedidos (o id desempata pedidos criados no mesmo instante)
+NEWEST_ORDERS_FIRST = (OrderORM.created_at, OrderORM.id)
+
 @router.get("/me", response_model=List[OrderSchema])
 async def get_my_orders(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: OptionalPageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
     current_user: UserORM = Depends(get_current_user)
 ):
-    # 1. Busca os pedidos
-    orders = db.query(OrderORM).options(
-        joinedload(OrderORM.items).joinedload(OrderItemORM.original_giftcard),
-        joinedload(OrderORM.items).joinedload(OrderItemORM.enterprise),
+    # 1. Busca os pedidos (uma página, do mais recente para o mais antigo)
+    orders, next_cursor = await paginate_async(db, select(OrderORM).options(
+        selectinload(OrderORM.items).joinedload(OrderItemORM.original_giftcard),
+        selectinload(OrderORM.items).joinedload(OrderItemORM.enterprise),
         # --- ATUALIZAÇÃO: Carrega os presentes ---
-        joinedload(OrderORM.items).joinedload(OrderItemORM.gift_items) 
+        selectinload(OrderORM.items).selectinload(OrderItemORM.gift_items),
+        joinedload(OrderORM.owner)
     ).filter(
         OrderORM.owner_id == current_user.id
-    ).order_by(
-        OrderORM.created_at.desc()
-    ).all()
+    ), page, NEWEST_ORDERS_FIRST)
+    set_next_cursor(response, next_cursor)
 
-    user_reviews = db.query(GiftCardReviewORM).filter(
-        GiftCardReviewORM.user_id == current_user.id
-    ).all()
+    # Só as avaliações dos produtos que aparecem nesta página
+    giftcard_ids = {item.register_giftcard_id for order in orders for item in order.items}
+    user_reviews = (await db.execute(select(GiftCardReviewORM).filter(
+        GiftCardReviewORM.user_id == current_user.id,
+        GiftCardReviewORM.giftcard_id.in_(giftcard_ids)
+    ))).scalars().all() if giftcard_ids else []
     
     reviews_map = {review.giftcard_id: review.rating for review in user_reviews}
 
@@ -46,31 +62,43 @@ async def get_my_orders(
 
     return orders
 
+def admin_orders_query(status: Optional[str] = None, period: Optional[DateRangeParams] = None, buyer_name: Optional[str] = None):
+    query = select(OrderORM).options(
+        selectinload(OrderORM.items).joinedload(OrderItemORM.original_giftcard),
+        selectinload(OrderORM.items).joinedload(OrderItemORM.enterprise),
+        selectinload(OrderORM.items).selectinload(OrderItemORM.gift_items), # Carrega aqui também
+        joinedload(OrderORM.owner)
+    )
+    return filter_admin_orders(query, status, period, buyer_name)
+
 @router.get("/admin/all", response_model=List[OrderSchema])
 async def get_all_orders_admin(
+    response: Response,
     status: Optional[str] = Query(None),
-    month: Optional[int] = Query(None, ge=1, le=12),
-    year: Optional[int] = Query(None),
+    period: DateRangeParams = Depends(),
     buyer_name: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    page: OptionalPageParams = Depends(),
+    db: AsyncSession = Depends(get_async_read_db),
     admin_user: dict = Depends(get_current_admin) 
 ):
-    query = db.query(OrderORM).options(
-        joinedload(OrderORM.items).joinedload(OrderItemORM.original_giftcard),
-        joinedload(OrderORM.items).joinedload(OrderItemORM.enterprise),
-        joinedload(OrderORM.items).joinedload(OrderItemORM.gift_items), # Carrega aqui também
-        joinedload(OrderORM.owner)
-    )
-    
-    if status:
-        query = query.filter(OrderORM.status == status)
-    if year:
-        query = query.filter(extract('year', OrderORM.created_at) == year)
-    if month:
-        query = query.filter(extract('month', OrderORM.created_at) == month)
-    if buyer_name:
-        query = query.join(UserORM).filter(UserORM.username.ilike(f"%{buyer_name}%"))
-
-    orders = query.order_by(OrderORM.created_at.desc()).all()
+    query = admin_orders_query(status, period, buyer_name)
+    orders, next_cursor = await paginate_async(db, query, page, NEWEST_ORDERS_FIRST)
+    set_next_cursor(response, next_cursor)
+    return orders
 
-    return orders
\ No newline at end of file
+@router.get("/admin/export")
+async def export_orders_admin(
+    status: Optional[str] = Query(None),
+    period: DateRangeParams = Depends(),
+    buyer_name: Optional[str] = Query(None),
+    format: Literal["csv", "ndjson"] = Query("csv"),
+    admin_user: dict = Depends(get_current_admin)
+):
+    """Todos os pedidos, uma linha por item, em streaming (mesmos filtros de /orders/admin/all)."""
+    query = admin_orders_export_query(status, period, buyer_name)
+    header = [name for name, _ in ADMIN_ORDERS_COLUMNS]
+    return StreamingResponse(
+        stream_rows(query, header, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="pedidos.{format}"'},
+    )
@@ -1,178 +1,199 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks # <--- Importado BackgroundTasks
-from sqlalchemy.orm import Session, joinedload
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response, status, BackgroundTasks # <--- Importado BackgroundTasks
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from typing import List, Optional
 import os
+import uuid
 
-from app.database.db_config import get_db
-from app.models.order_orm import OrderItemORM, OrderItemStatus, OrderORM, OrderGiftItemORM
+from app.database.db_config import get_async_db, now_brt
+from app.database.pagination import OptionalPageParams, paginate_async, set_next_cursor
+from app.models.order_orm import OrderItemORM, OrderItemStatus, OrderORM, IssuedCodeORM, IssuedCodeStatus
 from app.models.user_orm import UserORM
 from app.models.giftcard_orm import RegisterGiftCardORM
 from app.security import enterprise_required
 from app.services.email_service import send_email_with_template # <--- Importado serviço de email
+from app.services.code_service import split_codes, join_codes
 
 router = APIRouter(
     prefix="/validation",
     tags=["Validation"]
 )
 
+async def find_enterprise_code(
+    db: AsyncSession, code: str, enterprise_id: int, giftcard_id: Optional[uuid.UUID] = None, query=None
+) -> Optional[IssuedCodeORM]:
+    """
+    Procura o código nos produtos da empresa logada. Códigos pré-definidos só são únicos por produto:
+    se o mesmo código ainda vale em mais de um produto da empresa, giftcard_id desempata.
+    Sem código válido, devolve o já utilizado (se houver) para a rota explicar o motivo.
+    """
+    own_giftcards = select(RegisterGiftCardORM.id).filter(RegisterGiftCardORM.user_id == enterprise_id)
+    query = (query if query is not None else select(IssuedCodeORM)).filter(
+        IssuedCodeORM.code == code,
+        IssuedCodeORM.register_giftcard_id.in_(own_giftcards)
+    )
+    if giftcard_id is not None:
+        query = query.filter(IssuedCodeORM.register_giftcard_id == giftcard_id)
+    matches = (await db.execute(query)).scalars().unique().all()
+
+    valid = [issued for issued in matches if issued.status == IssuedCodeStatus.VALID]
+    if len(valid) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Este código existe em mais de um Gift Card da sua empresa. Informe o giftcard_id."
+        )
+    return valid[0] if valid else (matches[0] if matches else None)
+
 # Rota para buscar um código e ver seus detalhes (Comprador ou Presente)
 @router.get("/{code}")
-async def get_item_by_code(code: str, db: Session = Depends(get_db), current_user: UserORM = Depends(enterprise_required)):
-    # 1. Tenta achar na lista do comprador (final_giftcard_codes)
-    order_item = db.query(OrderItemORM).options(
-        joinedload(OrderItemORM.order).joinedload(OrderORM.owner),
-        joinedload(OrderItemORM.original_giftcard)
-    ).filter(
-        OrderItemORM.final_giftcard_codes.contains(code)
-    ).first()
-
-    # 2. Se não achou, tenta achar na lista de presentes (OrderGiftItemORM)
-    if not order_item:
-        gift_item = db.query(OrderGiftItemORM).options(
-            joinedload(OrderGiftItemORM.order_item).joinedload(OrderItemORM.original_giftcard),
-            joinedload(OrderGiftItemORM.order_item).joinedload(OrderItemORM.order).joinedload(OrderORM.owner)
-        ).filter(
-            OrderGiftItemORM.codes.contains(code)
-        ).first()
-        
-        if gift_item:
-            order_item = gift_item.order_item
-
-    # Se não achou em lugar nenhum
-    if not order_item:
+async def get_item_by_code(
+    code: str,
+    giftcard_id: Optional[uuid.UUID] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserORM = Depends(enterprise_required)
+):
+    code = code.strip()
+    # Busca pontual pelo índice de issued_codes, só nos produtos da empresa (comprador ou presente)
+    issued_code = await find_enterprise_code(db, code, current_user.id, giftcard_id, select(IssuedCodeORM).options(
+        joinedload(IssuedCodeORM.order_item).joinedload(OrderItemORM.order).joinedload(OrderORM.owner),
+        joinedload(IssuedCodeORM.order_item).joinedload(OrderItemORM.original_giftcard)
+    ))
+
+    if issued_code is None:
+        # Verifica se o código é de outra empresa
+        elsewhere = await db.scalar(
+            select(IssuedCodeORM.id).filter(
+                IssuedCodeORM.code == code, IssuedCodeORM.status == IssuedCodeStatus.VALID
+            ).limit(1)
+        )
+        if elsewhere is not None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Este Gift Card não pertence à sua empresa.")
+
+    # Se não achou ou já foi utilizado
+    if not issued_code or issued_code.status != IssuedCodeStatus.VALID:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Código não encontrado ou já utilizado.")
 
-    # Verifica se pertence à empresa logada
-    if order_item.original_giftcard.user_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Este Gift Card não pertence à sua empresa.")
-
-    return order_item
+    return issued_code.order_item
 
 # Rota para marcar um código como utilizado
 @router.put("/{code}/use")
 async def mark_code_as_used(
     code: str, 
     background_tasks: BackgroundTasks, # <--- Injeção para envio assíncrono
-    db: Session = Depends(get_db), 
+    giftcard_id: Optional[uuid.UUID] = None,
+    db: AsyncSession = Depends(get_async_db), 
     current_user: UserORM = Depends(enterprise_required)
 ):
-    # --- BUSCA O CÓDIGO (Lógica Dupla) ---
-    is_gift = False
-    gift_item_found = None
-
-    # 1. Busca no Comprador (Carregando owner para e-mail)
-    order_item = db.query(OrderItemORM).options(
-        joinedload(OrderItemORM.original_giftcard),
-        joinedload(OrderItemORM.gift_items),
-        joinedload(OrderItemORM.order).joinedload(OrderORM.owner) # Necessário para e-mail do comprador
-    ).filter(
-        OrderItemORM.final_giftcard_codes.contains(code)
-    ).first()
-
-    # 2. Busca no Presente
-    if not order_item:
-        gift_item_found = db.query(OrderGiftItemORM).options(
-            joinedload(OrderGiftItemORM.order_item).joinedload(OrderItemORM.original_giftcard),
-            joinedload(OrderGiftItemORM.order_item).joinedload(OrderItemORM.gift_items)
-        ).filter(
-            OrderGiftItemORM.codes.contains(code)
-        ).first()
-
-        if gift_item_found:
-            order_item = gift_item_found.order_item
-            is_gift = True
+    code = code.strip()
+
+    # --- BUSCA O CÓDIGO (consulta pontual nos produtos da empresa, com lock da linha) ---
+    issued_code = await find_enterprise_code(
+        db, code, current_user.id, giftcard_id, select(IssuedCodeORM).with_for_update()
+    )
+
+    order_item = None
+    if issued_code:
+        # Carrega o que a baixa e o e-mail precisam (sem lazy load em AsyncSession)
+        order_item = (await db.execute(
+            select(OrderItemORM).options(
+                joinedload(OrderItemORM.original_giftcard),
+                selectinload(OrderItemORM.gift_items),
+                joinedload(OrderItemORM.order).joinedload(OrderORM.owner) # Necessário para e-mail do comprador
+            ).filter(OrderItemORM.id == issued_code.order_item_id)
+        )).scalars().first()
+        await db.refresh(issued_code, attribute_names=["gift_item"])
 
     # Validações iniciais
     if not order_item or order_item.original_giftcard.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Código não encontrado ou inválido para esta empresa.")
 
+    if issued_code.status != IssuedCodeStatus.VALID:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Código já foi utilizado ou é inválido.")
+
     # --- LÓGICA DE BAIXA ---
-    code = code.strip()
-    success = False
+    gift_item_found = issued_code.gift_item
+    is_gift = gift_item_found is not None
+
+    issued_code.status = IssuedCodeStatus.USED
+    issued_code.redeemed_at = now_brt()
+    issued_code.redeemed_by = current_user.id
 
-    if is_gift and gift_item_found:
-        # Lógica para Presente
-        gift_codes = [c.strip() for c in (gift_item_found.codes or "").split(';') if c.strip()]
+    # Mantém as colunas de exibição (';') sincronizadas com o ledger
+    if is_gift:
+        gift_codes = split_codes(gift_item_found.codes)
         if code in gift_codes:
             gift_codes.remove(code)
-            gift_item_found.codes = ";".join(gift_codes)
-            success = True
+        gift_item_found.codes = join_codes(gift_codes)
     else:
-        # Lógica para Comprador
-        available_codes = [c.strip() for c in (order_item.final_giftcard_codes or "").split(';') if c.strip()]
+        available_codes = split_codes(order_item.final_giftcard_codes)
         if code in available_codes:
             available_codes.remove(code)
-            order_item.final_giftcard_codes = ";".join(available_codes)
-            success = True
-
-    if success:
-        # Adiciona aos usados do ITEM PAI
-        used_codes = [c.strip() for c in (order_item.used_codes or "").split(';') if c.strip()]
-        used_codes.append(code)
-        order_item.used_codes = ";".join(used_codes)
-
-        # --- ATUALIZA STATUS DO PEDIDO ---
-        has_codes_left = False
-        
-        # 1. Sobrou do comprador?
-        if order_item.final_giftcard_codes and order_item.final_giftcard_codes.strip():
-            has_codes_left = True
-        
-        # 2. Sobrou de algum presente?
-        if not has_codes_left and order_item.gift_items:
-            for g in order_item.gift_items:
-                if g.codes and g.codes.strip():
-                    has_codes_left = True
-                    break
-
-        if not has_codes_left:
-            order_item.status = OrderItemStatus.USED
-        else:
-            order_item.status = OrderItemStatus.PARTIALLY_USED
-        
-        db.commit()
-        db.refresh(order_item)
-
-        # --- ENVIO DE E-MAIL DE AVISO ---
-        try:
-            recipient_email = None
-            recipient_name = None
-
-            if is_gift and gift_item_found:
-                recipient_email = gift_item_found.recipient_email
-                recipient_name = gift_item_found.recipient_name
-            else:
-                # Se não é presente, o dono é o comprador
-                recipient_email = order_item.order.owner.email
-                recipient_name = order_item.order.owner.username
-
-            if recipient_email:
-                email_data = {
-                    "recipient_name": recipient_name,
-                    "product_title": order_item.original_giftcard.title,
-                    "code": code,
-                    "enterprise_name": current_user.username # Nome da empresa que validou
-                }
-                
-                background_tasks.add_task(
-                    send_email_with_template,
-                    subject="Seu Gift Card foi utilizado! ✅",
-                    recipients=[recipient_email],
-                    template_name="gift_used.html",
-                    template_body=email_data
-                )
-        except Exception as e:
-            # Não queremos falhar a validação se o e-mail falhar, apenas logar
-            print(f"Erro ao tentar enviar e-mail de uso: {e}")
-
-        return order_item
+        order_item.final_giftcard_codes = join_codes(available_codes)
+
+    used_codes = split_codes(order_item.used_codes)
+    used_codes.append(code)
+    order_item.used_codes = join_codes(used_codes)
+
+    # --- ATUALIZA STATUS DO PEDIDO ---
+    await db.flush()
+    has_codes_left = (await db.execute(
+        select(IssuedCodeORM.id).filter(
+            IssuedCodeORM.order_item_id == order_item.id,
+            IssuedCodeORM.status == IssuedCodeStatus.VALID
+        ).limit(1)
+    )).first() is not None
+
+    if not has_codes_left:
+        order_item.status = OrderItemStatus.USED
     else:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Código já foi utilizado ou é inválido.")
+        order_item.status = OrderItemStatus.PARTIALLY_USED
+    
+    await db.commit()
+
+    # --- ENVIO DE E-MAIL DE AVISO ---
+    try:
+        recipient_email = None
+        recipient_name = None
+
+        if is_gift:
+            recipient_email = gift_item_found.recipient_email
+            recipient_name = gift_item_found.recipient_name
+        else:
+            # Se não é presente, o dono é o comprador
+            recipient_email = order_item.order.owner.email
+            recipient_name = order_item.order.owner.username
+
+        if recipient_email:
+            email_data = {
+                "recipient_name": recipient_name,
+                "product_title": order_item.original_giftcard.title,
+                "code": code,
+                "enterprise_name": current_user.username # Nome da empresa que validou
+            }
+            
+            background_tasks.add_task(
+                send_email_with_template,
+                subject="Seu Gift Card foi utilizado! ✅",
+                recipients=[recipient_email],
+                template_name="gift_used.html",
+                template_body=email_data
+            )
+    except Exception as e:
+        # Não queremos falhar a validação se o e-mail falhar, apenas logar
+        print(f"Erro ao tentar enviar e-mail de uso: {e}")
+
+    return order_item
 
 # Rota para ver o histórico
 @router.get("/history/me")
-async def get_my_used_items(db: Session = Depends(get_db), current_user: UserORM = Depends(enterprise_required)):
-    used_items = db.query(OrderItemORM).join(
+async def get_my_used_items(
+    response: Response,
+    page: OptionalPageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserORM = Depends(enterprise_required),
+):
+    used_items, next_cursor = await paginate_async(db, select(OrderItemORM).join(
         RegisterGiftCardORM, OrderItemORM.register_giftcard_id == RegisterGiftCardORM.id
     ).join(
         OrderORM, OrderItemORM.order_id == OrderORM.id
@@ -182,8 +203,7 @@ async def get_my_used_items(db: Session = Depends(get_db), current_user: UserORM
     ).filter(
         RegisterGiftCardORM.user_id == current_user.id,
         OrderItemORM.status.in_([OrderItemStatus.USED, OrderItemStatus.PARTIALLY_USED])
-    ).order_by(
-        OrderORM.created_at.desc()
-    ).all()
+    ), page, (OrderORM.created_at, OrderItemORM.id))
+    set_next_cursor(response, next_cursor)
     
-    return used_items
\ No newline at end of file
+    return used_items
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Dict, Optional, Set
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.database.date_ranges import resolve_date_range
+from app.database.db_config import now_brt
+from app.database.read_replicas import ReadSessionLocal
+from app.models.order_orm import OrderGiftItemORM, OrderItemORM, OrderORM
+from app.services.report_service import EXPORT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Diretório de destino; vazio desativa o job do scheduler
+ANALYTICS_EXPORT_DIR = os.getenv("ANALYTICS_EXPORT_DIR", "")
+ANALYTICS_COMPRESSION = "zstd"
+STATE_FILE = "_state.json"
+
+# Transações que gravaram updated_at antes da marca d'água mas só confirmaram depois
+# (ou que a réplica ainda não tinha aplicado) entram na execução seguinte
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+# (coluna no arquivo, coluna no banco, tipo). Códigos emitidos e dados do destinatário ficam de fora.
+TABLE_COLUMNS = {
+    "orders": (
+        ("id", OrderORM.id, "string"),
+        ("owner_id", OrderORM.owner_id, "int"),
+        ("status", OrderORM.status, "string"),
+        ("total_amount", OrderORM.total_amount, "decimal"),
+        ("net_amount", OrderORM.net_amount, "decimal"),
+        ("mercadopago_transaction_id", OrderORM.mercadopago_transaction_id, "string"),
+        ("created_at", OrderORM.created_at, "timestamp"),
+        ("updated_at", OrderORM.updated_at, "timestamp"),
+    ),
+    "order_items": (
+        ("id", OrderItemORM.id, "string"),
+        ("order_id", OrderItemORM.order_id, "string"),
+        ("register_giftcard_id", OrderItemORM.register_giftcard_id, "string"),
+        ("enterprise_id", OrderItemORM.enterprise_id, "int"),
+        ("quantity", OrderItemORM.quantity, "int"),
+        ("unit_price", OrderItemORM.unit_price, "decimal"),
+        ("seller_amount", OrderItemORM.seller_amount, "decimal"),
+        ("status", OrderItemORM.status, "string"),
+        ("order_created_at", OrderORM.created_at, "timestamp"),
+        ("updated_at", OrderItemORM.updated_at, "timestamp"),
+    ),
+    "order_gift_items": (
+        ("id", OrderGiftItemORM.id, "int"),
+        ("order_item_id", OrderGiftItemORM.order_item_id, "string"),
+        ("order_id", OrderItemORM.order_id, "string"),
+        ("quantity", OrderGiftItemORM.quantity, "int"),
+        ("order_created_at", OrderORM.created_at, "timestamp"),
+    ),
+}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("A exportação analítica exige o pacote 'pyarrow' instalado.") from e
+    return pyarrow, pyarrow.parquet
+
+
+def _schema(pa, table: str):
+    types = {
+        "string": pa.string(),
+        "int": pa.int64(),
+        "decimal": pa.decimal128(10, 2),
+        "timestamp": pa.timestamp("us"),
+    }
+    return pa.schema([(name, types[kind]) for name, _, kind in TABLE_COLUMNS[table]])
+
+
+def _arrow_value(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+def _month_key(day) -> str:
+    # func.date devolve str no SQLite e date no MySQL
+    return day[:7] if isinstance(day, str) else f"{day.year:04d}-{day.month:02d}"
+
+
+def _partition_query(table: str, start: datetime, end: datetime):
+    """Linhas do mês [start, end), particionadas pela data de criação do pedido."""
+    query = select(*(column for _, column, _ in TABLE_COLUMNS[table]))
+    if table == "orders":
+        query = query.select_from(OrderORM)
+    elif table == "order_items":
+        query = query.select_from(OrderItemORM).join(OrderORM, OrderItemORM.order_id == OrderORM.id)
+    else:
+        query = (
+            query.select_from(OrderGiftItemORM)
+            .join(OrderItemORM, OrderGiftItemORM.order_item_id == OrderItemORM.id)
+            .join(OrderORM, OrderItemORM.order_id == OrderORM.id)
+        )
+    return query.where(OrderORM.created_at >= start, OrderORM.created_at < end).order_by(OrderORM.created_at, OrderORM.id)
+
+
+def current_watermark(db: Session) -> Optional[datetime]:
+    values = [
+        db.scalar(select(func.max(OrderORM.updated_at))),
+        db.scalar(select(func.max(OrderItemORM.updated_at))),
+    ]
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def changed_months(db: Session, since: Optional[datetime]) -> Set[str]:
+    """Meses (AAAA-MM, pela criação do pedido) com pedido ou item alterado depois de `since`; todos se None."""
+    day = func.date(OrderORM.created_at)
+    orders = select(day).where(OrderORM.created_at.isnot(None)).distinct()
+    items = select(day).join(OrderItemORM, OrderItemORM.order_id == OrderORM.id).distinct()
+    if since is None:
+        return {_month_key(d) for d in db.scalars(orders)}
+    orders = orders.where(OrderORM.updated_at > since)
+    items = items.where(OrderItemORM.updated_at > since)
+    return {_month_key(d) for d in db.scalars(orders)} | {_month_key(d) for d in db.scalars(items)}
+
+
+def _write_partition(db: Session, pa, pq, root: str, table: str, month: str) -> int:
+    """Regrava a partição inteira em um arquivo temporário e o troca de uma vez (quem lê nunca vê meio arquivo)."""
+    year, month_number = (int(part) for part in month.split("-"))
+    start, end = resolve_date_range(month=month_number, year=year)
+    schema = _schema(pa, table)
+
+    directory = os.path.join(root, table, f"month={month}")
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, "part-0.parquet")
+    temporary = target + ".tmp"
+
+    rows = 0
+    result = db.execute(_partition_query(table, start, end).execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+    with pq.ParquetWriter(temporary, schema, compression=ANALYTICS_COMPRESSION) as writer:
+        for batch in result.partitions():
+            columns = zip(*batch)
+            arrays = [
+                pa.array([_arrow_value(value) for value in values], type=field.type)
+                for values, field in zip(columns, schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(batch)
+    os.replace(temporary, target)
+    return rows
+
+
+def _load_state(root: str) -> Dict:
+    try:
+        with open(os.path.join(root, STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_state(root: str, state: Dict) -> None:
+    path = os.path.join(root, STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def export_analytics(db: Session, root: str, full: bool = False) -> Dict[str, int]:
+    """
+    Exporta orders, order_items e order_gift_items em Parquet, uma partição por mês de criação do pedido
+    (<root>/<tabela>/month=AAAA-MM/part-0.parquet). Incremental: só regrava os meses com algo alterado
+    desde a marca d'água (updated_at) da última execução, guardada em <root>/_state.json.
+    Retorna as partições gravadas e o número de linhas de cada uma.
+    """
+    pa, pq = _require_pyarrow()
+    os.makedirs(root, exist_ok=True)
+    state = _load_state(root)
+
+    since = None
+    if state.get("watermark") and not full:
+        since = datetime.fromisoformat(state["watermark"]) - WATERMARK_OVERLAP
+    # Lida antes da exportação: o que mudar durante ela fica acima da marca e sai na próxima
+    watermark = current_watermark(db)
+
+    written = {}
+    for month in sorted(changed_months(db, since)):
+        for table in TABLE_COLUMNS:
+            written[f"{table}/month={month}"] = _write_partition(db, pa, pq, root, table, month)
+
+    if watermark is not None:
+        state["watermark"] = watermark.isoformat()
+    state["exported_at"] = now_brt().isoformat()
+    state.setdefault("partitions", {}).update(written)
+    _save_state(root, state)
+    return written
+
+
+def _export_in_session(root: str, full: bool = False) -> Dict[str, int]:
+    # Só leitura: vai para a réplica quando houver uma configurada
+    db = ReadSessionLocal()
+    try:
+        return export_analytics(db, root, full)
+    finally:
+        db.close()
+
+
+async def export_analytics_job():
+    """Job do scheduler (madrugada): exportação incremental para ANALYTICS_EXPORT_DIR."""
+    try:
+        written = await asyncio.to_thread(_export_in_session, ANALYTICS_EXPORT_DIR)
+    except Exception as e:
+        logger.error(f"Scheduler: Erro na exportação analítica: {e}", exc_info=True)
+        return
+    logger.info(f"Scheduler: exportação analítica regravou {len(written)} partição(ões).")
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.services.analytics_export_service [diretorio] [--full]
+    from app.models import user_orm, giftcard_orm, enterprise_orm, categories_orm  # registra os mapeamentos usados nas relações
+
+    args = [arg for arg in sys.argv[1:] if arg != "--full"]
+    root = args[0] if args else ANALYTICS_EXPORT_DIR
+    if not root:
+        sys.exit("Informe o diretório de destino ou defina ANALYTICS_EXPORT_DIR.")
+    written = _export_in_session(root, full="--full" in sys.argv)
+    total = sum(written.values())
+    print(f"analytics: {len(written)} partição(ões) regravada(s), {total} linha(s) em {root}.")
@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS") or 60)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES") or 1000)
+
+# Tags usadas na invalidação do catálogo
+CATALOG_LISTS_TAG = "giftcards:lists"          # qualquer listagem/busca (mudança de pertinência)
+TOP_RATED_TAG = "giftcards:top-rated"
+BEST_SELLERS_TAG = "giftcards:best-sellers"
+
+
+def giftcard_tag(giftcard_id) -> str:
+    """Tag de um produto: marca a página do produto e toda listagem em cache que o contém."""
+    return f"giftcard:{giftcard_id}"
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def incr(self, counter: str, amount: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "sets": self.sets,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class InMemoryCache:
+    """Cache TTL + LRU do processo, com índice tag -> chaves para invalidação precisa."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # chave -> (expira_em, valor, tags)
+        self._tags: Dict[str, set] = {}
+
+    def _remove(self, key: str):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    async def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.stats.incr("misses")
+                return None
+            self._entries.move_to_end(key)
+            self.stats.incr("hits")
+            return entry[1]
+
+    async def set(self, key: str, value: Any, ttl: int = CACHE_TTL_SECONDS, tags: Iterable[str] = ()):
+        tags = set(tags)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.stats.incr("evictions")
+            self.stats.incr("sets")
+
+    async def invalidate_tags(self, tags: Iterable[str]):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+            self.stats.incr("invalidations", len(keys))
+
+    async def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    async def size(self) -> int:
+        return len(self._entries)
+
+
+class RedisCache:
+    """Backend compartilhado entre workers. Requer o pacote opcional `redis` (pip install redis)."""
+
+    def __init__(self, url: str = CACHE_URL, prefix: str = "gogift:cache:"):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis exige o pacote 'redis' instalado.") from e
+        self.client = redis_asyncio.from_url(url)
+        self.prefix = prefix
+        self.stats = CacheStats()
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            self.stats.incr("misses")
+            return None
+        self.stats.incr("hits")
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: int = CACHE_TTL_SECONDS, tags: Iterable[str] = ()):
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + key, json.dumps(value), ex=ttl)
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            pipe.sadd(tag_key, key)
+            pipe.expire(tag_key, ttl)
+        await pipe.execute()
+        self.stats.incr("sets")
+
+    async def invalidate_tags(self, tags: Iterable[str]):
+        keys = set()
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            keys |= {k.decode() if isinstance(k, bytes) else k for k in await self.client.smembers(tag_key)}
+            await self.client.delete(tag_key)
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+        self.stats.incr("invalidations", len(keys))
+
+    async def clear(self):
+        async for key in self.client.scan_iter(match=self.prefix + "*"):
+            await self.client.delete(key)
+
+    async def size(self) -> int:
+        return sum([1 async for _ in self.client.scan_iter(match=self.prefix + "*")])
+
+
+def create_cache():
+    if CACHE_BACKEND == "redis":
+        return RedisCache()
+    return InMemoryCache()
+
+
+catalog_cache = create_cache()
+
+
+async def cached_json(
+    key: str,
+    producer: Callable[[], Awaitable[Any]],
+    tags: Iterable[str] = (),
+    ttl: int = CACHE_TTL_SECONDS,
+    refresh: bool = False,
+) -> JSONResponse:
+    """
+    Devolve o conteúdo em cache como JSONResponse (sem revalidar o Pydantic a cada acerto).
+    Em caso de miss, `producer` gera o conteúdo já serializável em JSON, ou uma tupla
+    (conteúdo, cabeçalhos) quando a resposta leva cabeçalhos (ex.: cursor de paginação).
+    `tags` pode ser uma função do conteúdo, útil para marcar uma listagem com os ids dos produtos.
+    Com `refresh` o cache não é consultado e a entrada é regravada (leitura pós-escrita).
+    """
+    cached = None
+    if not refresh:
+        try:
+            cached = await catalog_cache.get(key)
+        except Exception as e:
+            logger.warning(f"Cache indisponível ao ler '{key}': {e}")
+
+    if cached is None:
+        produced = await producer()
+        content, headers = produced if isinstance(produced, tuple) else (produced, {})
+        cached = {"content": content, "headers": headers}
+        try:
+            await catalog_cache.set(key, cached, ttl=ttl, tags=tags(content) if callable(tags) else tags)
+        except Exception as e:
+            logger.warning(f"Cache indisponível ao gravar '{key}': {e}")
+    return JSONResponse(content=cached["content"], headers=cached["headers"])
+
+
+async def invalidate(*tags: str):
+    """Invalida as entradas marcadas com qualquer uma das tags. Falhas do cache não derrubam a escrita."""
+    try:
+        await catalog_cache.invalidate_tags(tags)
+    except Exception as e:
+        logger.error(f"Falha ao invalidar o cache ({tags}): {e}")
+
+
+async def invalidate_giftcards(giftcard_ids: Iterable, *extra_tags: str):
+    await invalidate(*(giftcard_tag(gc_id) for gc_id in set(giftcard_ids)), *extra_tags)
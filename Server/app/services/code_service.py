@@ -0,0 +1,91 @@
+import logging
+import uuid
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.order_orm import IssuedCodeORM
+
+logger = logging.getLogger(__name__)
+
+# Tamanho máximo de cada lista IN(...) enviada ao banco
+LOOKUP_CHUNK_SIZE = 1000
+MAX_GENERATION_ROUNDS = 5
+
+
+def split_codes(raw: Optional[str]) -> List[str]:
+    """Converte uma string de códigos separados por ';' em lista, ignorando vazios."""
+    return [c.strip() for c in (raw or "").split(';') if c.strip()]
+
+
+def join_codes(codes: Iterable[str]) -> str:
+    """Operação inversa de split_codes."""
+    return ";".join(codes)
+
+
+def new_random_code() -> str:
+    return str(uuid.uuid4())
+
+
+def find_existing_codes(db: Session, codes: Iterable[str]) -> Set[str]:
+    """
+    Retorna quais dos códigos informados já existem em issued_codes, em qualquer produto (consulta pelo
+    índice de code). Códigos aleatórios são únicos no sistema todo; só os pré-definidos se repetem entre produtos.
+    """
+    codes = list(codes)
+    existing = set()
+    for start in range(0, len(codes), LOOKUP_CHUNK_SIZE):
+        chunk = codes[start:start + LOOKUP_CHUNK_SIZE]
+        existing.update(code for code, in db.query(IssuedCodeORM.code).filter(IssuedCodeORM.code.in_(chunk)))
+    return existing
+
+
+def generate_unique_codes(db: Session, quantity: int) -> List[str]:
+    """
+    Gera `quantity` códigos aleatórios de uma vez. Cada rodada faz uma única consulta IN
+    no índice de issued_codes.code, então o custo não depende do histórico de pedidos.
+    """
+    codes: List[str] = []
+    seen: Set[str] = set()
+    for _ in range(MAX_GENERATION_ROUNDS):
+        missing = quantity - len(codes)
+        if missing <= 0:
+            break
+        candidates = {new_random_code() for _ in range(missing)} - seen
+        taken = find_existing_codes(db, candidates)
+        for code in candidates - taken:
+            codes.append(code)
+            seen.add(code)
+
+    if len(codes) < quantity:
+        raise RuntimeError(f"Não foi possível gerar {quantity} códigos únicos.")
+    return codes
+
+
+def insert_issued_codes(db: Session, rows: List[Dict], regenerate: bool = False, max_attempts: int = 3) -> List[Dict]:
+    """
+    Insere as linhas de issued_codes em lote dentro de um SAVEPOINT. A unicidade é por
+    (register_giftcard_id, code): o mesmo código pré-definido em produtos diferentes não colide.
+    Se o índice acusar colisão (ex.: aprovação concorrente) e os códigos forem aleatórios, troca
+    apenas os códigos repetidos e tenta de novo. As linhas são atualizadas no lugar e devolvidas.
+    """
+    if not rows:
+        return rows
+
+    for attempt in range(1, max_attempts + 1):
+        try:
+            with db.begin_nested():
+                db.execute(insert(IssuedCodeORM), rows)
+            return rows
+        except IntegrityError:
+            if not regenerate or attempt == max_attempts:
+                logger.error(f"Colisão de código ao inserir {len(rows)} código(s) em issued_codes.")
+                raise
+            taken = find_existing_codes(db, [row["code"] for row in rows])
+            logger.warning(f"{len(taken)} código(s) colidiram, gerando novamente (tentativa {attempt}).")
+            for row in rows:
+                if row["code"] in taken:
+                    row["code"] = new_random_code()
+    return rows
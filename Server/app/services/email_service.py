@@ -1,11 +1,15 @@
+from fastapi import BackgroundTasks
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
 from pydantic import BaseModel, EmailStr
 from typing import List, Dict
 from dotenv import load_dotenv
+import asyncio
+import logging
 import os
 from pathlib import Path
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 # Caminho para a pasta de templates
 template_folder = Path(__file__).parent.parent / 'templates'
@@ -38,4 +42,29 @@ async def send_email_with_template(subject: str, recipients: List[EmailStr], tem
         subtype=MessageType.html
     )
 
-    await fm.send_message(message, template_name=template_name)
\ No newline at end of file
+    await fm.send_message(message, template_name=template_name)
+
+
+# Envios disparados fora de uma requisição (workers de webhook, scheduler): referência até terminarem
+_handed_off = set()
+
+async def _run_tasks(background_tasks: BackgroundTasks):
+    # Um e-mail com falha não impede os seguintes
+    for task in background_tasks.tasks:
+        try:
+            await task()
+        except Exception as e:
+            logger.error(f"Falha ao enviar e-mail em segundo plano: {e}")
+
+def hand_off_emails(background_tasks: BackgroundTasks):
+    """Envia os e-mails acumulados em segundo plano, sem que quem chamou espere por eles."""
+    if not background_tasks.tasks:
+        return
+    task = asyncio.create_task(_run_tasks(background_tasks))
+    _handed_off.add(task)
+    task.add_done_callback(_handed_off.discard)
+
+async def wait_handed_off_emails():
+    """Desligamento da aplicação: espera os envios em andamento."""
+    if _handed_off:
+        await asyncio.gather(*list(_handed_off), return_exceptions=True)
@@ -0,0 +1,136 @@
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import case, delete, func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database.db_config import SessionLocal, now_brt
+from app.models.enterprise_orm import EnterpriseDailyStatsORM, EnterpriseStatsORM
+from app.models.order_orm import OrderItemORM, OrderORM, OrderStatus
+
+COUNTERS = ("items_count", "approved_items", "approved_units", "sales_value", "rejected_items", "expired_items")
+
+# Status final do pedido -> contador de itens que deixam de ser venda
+CLOSED_COUNTERS = {
+    OrderStatus.REJECTED: "rejected_items",
+    OrderStatus.REFUNDED: "rejected_items",
+    OrderStatus.EXPIRED: "expired_items",
+}
+
+
+def _order_day(order: OrderORM) -> date:
+    created_at = order.created_at or now_brt()
+    return created_at.date() if isinstance(created_at, datetime) else created_at
+
+
+def _apply(db: Session, model, key: Dict, deltas: Dict) -> None:
+    """Soma `deltas` na linha `key` com UPDATE relativo; cria a linha no primeiro evento da empresa/dia."""
+    def increment():
+        query = update(model).values({name: getattr(model, name) + value for name, value in deltas.items()})
+        for column, value in key.items():
+            query = query.where(getattr(model, column) == value)
+        return db.execute(query.execution_options(synchronize_session=False)).rowcount
+
+    if increment():
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(model), [{**key, **deltas}])
+    except IntegrityError:
+        # Outra transação criou a linha entre o UPDATE e o INSERT
+        increment()
+
+
+def _record(db: Session, order: OrderORM, items: Iterable[OrderItemORM], deltas_for_item) -> None:
+    grouped: Dict[Tuple[int, date], Dict] = defaultdict(lambda: defaultdict(int))
+    day = _order_day(order)
+    for item in items:
+        bucket = grouped[(item.enterprise_id, day)]
+        for name, value in deltas_for_item(item).items():
+            bucket[name] += value
+
+    for (enterprise_id, bucket_day), deltas in grouped.items():
+        _apply(db, EnterpriseStatsORM, {"enterprise_id": enterprise_id}, deltas)
+        _apply(db, EnterpriseDailyStatsORM, {"enterprise_id": enterprise_id, "day": bucket_day}, deltas)
+
+
+def record_checkout(db: Session, order: OrderORM, items: Iterable[OrderItemORM]) -> None:
+    """Checkout: cada item criado conta como venda (em qualquer status), como no dashboard original."""
+    _record(db, order, items, lambda item: {"items_count": 1})
+
+
+def record_approval(db: Session, order: OrderORM) -> None:
+    _record(db, order, order.items, lambda item: {
+        "approved_items": 1,
+        "approved_units": item.quantity,
+        "sales_value": item.seller_amount or Decimal("0"),
+    })
+
+
+def record_closed(db: Session, order: OrderORM) -> None:
+    """Pedido pendente rejeitado, estornado ou expirado (order.status já atualizado)."""
+    counter = CLOSED_COUNTERS.get(order.status)
+    if counter:
+        _record(db, order, order.items, lambda item: {counter: 1})
+
+
+def rebuild_enterprise_stats(db: Session) -> int:
+    """
+    Reconciliação: recalcula enterprise_stats e enterprise_daily_stats a partir de order_items.
+    Substitui as tabelas inteiras na transação do chamador. Retorna quantas empresas foram gravadas.
+    """
+    status = OrderORM.status
+    day = func.date(OrderORM.created_at)
+    rows = (
+        db.query(
+            OrderItemORM.enterprise_id,
+            day,
+            func.count(OrderItemORM.id),
+            func.sum(case((status == OrderStatus.APPROVED, 1), else_=0)),
+            func.sum(case((status == OrderStatus.APPROVED, OrderItemORM.quantity), else_=0)),
+            func.sum(case((status == OrderStatus.APPROVED, OrderItemORM.seller_amount), else_=0)),
+            func.sum(case((status.in_([OrderStatus.REJECTED, OrderStatus.REFUNDED]), 1), else_=0)),
+            func.sum(case((status == OrderStatus.EXPIRED, 1), else_=0)),
+        )
+        .join(OrderORM, OrderItemORM.order_id == OrderORM.id)
+        .group_by(OrderItemORM.enterprise_id, day)
+        .all()
+    )
+
+    daily, totals = [], defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for enterprise_id, bucket_day, *values in rows:
+        if isinstance(bucket_day, str):
+            bucket_day = date.fromisoformat(bucket_day)
+        counters = dict(zip(COUNTERS, (value or 0 for value in values)))
+        daily.append({"enterprise_id": enterprise_id, "day": bucket_day, **counters})
+        for name, value in counters.items():
+            totals[enterprise_id][name] += value
+
+    db.execute(delete(EnterpriseDailyStatsORM))
+    db.execute(delete(EnterpriseStatsORM))
+    if daily:
+        db.execute(insert(EnterpriseDailyStatsORM), daily)
+    if totals:
+        db.execute(insert(EnterpriseStatsORM), [
+            {"enterprise_id": enterprise_id, **counters} for enterprise_id, counters in totals.items()
+        ])
+    return len(totals)
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.services.enterprise_stats_service
+    from app.models import user_orm, giftcard_orm, categories_orm  # registra os mapeamentos usados nas relações
+
+    session = SessionLocal()
+    try:
+        rebuilt = rebuild_enterprise_stats(session)
+        session.commit()
+        print(f"enterprise_stats: estatísticas de {rebuilt} empresa(s) reconstruídas a partir de order_items.")
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
@@ -0,0 +1,107 @@
+import logging
+from typing import Iterable, List
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.database.db_config import now_brt
+from app.enums.code_status import CodeStatus
+from app.models.giftcard_orm import GiftCardCodeORM, RegisterGiftCardORM
+from app.services.code_service import split_codes
+
+logger = logging.getLogger(__name__)
+
+
+def sync_inventory(db: Session, giftcard: RegisterGiftCardORM) -> None:
+    """
+    Importa os códigos informados pela empresa (giftcard.codes) para giftcard_codes.
+    Códigos novos entram como AVAILABLE; códigos AVAILABLE que saíram da lista são removidos.
+    Linhas RESERVED/SOLD nunca são alteradas aqui.
+    """
+    wanted = [] if giftcard.generaterandomly else list(dict.fromkeys(split_codes(giftcard.codes)))
+    wanted_set = set(wanted)
+
+    existing = dict(
+        db.query(GiftCardCodeORM.code, GiftCardCodeORM.status)
+        .filter(GiftCardCodeORM.register_giftcard_id == giftcard.id)
+    )
+
+    to_add = [code for code in wanted if code not in existing]
+    to_remove = [code for code, code_status in existing.items()
+                 if code_status == CodeStatus.AVAILABLE and code not in wanted_set]
+
+    if to_add:
+        db.execute(insert(GiftCardCodeORM), [
+            {"register_giftcard_id": giftcard.id, "code": code, "status": CodeStatus.AVAILABLE}
+            for code in to_add
+        ])
+    if to_remove:
+        db.query(GiftCardCodeORM).filter(
+            GiftCardCodeORM.register_giftcard_id == giftcard.id,
+            GiftCardCodeORM.status == CodeStatus.AVAILABLE,
+            GiftCardCodeORM.code.in_(to_remove)
+        ).delete(synchronize_session=False)
+
+
+def reserve_codes(db: Session, giftcard_id, order_item_id, quantity: int) -> int:
+    """
+    Reserva até `quantity` códigos AVAILABLE para o item do pedido com
+    SELECT ... FOR UPDATE SKIP LOCKED, sem bloquear checkouts concorrentes.
+    Retorna quantos códigos foram reservados.
+    """
+    if quantity <= 0:
+        return 0
+
+    code_ids = [code_id for code_id, in db.query(GiftCardCodeORM.id).filter(
+        GiftCardCodeORM.register_giftcard_id == giftcard_id,
+        GiftCardCodeORM.status == CodeStatus.AVAILABLE
+    ).order_by(GiftCardCodeORM.id).limit(quantity).with_for_update(skip_locked=True)]
+
+    if code_ids:
+        db.query(GiftCardCodeORM).filter(GiftCardCodeORM.id.in_(code_ids)).update({
+            GiftCardCodeORM.status: CodeStatus.RESERVED,
+            GiftCardCodeORM.order_item_id: order_item_id,
+            GiftCardCodeORM.reserved_at: now_brt()
+        }, synchronize_session=False)
+    return len(code_ids)
+
+
+def sell_reserved_codes(db: Session, order_item) -> List[str]:
+    """Marca como SOLD os códigos reservados para o item e devolve os códigos na ordem da reserva."""
+    reserved = db.query(GiftCardCodeORM.id, GiftCardCodeORM.code).filter(
+        GiftCardCodeORM.order_item_id == order_item.id,
+        GiftCardCodeORM.status == CodeStatus.RESERVED
+    ).order_by(GiftCardCodeORM.id).all()
+
+    missing = order_item.quantity - len(reserved)
+    if missing > 0:
+        # Pedidos criados antes do estoque de códigos não têm reserva: reserva agora.
+        logger.warning(f"Item {order_item.id} sem reserva completa, reservando {missing} código(s) na aprovação.")
+        reserve_codes(db, order_item.register_giftcard_id, order_item.id, missing)
+        reserved = db.query(GiftCardCodeORM.id, GiftCardCodeORM.code).filter(
+            GiftCardCodeORM.order_item_id == order_item.id,
+            GiftCardCodeORM.status == CodeStatus.RESERVED
+        ).order_by(GiftCardCodeORM.id).all()
+
+    if len(reserved) < order_item.quantity:
+        raise RuntimeError(f"Códigos insuficientes no estoque para o item {order_item.id}.")
+
+    db.query(GiftCardCodeORM).filter(GiftCardCodeORM.id.in_([code_id for code_id, _ in reserved])).update(
+        {GiftCardCodeORM.status: CodeStatus.SOLD}, synchronize_session=False
+    )
+    return [code for _, code in reserved]
+
+
+def release_reserved_codes(db: Session, order_item_ids: Iterable) -> None:
+    """Devolve ao estoque (AVAILABLE) os códigos reservados por itens de pedidos rejeitados ou expirados."""
+    order_item_ids = list(order_item_ids)
+    if not order_item_ids:
+        return
+    db.query(GiftCardCodeORM).filter(
+        GiftCardCodeORM.order_item_id.in_(order_item_ids),
+        GiftCardCodeORM.status == CodeStatus.RESERVED
+    ).update({
+        GiftCardCodeORM.status: CodeStatus.AVAILABLE,
+        GiftCardCodeORM.order_item_id: None,
+        GiftCardCodeORM.reserved_at: None
+    }, synchronize_session=False)
@@ -1,28 +1,37 @@
+import asyncio
 import logging
 import copy  # <--- Faltava esta importação
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session, joinedload
-import mercadopago
+from fastapi import BackgroundTasks
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
 import os
-import uuid
 from decimal import Decimal
 
-from app.database.db_config import SessionLocal, now_brt
-from app.models.order_orm import OrderORM, OrderStatus, OrderItemORM, OrderGiftItemORM
+from app.database.db_config import AsyncSessionLocal, now_brt
+from app.models.order_orm import OrderORM, OrderStatus, OrderItemORM, OrderItemStatus, OrderGiftItemORM
 from app.models.giftcard_orm import RegisterGiftCardORM
-from app.services.email_service import send_email_with_template
-
-# Configuração do Logging e do SDK do Mercado Pago
+from app.services.email_service import send_email_with_template, hand_off_emails
+from app.services.code_service import generate_unique_codes, insert_issued_codes, join_codes
+from app.services.inventory_service import sell_reserved_codes, release_reserved_codes
+from app.services.stock_service import commit_reservations, release_reservations
+from app.services.sales_service import record_sale
+from app.services.enterprise_stats_service import record_approval, record_closed
+from app.services.cache_service import invalidate_giftcards, BEST_SELLERS_TAG
+from app.services.payment_gateway import payment_gateway, PaymentGatewayError
+from app.services.payment_events_service import record_processed, remember_processed
+from app.services.webhook_inbox_service import webhook_inbox
+
+# Configuração do Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-access_token = os.getenv("MERCADOPAGO_ACCESS_TOKEN")
-if not access_token:
-    raise RuntimeError("MERCADOPAGO_ACCESS_TOKEN não configurada para o scheduler.")
-sdk = mercadopago.SDK(access_token)
 
 
 ORDER_EXPIRATION_MINUTES = 5
+# Pedidos por execução (o job roda a cada minuto) e consultas simultâneas ao Mercado Pago
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE") or 500)
+CLEANUP_GATEWAY_CONCURRENCY = int(os.getenv("CLEANUP_GATEWAY_CONCURRENCY") or 10)
 
 async def send_order_expired_email(order: OrderORM):
     """Prepara e envia o e-mail de pedido expirado."""
@@ -37,10 +46,11 @@ async def send_order_expired_email(order: OrderORM):
         template_body=email_body
     )
 
-async def process_successful_order(db: Session, order: OrderORM, payment_info: dict, background_tasks=None):
+def process_successful_order(db: Session, order: OrderORM, payment_info: dict, background_tasks=None):
     """
     Processa um pedido aprovado: gera/reserva códigos, distribui entre presentes
     e envia os e-mails correspondentes.
+    Síncrona: rotas com AsyncSession devem chamá-la via `await db.run_sync(...)`.
     """
     logger.info(f"Processando pedido {order.id} como APROVADO.")
     
@@ -55,145 +65,181 @@ async def process_successful_order(db: Session, order: OrderORM, payment_info: d
                 logger.warning(f"Não foi possível converter net_received_amount '{net_raw}' para Decimal.")
     order.net_amount = net_received_amount
     order.status = OrderStatus.APPROVED
+    record_approval(db, order)
+    # A reserva vira baixa de estoque; produtos que ficaram sem unidades não recebem códigos
+    shortfall = commit_reservations(db, order)
 
     # 2. Processa cada item do pedido
     for item in order.items:
         giftcard = item.original_giftcard
+
+        if item.register_giftcard_id in shortfall:
+            # Venda acima do estoque: o item fica marcado para reembolso/reposição (GET /metrics/stock)
+            item.status = OrderItemStatus.OUT_OF_STOCK
+            release_reserved_codes(db, [item.id])
+            continue
         assigned_codes = []
 
         # --- A. GERAÇÃO OU SELEÇÃO DOS CÓDIGOS (Para a quantidade TOTAL) ---
         if giftcard.generaterandomly:
-            for _ in range(item.quantity):
-                while True:
-                    new_code = str(uuid.uuid4())
-                    # Verifica duplicidade global simples (pode ser otimizado)
-                    exists = db.query(OrderItemORM.id).filter(OrderItemORM.final_giftcard_codes.like(f"%{new_code}%")).first()
-                    if not exists and new_code not in assigned_codes:
-                        assigned_codes.append(new_code)
-                        break
+            # Gera todos os códigos do item em lote (unicidade garantida pelo índice de issued_codes)
+            assigned_codes = generate_unique_codes(db, item.quantity)
         else:
-            # Lógica para códigos pré-definidos (estoque fixo)
-            all_codes = {code.strip() for code in (giftcard.codes or "").split(';') if code.strip()}
-            
-            # Busca códigos já vendidos
-            sold_codes_query = db.query(OrderItemORM.final_giftcard_codes).join(OrderORM).filter(
-                OrderItemORM.register_giftcard_id == giftcard.id,
-                OrderORM.status == OrderStatus.APPROVED
-            ).all()
-            sold_codes = {c.strip() for codes, in sold_codes_query if codes for c in codes.split(';')}
-            
-            available_codes = list(all_codes - sold_codes)
-            
-            if len(available_codes) < item.quantity:
-                logger.error(f"Overbooking crítico no pedido {order.id} item {giftcard.id}!")
-                # Pega o que tem disponível para não quebrar totalmente
-                assigned_codes = available_codes[:item.quantity] 
-            else:
-                assigned_codes = available_codes[:item.quantity]
+            # Códigos pré-definidos: os reservados no checkout passam para SOLD
+            assigned_codes = sell_reserved_codes(db, item)
 
         # --- B. DISTRIBUIÇÃO DOS CÓDIGOS ---
         
         codes_pool = copy.deepcopy(assigned_codes) # Lista de códigos para distribuir
+        gift_items = item.gift_items if hasattr(item, 'gift_items') else []
+        code_rows = []
         
-        # 1. Distribui para os Presenteados (OrderGiftItemORM)
-        # Verifica se 'gift_items' foi carregado ou existe no objeto
-        if hasattr(item, 'gift_items'):
-            for gift_item in item.gift_items:
-                qty_needed = gift_item.quantity
-                
-                # Pega a quantidade necessária do pool
-                gift_codes = codes_pool[:qty_needed]
-                # Remove do pool
-                codes_pool = codes_pool[qty_needed:]
-                
-                # Salva no banco para o amigo
-                gift_item.codes = ";".join(gift_codes)
-                
-                # Envia E-mail para o Presenteado
-                if background_tasks:
-                    email_data = {
-                        "recipient_name": gift_item.recipient_name,
-                        "sender_name": order.owner.username,
-                        "product_title": giftcard.title,
-                        "message": gift_item.message,
-                        "codes": gift_codes,
-                        "image_url": f"{os.getenv('BACKEND_PUBLIC_URL')}/uploads/{giftcard.imageUrl}" if giftcard.imageUrl else None
-                    }
-                    background_tasks.add_task(
-                        send_email_with_template,
-                        subject=f"Você ganhou um presente de {order.owner.username}!",
-                        recipients=[gift_item.recipient_email],
-                        template_name="gift_received.html", 
-                        template_body=email_data
-                    )
+        # 1. Reserva a parte de cada Presenteado (OrderGiftItemORM)
+        for gift_item in gift_items:
+            qty_needed = gift_item.quantity
+            code_rows.extend(
+                {"code": code, "register_giftcard_id": item.register_giftcard_id,
+                 "order_item_id": item.id, "gift_item_id": gift_item.id}
+                for code in codes_pool[:qty_needed]
+            )
+            codes_pool = codes_pool[qty_needed:]
 
         # 2. O que sobrou vai para o Comprador
-        item.final_giftcard_codes = ";".join(codes_pool)
-
-async def cancel_expired_pending_orders():
+        code_rows.extend(
+            {"code": code, "register_giftcard_id": item.register_giftcard_id,
+             "order_item_id": item.id, "gift_item_id": None}
+            for code in codes_pool
+        )
+
+        # 3. Grava o ledger em lote (códigos aleatórios que colidirem são trocados aqui)
+        insert_issued_codes(db, code_rows, regenerate=giftcard.generaterandomly)
+        record_sale(db, item)
+
+        # --- C. ATUALIZA AS COLUNAS DE EXIBIÇÃO E ENVIA OS E-MAILS ---
+        for gift_item in gift_items:
+            gift_codes = [row["code"] for row in code_rows if row["gift_item_id"] == gift_item.id]
+
+            # Salva no banco para o amigo
+            gift_item.codes = join_codes(gift_codes)
+            
+            # Envia E-mail para o Presenteado
+            if background_tasks:
+                email_data = {
+                    "recipient_name": gift_item.recipient_name,
+                    "sender_name": order.owner.username,
+                    "product_title": giftcard.title,
+                    "message": gift_item.message,
+                    "codes": gift_codes,
+                    "image_url": f"{os.getenv('BACKEND_PUBLIC_URL')}/uploads/{giftcard.imageUrl}" if giftcard.imageUrl else None
+                }
+                background_tasks.add_task(
+                    send_email_with_template,
+                    subject=f"Você ganhou um presente de {order.owner.username}!",
+                    recipients=[gift_item.recipient_email],
+                    template_name="gift_received.html", 
+                    template_body=email_data
+                )
+
+        item.final_giftcard_codes = join_codes(row["code"] for row in code_rows if row["gift_item_id"] is None)
+
+async def _lookup_payment(payment_id, semaphore: asyncio.Semaphore):
+    """Consulta o status no Mercado Pago, no máximo CLEANUP_GATEWAY_CONCURRENCY consultas ao mesmo tempo."""
+    if not payment_id or payment_id.startswith("pref_"):
+        return None
+    async with semaphore:
+        try:
+            return await payment_gateway.get_payment(payment_id)
+        except PaymentGatewayError as e:
+            logger.error(f"Scheduler: Falha ao consultar o payment_id {payment_id} no Mercado Pago: {e}")
+            return None
+
+async def _settle_expired_order(order_id, payment_info, background_tasks: BackgroundTasks):
     """
-    Verifica pedidos pendentes, consulta o status no Mercado Pago e cancela se necessário.
+    Aprova ou expira um pedido, na própria transação. Usa o mesmo lock por pedido dos workers de
+    webhook e trava a linha: se a notificação chegou durante a consulta, o pedido já não está pendente.
+    Retorna o pedido alterado, ou None.
     """
-    db: Session = SessionLocal()
-    try:
-        logger.info("Scheduler: Iniciando verificação de pedidos pendentes expirados...")
-
-        expiration_time = now_brt() - timedelta(minutes=ORDER_EXPIRATION_MINUTES)
-        
-        expired_orders = db.query(OrderORM).options(
-            joinedload(OrderORM.items).joinedload(OrderItemORM.original_giftcard),
-            joinedload(OrderORM.items).joinedload(OrderItemORM.gift_items), # Carregar presentes também
-            joinedload(OrderORM.owner)
-        ).filter(
-            OrderORM.status == OrderStatus.PENDING,
-            OrderORM.created_at < expiration_time
-        ).all()
-
-        if not expired_orders:
-            logger.info("Scheduler: Nenhum pedido expirado encontrado.")
-            return
-
-        for order in expired_orders:
-            payment_id = order.mercadopago_transaction_id
-            final_status = None
-            payment_info_response = None
-
-            # 1. CONSULTAR O MERCADO PAGO PRIMEIRO
-            if payment_id and not payment_id.startswith("pref_"): 
-                try:
-                    payment_info_response = sdk.payment().get(payment_id)
-                    if payment_info_response and payment_info_response["status"] == 200:
-                        final_status = payment_info_response["response"].get("status")
-                except Exception as e:
-                    logger.error(f"Scheduler: Falha ao consultar o payment_id {payment_id} no Mercado Pago: {e}")
-
-            # 2. DECIDIR A AÇÃO COM BASE NO STATUS
+    final_status = payment_info.get("status") if payment_info else None
+
+    async with webhook_inbox.order_locks.hold(str(order_id)):
+        async with AsyncSessionLocal() as db:
+            await db.execute(select(OrderORM.id).where(OrderORM.id == order_id).with_for_update())
+            order = (await db.execute(select(OrderORM).options(
+                selectinload(OrderORM.items).joinedload(OrderItemORM.original_giftcard),
+                selectinload(OrderORM.items).selectinload(OrderItemORM.gift_items), # Carregar presentes também
+                joinedload(OrderORM.owner)
+            ).where(OrderORM.id == order_id))).scalars().first()
+            if not order or order.status != OrderStatus.PENDING:
+                return None
+
+            # DECIDIR A AÇÃO COM BASE NO STATUS
             if final_status == 'approved':
-                if payment_info_response and payment_info_response.get("response"):
-                    payment_info = payment_info_response["response"]
-                    # Background tasks não está disponível no scheduler cron, então enviamos síncrono ou adaptamos
-                    # Aqui passamos None para background_tasks, o que impede envio de email dentro da função
-                    # (Idealmente você injetaria um serviço de email síncrono aqui se crítico)
-                    await process_successful_order(db, order, payment_info, background_tasks=None)
-                else:
-                    logger.error(f"Scheduler: Status 'approved' para {order.id} mas payment_info estava indisponível.")
+                await db.run_sync(process_successful_order, order, payment_info, background_tasks)
+                record_processed(db, order.mercadopago_transaction_id, final_status, order.id)
             else:
-                logger.warning(f"Scheduler: Pedido {order.id} expirou (Status MP: {final_status}). Cancelando e retornando estoque.")
-                
-                for item in order.items:
-                    if item.original_giftcard:
-                        item.original_giftcard.quantityavailable += item.quantity
-                
+                logger.warning(f"Scheduler: Pedido {order.id} expirou (Status MP: {final_status}). Cancelando e liberando a reserva de estoque.")
+
+                # Só a reserva é apagada; a linha do produto não é escrita
+                await db.run_sync(release_reservations, order.id)
+                await db.run_sync(release_reserved_codes, [item.id for item in order.items])
+
                 order.status = OrderStatus.EXPIRED
-                
-                await send_order_expired_email(order)
-        
-        db.commit()
-        if expired_orders:
-            logger.info(f"Scheduler: {len(expired_orders)} pedido(s) expirado(s) foram processados.")
+                await db.run_sync(record_closed, order)
+
+                background_tasks.add_task(send_order_expired_email, order)
+
+            await db.commit()
+        if final_status == 'approved':
+            await remember_processed(order.mercadopago_transaction_id, final_status)
+        return order
 
+async def cancel_expired_pending_orders():
+    """
+    Verifica pedidos pendentes, consulta o status no Mercado Pago e cancela se necessário.
+    As consultas rodam em paralelo (limitadas); cada pedido tem o seu commit, então a falha de um
+    não desfaz os outros, e os e-mails são enviados em segundo plano.
+    """
+    logger.info("Scheduler: Iniciando verificação de pedidos pendentes expirados...")
+    expiration_time = now_brt() - timedelta(minutes=ORDER_EXPIRATION_MINUTES)
+    try:
+        async with AsyncSessionLocal() as db:
+            expired = (await db.execute(
+                select(OrderORM.id, OrderORM.mercadopago_transaction_id)
+                .where(OrderORM.status == OrderStatus.PENDING, OrderORM.created_at < expiration_time)
+                .order_by(OrderORM.created_at)
+                .limit(CLEANUP_BATCH_SIZE)
+            )).all()
     except Exception as e:
-        logger.error(f"Scheduler: Erro CRÍTICO ao processar pedidos expirados: {e}", exc_info=True)
-        db.rollback()
-    finally:
-        db.close()
\ No newline at end of file
+        logger.error(f"Scheduler: Erro CRÍTICO ao buscar pedidos expirados: {e}", exc_info=True)
+        return
+
+    if not expired:
+        logger.info("Scheduler: Nenhum pedido expirado encontrado.")
+        return
+
+    # 1. CONSULTAR O MERCADO PAGO PRIMEIRO
+    semaphore = asyncio.Semaphore(CLEANUP_GATEWAY_CONCURRENCY)
+    payments = await asyncio.gather(*(_lookup_payment(payment_id, semaphore) for _, payment_id in expired))
+
+    # 2. UM COMMIT POR PEDIDO
+    background_tasks = BackgroundTasks()
+    settled = []
+    for (order_id, _), payment_info in zip(expired, payments):
+        try:
+            order = await _settle_expired_order(order_id, payment_info, background_tasks)
+        except Exception as e:
+            logger.error(f"Scheduler: Erro ao processar o pedido expirado {order_id}: {e}", exc_info=True)
+            continue
+        if order is not None:
+            settled.append(order)
+
+    # Os e-mails não seguram o job (nem o próximo ciclo)
+    hand_off_emails(background_tasks)
+
+    # Pedidos expirados só liberam reservas; o estoque exibido muda apenas com as aprovações tardias
+    approved_orders = [order for order in settled if order.status == OrderStatus.APPROVED]
+    if approved_orders:
+        await invalidate_giftcards(
+            [item.register_giftcard_id for order in approved_orders for item in order.items], BEST_SELLERS_TAG
+        )
+    logger.info(f"Scheduler: {len(settled)} de {len(expired)} pedido(s) expirado(s) foram processados.")
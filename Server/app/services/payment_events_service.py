@@ -0,0 +1,86 @@
+import logging
+from datetime import timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.db_config import now_brt
+from app.models.order_orm import ProcessedPaymentEventORM
+from app.services.cache_service import InMemoryCache
+
+logger = logging.getLogger(__name__)
+
+# Status que encerram o pedido: depois deles nenhuma notificação do mesmo pagamento muda nada
+FINAL_PAYMENT_STATUSES = {"approved", "rejected", "cancelled", "refunded", "charged_back"}
+# O Mercado Pago repete a mesma notificação por alguns minutos; a tabela cobre o resto
+PROCESSED_CACHE_TTL_SECONDS = 600
+PROCESSED_RETENTION = timedelta(days=30)
+
+# Sempre em memória: é só um atalho para a tabela, cada worker tem o seu
+processed_cache = InMemoryCache(max_entries=10000)
+
+
+def _status_key(payment_id, status) -> str:
+    return f"payment:{payment_id}:{status}"
+
+
+def _final_key(payment_id) -> str:
+    return f"payment:{payment_id}:final"
+
+
+async def remember_processed(payment_id, status):
+    await processed_cache.set(_status_key(payment_id, status), True, ttl=PROCESSED_CACHE_TTL_SECONDS)
+    if status in FINAL_PAYMENT_STATUSES:
+        await processed_cache.set(_final_key(payment_id), status, ttl=PROCESSED_CACHE_TTL_SECONDS)
+
+
+async def payment_closed(db: AsyncSession, payment_id) -> bool:
+    """
+    Recebimento do webhook: o pagamento já foi aplicado com um status final? Então a notificação é
+    repetida e pode ser respondida sem ir ao gateway (um pagamento encerrado não muda mais o pedido).
+    """
+    if await processed_cache.get(_final_key(payment_id)) is not None:
+        return True
+    status = await db.scalar(
+        select(ProcessedPaymentEventORM.status)
+        .where(
+            ProcessedPaymentEventORM.payment_id == payment_id,
+            ProcessedPaymentEventORM.status.in_(FINAL_PAYMENT_STATUSES),
+        )
+        .limit(1)
+    )
+    if status is None:
+        return False
+    await remember_processed(payment_id, status)
+    return True
+
+
+async def seen_in_cache(payment_id, status) -> bool:
+    return await processed_cache.get(_status_key(payment_id, status)) is not None
+
+
+async def already_processed(db: AsyncSession, payment_id, status) -> bool:
+    """(payment_id, status) já aplicado? Consulta o cache e, na falta, a tabela."""
+    if await seen_in_cache(payment_id, status):
+        return True
+    found = await db.scalar(
+        select(ProcessedPaymentEventORM.id)
+        .where(ProcessedPaymentEventORM.payment_id == payment_id, ProcessedPaymentEventORM.status == status)
+    )
+    if found is None:
+        return False
+    await remember_processed(payment_id, status)
+    return True
+
+
+def record_processed(db, payment_id, status, order_id=None) -> None:
+    """Marca (payment_id, status) como aplicado, na mesma transação da mudança do pedido."""
+    db.add(ProcessedPaymentEventORM(payment_id=str(payment_id), status=str(status), order_id=order_id))
+
+
+async def purge_processed_payments(db: AsyncSession) -> int:
+    cutoff = now_brt().replace(tzinfo=None) - PROCESSED_RETENTION
+    result = await db.execute(
+        delete(ProcessedPaymentEventORM).where(ProcessedPaymentEventORM.processed_at < cutoff)
+    )
+    return result.rowcount
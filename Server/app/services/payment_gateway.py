@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import random
+from typing import Dict, Optional, Protocol
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+MERCADOPAGO_ACCESS_TOKEN = os.getenv("MERCADOPAGO_ACCESS_TOKEN")
+# Aponte para o gateway falso (fake_payment_gateway.py) para testes de carga sem internet
+PAYMENT_GATEWAY_URL = os.getenv("PAYMENT_GATEWAY_URL") or "https://api.mercadopago.com"
+PAYMENT_GATEWAY_TIMEOUT_SECONDS = float(os.getenv("PAYMENT_GATEWAY_TIMEOUT_SECONDS") or 10)
+PAYMENT_GATEWAY_MAX_RETRIES = int(os.getenv("PAYMENT_GATEWAY_MAX_RETRIES") or 2)
+PAYMENT_GATEWAY_MAX_CONNECTIONS = int(os.getenv("PAYMENT_GATEWAY_MAX_CONNECTIONS") or 50)
+
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 2.0
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class PaymentGatewayError(Exception):
+    """Falha definitiva ao falar com o gateway (depois das novas tentativas, quando cabíveis)."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class PaymentGateway(Protocol):
+    async def create_preference(self, data: Dict, idempotency_key: str) -> Dict:
+        """Cria a preferência de pagamento (Checkout Pro) e devolve o corpo da resposta (id, init_point...)."""
+
+    async def get_payment(self, payment_id) -> Dict:
+        """Consulta um pagamento (status, external_reference, transaction_details...)."""
+
+    async def aclose(self) -> None:
+        ...
+
+
+def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Espera exponencial com jitter total (evita que os workers repitam todos ao mesmo tempo)."""
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), RETRY_MAX_DELAY)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class MercadoPagoGateway:
+    """
+    Cliente assíncrono da API do Mercado Pago: um httpx.AsyncClient por processo (conexões keep-alive
+    reaproveitadas), timeout por chamada e novas tentativas limitadas para timeouts, erros de conexão,
+    429 e 5xx. A criação da preferência manda X-Idempotency-Key, então repetir o POST não duplica nada.
+    """
+
+    def __init__(
+        self,
+        access_token: str,
+        base_url: str = PAYMENT_GATEWAY_URL,
+        timeout: float = PAYMENT_GATEWAY_TIMEOUT_SECONDS,
+        max_retries: int = PAYMENT_GATEWAY_MAX_RETRIES,
+        max_connections: int = PAYMENT_GATEWAY_MAX_CONNECTIONS,
+    ):
+        self.access_token = access_token
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 3.0))
+        self.max_retries = max_retries
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Criado no primeiro uso, já dentro do event loop da aplicação
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.access_token}"},
+                timeout=self.timeout,
+                limits=self.limits,
+            )
+        return self._client
+
+    async def _request(self, method: str, path: str, **kwargs) -> Dict:
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                # Timeouts e falhas de conexão
+                if last_attempt:
+                    raise PaymentGatewayError(f"{method} {path}: {e!r}") from e
+                logger.warning(f"Gateway de pagamento: {method} {path} falhou ({e!r}), nova tentativa.")
+                await asyncio.sleep(_backoff(attempt))
+                continue
+
+            if response.status_code in RETRYABLE_STATUS and not last_attempt:
+                logger.warning(f"Gateway de pagamento: {method} {path} respondeu {response.status_code}, nova tentativa.")
+                await asyncio.sleep(_backoff(attempt, response.headers.get("Retry-After")))
+                continue
+            if response.status_code >= 400:
+                raise PaymentGatewayError(f"{method} {path}: HTTP {response.status_code}", response.status_code)
+            return response.json()
+
+    async def create_preference(self, data: Dict, idempotency_key: str) -> Dict:
+        return await self._request(
+            "POST", "/checkout/preferences", json=data, headers={"X-Idempotency-Key": idempotency_key}
+        )
+
+    async def get_payment(self, payment_id) -> Dict:
+        return await self._request("GET", f"/v1/payments/{payment_id}")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def create_payment_gateway() -> PaymentGateway:
+    if not MERCADOPAGO_ACCESS_TOKEN:
+        logger.error("Variável de ambiente MERCADOPAGO_ACCESS_TOKEN não foi definida!")
+        raise RuntimeError("MERCADOPAGO_ACCESS_TOKEN não configurada.")
+    return MercadoPagoGateway(MERCADOPAGO_ACCESS_TOKEN)
+
+
+payment_gateway = create_payment_gateway()
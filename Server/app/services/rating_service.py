@@ -0,0 +1,228 @@
+import bisect
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app.database.db_config import SessionLocal
+from app.models.giftcard_orm import GiftCardReviewORM, RegisterGiftCardORM
+
+logger = logging.getLogger(__name__)
+
+# Peso da média global na nota bayesiana: quantas avaliações "na média" todo produto começa tendo
+TOP_RATED_PRIOR_WEIGHT = float(os.getenv("TOP_RATED_PRIOR_WEIGHT") or 10)
+# Quantas posições o ranking guarda por fatia (geral e por categoria) além do que é servido
+TOP_RATED_BUFFER = 50
+
+# Média calculada no banco a partir dos agregados (0 para produtos sem avaliação)
+AVERAGE_RATING = func.coalesce(
+    RegisterGiftCardORM.rating_sum * 1.0 / func.nullif(RegisterGiftCardORM.rating_count, 0), 0
+)
+
+
+def add_rating(db: Session, giftcard_id, rating_delta: int, count_delta: int = 0) -> None:
+    """
+    Aplica a variação de uma avaliação nos agregados do produto com um UPDATE relativo,
+    sem ler o valor atual (seguro com avaliações concorrentes).
+    Nova avaliação: (nota, 1). Edição: (nota_nova - nota_antiga, 0).
+    """
+    db.execute(
+        update(RegisterGiftCardORM)
+        .where(RegisterGiftCardORM.id == giftcard_id)
+        .values(
+            rating_sum=RegisterGiftCardORM.rating_sum + rating_delta,
+            rating_count=RegisterGiftCardORM.rating_count + count_delta,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def recompute_rating_aggregates(db: Session) -> int:
+    """
+    Corrige produtos cujos agregados divergem de giftcard_reviews. Cada correção é um
+    UPDATE com subconsulta, então uma avaliação gravada no meio do job não se perde.
+    Retorna quantos produtos foram corrigidos.
+    """
+    totals = {
+        giftcard_id: (int(rating_sum or 0), rating_count)
+        for giftcard_id, rating_sum, rating_count in db.query(
+            GiftCardReviewORM.giftcard_id,
+            func.sum(GiftCardReviewORM.rating),
+            func.count(GiftCardReviewORM.id),
+        ).group_by(GiftCardReviewORM.giftcard_id)
+    }
+
+    drifted = [
+        giftcard_id
+        for giftcard_id, rating_sum, rating_count in db.query(
+            RegisterGiftCardORM.id, RegisterGiftCardORM.rating_sum, RegisterGiftCardORM.rating_count
+        )
+        if totals.get(giftcard_id, (0, 0)) != (rating_sum, rating_count)
+    ]
+
+    for giftcard_id in drifted:
+        of_giftcard = GiftCardReviewORM.giftcard_id == giftcard_id
+        db.execute(
+            update(RegisterGiftCardORM)
+            .where(RegisterGiftCardORM.id == giftcard_id)
+            .values(
+                rating_sum=select(func.coalesce(func.sum(GiftCardReviewORM.rating), 0)).where(of_giftcard).scalar_subquery(),
+                rating_count=select(func.count(GiftCardReviewORM.id)).where(of_giftcard).scalar_subquery(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+    return len(drifted)
+
+
+def recompute_rating_aggregates_job():
+    """Job do scheduler: recalcula os agregados de avaliação que divergiram."""
+    db = SessionLocal()
+    try:
+        fixed = recompute_rating_aggregates(db)
+        db.commit()
+        if fixed:
+            logger.warning(f"Scheduler: agregados de avaliação corrigidos em {fixed} produto(s).")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Scheduler: Erro ao recalcular agregados de avaliação: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+@dataclass
+class RatedGiftCard:
+    id: object
+    category_id: Optional[int]
+    rating_sum: int
+    rating_count: int
+
+
+class TopRatedBoard:
+    """
+    Ranking em memória dos produtos ativos mais bem avaliados, geral e por categoria.
+
+    A nota usada é a média bayesiana (C * m + soma) / (C + avaliações): com poucas avaliações
+    o produto fica perto da média global m, então uma única nota 5 não passa na frente de
+    centenas de 4,9. A média global é fixada a cada rebuild (o job periódico a mantém
+    atualizada), o que deixa a nota de cada produto dependente só das próprias avaliações.
+
+    Cada fatia guarda as TOP_RATED_BUFFER melhores posições, ordenadas; uma avaliação só
+    reposiciona o próprio produto. A fatia é recalculada quando a lista esvazia demais.
+    """
+
+    def __init__(self, prior_weight: float = TOP_RATED_PRIOR_WEIGHT, buffer: int = TOP_RATED_BUFFER):
+        self.prior_weight = prior_weight
+        self.buffer = buffer
+        self._lock = threading.RLock()
+        self._cards: Dict[object, RatedGiftCard] = {}
+        self._prior_mean = 0.0
+        self._top: Dict[Optional[int], List[tuple]] = {}  # categoria (None = geral) -> chaves ordenadas
+
+    def __len__(self):
+        return len(self._cards)
+
+    def score(self, card: RatedGiftCard) -> float:
+        return (self.prior_weight * self._prior_mean + card.rating_sum) / (self.prior_weight + card.rating_count)
+
+    def _key(self, card: RatedGiftCard) -> tuple:
+        # Maior nota primeiro; no empate, mais avaliações; str(id) fecha a ordem (o id em si nunca é comparado)
+        return (-self.score(card), -card.rating_count, str(card.id), card.id)
+
+    # --- Escrita ---
+
+    def _slices(self, card: RatedGiftCard):
+        return (None, card.category_id) if card.category_id is not None else (None,)
+
+    def _discard_from_top(self, card: RatedGiftCard):
+        key = self._key(card)
+        for category_id in self._slices(card):
+            entry = self._top.get(category_id)
+            if entry is None:
+                continue
+            keys = entry[0]
+            position = bisect.bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                del keys[position]
+
+    def _place_in_top(self, card: RatedGiftCard):
+        key = self._key(card)
+        for category_id in self._slices(card):
+            entry = self._top.get(category_id)
+            if entry is None:
+                continue
+            keys, complete = entry
+            # Abaixo da última posição de uma lista parcial o produto não muda nada do que é servido
+            if not complete and (not keys or key > keys[-1]):
+                continue
+            bisect.insort(keys, key)
+            if len(keys) > self.buffer:
+                del keys[self.buffer:]
+                entry[1] = False
+
+    def upsert(self, giftcard):
+        """Produto criado/editado/avaliado. Inativos saem do ranking."""
+        with self._lock:
+            old = self._cards.pop(giftcard.id, None)
+            if old is not None:
+                self._discard_from_top(old)
+            if not giftcard.ativo:
+                return
+            card = RatedGiftCard(giftcard.id, giftcard.category_id, giftcard.rating_sum or 0, giftcard.rating_count or 0)
+            self._cards[card.id] = card
+            self._place_in_top(card)
+
+    def remove(self, giftcard_id):
+        with self._lock:
+            old = self._cards.pop(giftcard_id, None)
+            if old is not None:
+                self._discard_from_top(old)
+
+    def rebuild(self, db: Session) -> int:
+        rows = db.query(
+            RegisterGiftCardORM.id, RegisterGiftCardORM.category_id,
+            RegisterGiftCardORM.rating_sum, RegisterGiftCardORM.rating_count,
+        ).filter(RegisterGiftCardORM.ativo == True).all()
+        cards = {row.id: RatedGiftCard(row.id, row.category_id, row.rating_sum or 0, row.rating_count or 0) for row in rows}
+        total_sum = sum(card.rating_sum for card in cards.values())
+        total_count = sum(card.rating_count for card in cards.values())
+        with self._lock:
+            self._cards = cards
+            self._prior_mean = total_sum / total_count if total_count else 0.0
+            self._top = {}
+        return len(cards)
+
+    # --- Consulta ---
+
+    def _compute_top(self, category_id: Optional[int]) -> list:
+        keys = sorted(self._key(card) for card in self._cards.values()
+                      if category_id is None or card.category_id == category_id)
+        return [keys[:self.buffer], len(keys) <= self.buffer]
+
+    def top(self, limit: int = 5, category_id: Optional[int] = None) -> List:
+        """Ids das `limit` primeiras posições da fatia (geral ou da categoria)."""
+        with self._lock:
+            entry = self._top.get(category_id)
+            if entry is None or (not entry[1] and len(entry[0]) < limit):
+                entry = self._top[category_id] = self._compute_top(category_id)
+            return [key[-1] for key in entry[0][:limit]]
+
+
+top_rated_board = TopRatedBoard()
+
+
+def rebuild_top_rated() -> int:
+    """Reconstrói o ranking de mais bem avaliados (subida da aplicação e job periódico)."""
+    db = SessionLocal()
+    try:
+        ranked = top_rated_board.rebuild(db)
+        logger.info(f"Ranking de mais bem avaliados reconstruído: {ranked} produto(s).")
+        return ranked
+    except Exception as e:
+        logger.error(f"Erro ao reconstruir o ranking de mais bem avaliados: {e}", exc_info=True)
+        return 0
+    finally:
+        db.close()
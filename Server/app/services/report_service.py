@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+import uuid
+from typing import Iterator, Optional, Sequence
+
+from sqlalchemy import select
+
+from app.database.date_ranges import DateRangeParams
+from app.database.read_replicas import ReadSessionLocal
+from app.models.giftcard_orm import RegisterGiftCardORM
+from app.models.order_orm import OrderItemORM, OrderORM, OrderStatus
+from app.models.user_orm import UserORM
+
+# Linhas buscadas por vez no cursor do servidor (e gravadas por pedaço da resposta)
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+# --- Filtros compartilhados entre as listagens paginadas e as exportações ---
+
+def filter_enterprise_sales(query, enterprise_id: int, product_id: Optional[uuid.UUID] = None, period: Optional[DateRangeParams] = None):
+    """
+    Itens vendidos (pedidos aprovados) da empresa. Um único JOIN com orders, feito antes dos filtros
+    que usam colunas do pedido; o período vira intervalo em orders.created_at, coberto pelos índices
+    ix_order_items_enterprise_order e ix_orders_status_created_at.
+    """
+    query = query.join(OrderORM, OrderItemORM.order_id == OrderORM.id).filter(
+        OrderItemORM.enterprise_id == enterprise_id, OrderORM.status == OrderStatus.APPROVED
+    )
+    if product_id:
+        query = query.filter(OrderItemORM.register_giftcard_id == product_id)
+    if period:
+        query = period.apply(query, OrderORM.created_at)
+    return query
+
+
+def filter_admin_orders(query, status: Optional[str] = None, period: Optional[DateRangeParams] = None, buyer_name: Optional[str] = None):
+    """Pedidos do painel do admin. Status + intervalo em created_at usam o índice ix_orders_status_created_at."""
+    if status:
+        query = query.filter(OrderORM.status == status)
+    if period:
+        query = period.apply(query, OrderORM.created_at)
+    if buyer_name:
+        query = query.filter(OrderORM.owner_id.in_(
+            select(UserORM.id).filter(UserORM.username.ilike(f"%{buyer_name}%"))
+        ))
+    return query
+
+
+# --- Exportação em streaming ---
+
+ENTERPRISE_SALES_COLUMNS = (
+    ("order_id", OrderORM.id),
+    ("order_created_at", OrderORM.created_at),
+    ("order_item_id", OrderItemORM.id),
+    ("giftcard_id", OrderItemORM.register_giftcard_id),
+    ("giftcard_title", RegisterGiftCardORM.title),
+    ("buyer_name", UserORM.username),
+    ("quantity", OrderItemORM.quantity),
+    ("unit_price", OrderItemORM.unit_price),
+    ("seller_amount", OrderItemORM.seller_amount),
+    ("item_status", OrderItemORM.status),
+)
+
+ADMIN_ORDERS_COLUMNS = (
+    ("order_id", OrderORM.id),
+    ("order_created_at", OrderORM.created_at),
+    ("order_status", OrderORM.status),
+    ("buyer_name", UserORM.username),
+    ("buyer_email", UserORM.email),
+    ("total_amount", OrderORM.total_amount),
+    ("net_amount", OrderORM.net_amount),
+    ("mercadopago_transaction_id", OrderORM.mercadopago_transaction_id),
+    ("order_item_id", OrderItemORM.id),
+    ("giftcard_id", OrderItemORM.register_giftcard_id),
+    ("giftcard_title", RegisterGiftCardORM.title),
+    ("enterprise_id", OrderItemORM.enterprise_id),
+    ("quantity", OrderItemORM.quantity),
+    ("unit_price", OrderItemORM.unit_price),
+    ("seller_amount", OrderItemORM.seller_amount),
+)
+
+
+def enterprise_sales_export_query(enterprise_id: int, product_id=None, period=None):
+    query = select(*(column for _, column in ENTERPRISE_SALES_COLUMNS)).select_from(OrderItemORM)
+    query = filter_enterprise_sales(query, enterprise_id, product_id, period)
+    return (
+        query.join(UserORM, OrderORM.owner_id == UserORM.id)
+        .join(RegisterGiftCardORM, OrderItemORM.register_giftcard_id == RegisterGiftCardORM.id)
+        .order_by(OrderORM.created_at, OrderItemORM.id)
+    )
+
+
+def admin_orders_export_query(status=None, period=None, buyer_name=None):
+    """Uma linha por item (pedidos sem itens saem com as colunas do item vazias)."""
+    query = (
+        select(*(column for _, column in ADMIN_ORDERS_COLUMNS)).select_from(OrderORM)
+        .join(UserORM, OrderORM.owner_id == UserORM.id)
+        .outerjoin(OrderItemORM, OrderItemORM.order_id == OrderORM.id)
+        .outerjoin(RegisterGiftCardORM, OrderItemORM.register_giftcard_id == RegisterGiftCardORM.id)
+    )
+    return filter_admin_orders(query, status, period, buyer_name).order_by(OrderORM.created_at, OrderORM.id, OrderItemORM.id)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    return value.value if hasattr(value, "value") else str(value)
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (int, str)):
+        return value
+    return value.value if hasattr(value, "value") else str(value)
+
+
+def stream_rows(query, header: Sequence[str], export_format: str) -> Iterator[str]:
+    """
+    Gera a exportação em pedaços de EXPORT_BATCH_SIZE linhas. Abre a própria sessão (a do request
+    já terminou quando o corpo é enviado) e lê por cursor do servidor (stream_results + yield_per),
+    então a memória não cresce com o tamanho do histórico. Gerador síncrono: o Starlette o consome
+    fora do event loop.
+    """
+    db = ReadSessionLocal()
+    try:
+        result = db.execute(query.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(header)
+            yield buffer.getvalue()
+            for rows in result.partitions():
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows([_cell(value) for value in row] for row in rows)
+                yield buffer.getvalue()
+        else:
+            for rows in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(header, map(_json_value, row))), ensure_ascii=False) + "\n" for row in rows
+                )
+    finally:
+        db.close()
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database.db_config import SessionLocal, now_brt
+from app.models.giftcard_orm import BestSellerORM, RegisterGiftCardORM, SoldGiftCardORM
+from app.models.order_orm import OrderItemORM, OrderORM, OrderStatus
+from app.services.cache_service import invalidate, BEST_SELLERS_TAG
+
+logger = logging.getLogger(__name__)
+
+# Períodos do ranking de mais vendidos -> janela em dias (None = desde sempre)
+BEST_SELLER_PERIODS: Dict[str, Optional[int]] = {"all": None, "30d": 30, "7d": 7}
+
+
+def record_sale(db: Session, item: OrderItemORM) -> None:
+    """
+    Contabiliza as unidades de um item aprovado no produto e no ranking de mais vendidos
+    (UPDATEs relativos, sem ler o valor atual). A venda é de agora, então entra em todos os períodos.
+    """
+    db.execute(
+        update(RegisterGiftCardORM)
+        .where(RegisterGiftCardORM.id == item.register_giftcard_id)
+        .values(units_sold=RegisterGiftCardORM.units_sold + item.quantity)
+    )
+    for period in BEST_SELLER_PERIODS:
+        add_best_seller_units(db, period, item.register_giftcard_id, item.quantity)
+
+
+def add_best_seller_units(db: Session, period: str, giftcard_id, units: int) -> None:
+    """Soma unidades à linha (período, produto) do ranking, criando-a na primeira venda."""
+    def increment():
+        return db.execute(
+            update(BestSellerORM)
+            .where(BestSellerORM.period == period, BestSellerORM.register_giftcard_id == giftcard_id)
+            .values(units=BestSellerORM.units + units)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+    if increment():
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(BestSellerORM), [{"period": period, "register_giftcard_id": giftcard_id, "units": units}])
+    except IntegrityError:
+        # Outra aprovação criou a linha entre o UPDATE e o INSERT
+        increment()
+
+
+def count_units_by_giftcard(db: Session, since=None) -> Dict:
+    """Unidades vendidas por produto em pedidos aprovados (desde `since`, pela data do pedido)."""
+    query = (
+        db.query(OrderItemORM.register_giftcard_id, func.sum(OrderItemORM.quantity))
+        .join(OrderORM, OrderItemORM.order_id == OrderORM.id)
+        .filter(OrderORM.status == OrderStatus.APPROVED)
+    )
+    if since is not None:
+        query = query.filter(OrderORM.created_at >= since)
+    return {giftcard_id: int(units or 0) for giftcard_id, units in query.group_by(OrderItemORM.register_giftcard_id)}
+
+
+def refresh_best_sellers(db: Session) -> int:
+    """
+    Recalcula o ranking materializado de cada período a partir dos pedidos aprovados:
+    tira do período as vendas que saíram da janela e corrige divergências dos incrementos.
+    Só grava as linhas que mudaram. Retorna quantas linhas foram alteradas.
+    """
+    changed = 0
+    now = now_brt()
+    for period, days in BEST_SELLER_PERIODS.items():
+        totals = count_units_by_giftcard(db, since=now - timedelta(days=days) if days else None)
+        current = dict(
+            db.query(BestSellerORM.register_giftcard_id, BestSellerORM.units).filter(BestSellerORM.period == period)
+        )
+
+        stale = [giftcard_id for giftcard_id in current if giftcard_id not in totals]
+        if stale:
+            db.execute(
+                delete(BestSellerORM)
+                .where(BestSellerORM.period == period, BestSellerORM.register_giftcard_id.in_(stale))
+                .execution_options(synchronize_session=False)
+            )
+
+        missing = [
+            {"period": period, "register_giftcard_id": giftcard_id, "units": units}
+            for giftcard_id, units in totals.items() if giftcard_id not in current
+        ]
+        if missing:
+            db.execute(insert(BestSellerORM), missing)
+
+        drifted = [(giftcard_id, units) for giftcard_id, units in totals.items()
+                   if giftcard_id in current and current[giftcard_id] != units]
+        for giftcard_id, units in drifted:
+            db.execute(
+                update(BestSellerORM)
+                .where(BestSellerORM.period == period, BestSellerORM.register_giftcard_id == giftcard_id)
+                .values(units=units)
+                .execution_options(synchronize_session=False)
+            )
+        changed += len(stale) + len(missing) + len(drifted)
+    return changed
+
+
+def top_best_seller_ids(db: Session, period: str, limit: int) -> List:
+    """Ids dos produtos ativos mais vendidos do período, lidos do ranking materializado."""
+    return [giftcard_id for giftcard_id, in db.execute(
+        select(BestSellerORM.register_giftcard_id)
+        .join(RegisterGiftCardORM, BestSellerORM.register_giftcard_id == RegisterGiftCardORM.id)
+        .filter(BestSellerORM.period == period, BestSellerORM.units > 0, RegisterGiftCardORM.ativo == True)
+        .order_by(BestSellerORM.units.desc(), BestSellerORM.register_giftcard_id)
+        .limit(limit)
+    )]
+
+
+def sample_active_giftcard_ids(db: Session, limit: int, exclude=()) -> List:
+    """
+    Amostra barata de produtos ativos para completar o ranking: os ids são UUID4 (uniformes),
+    então basta ler pela chave primária a partir de um UUID sorteado, dando a volta se faltar.
+    Evita o ORDER BY RAND(), que lê e ordena a tabela inteira.
+    """
+    if limit <= 0:
+        return []
+    exclude = set(exclude)
+    pivot = uuid.uuid4()
+    base = select(RegisterGiftCardORM.id).filter(RegisterGiftCardORM.ativo == True).order_by(RegisterGiftCardORM.id)
+    # Lê `limit + len(exclude)` para que os excluídos não diminuam a amostra
+    window = limit + len(exclude)
+    ids = [gc_id for gc_id, in db.execute(base.filter(RegisterGiftCardORM.id >= pivot).limit(window))]
+    if len(ids) < window:
+        ids += [gc_id for gc_id, in db.execute(base.filter(RegisterGiftCardORM.id < pivot).limit(window - len(ids)))]
+    return [gc_id for gc_id in ids if gc_id not in exclude][:limit]
+
+
+def recompute_units_sold(db: Session) -> int:
+    """
+    Recalcula units_sold a partir dos itens de pedidos aprovados e dos sold_giftcards legados.
+    Só regrava os produtos divergentes. Retorna quantos foram corrigidos.
+    """
+    totals = {}
+    approved = (
+        db.query(OrderItemORM.register_giftcard_id, func.sum(OrderItemORM.quantity))
+        .join(OrderORM, OrderItemORM.order_id == OrderORM.id)
+        .filter(OrderORM.status == OrderStatus.APPROVED)
+        .group_by(OrderItemORM.register_giftcard_id)
+    )
+    legacy = db.query(SoldGiftCardORM.register_giftcard_id, func.count(SoldGiftCardORM.id))\
+        .group_by(SoldGiftCardORM.register_giftcard_id)
+    for giftcard_id, units in [*approved, *legacy]:
+        totals[giftcard_id] = totals.get(giftcard_id, 0) + int(units or 0)
+
+    fixed = 0
+    for giftcard_id, units_sold in db.query(RegisterGiftCardORM.id, RegisterGiftCardORM.units_sold):
+        expected = totals.get(giftcard_id, 0)
+        if units_sold != expected:
+            db.execute(
+                update(RegisterGiftCardORM)
+                .where(RegisterGiftCardORM.id == giftcard_id)
+                .values(units_sold=expected)
+                .execution_options(synchronize_session=False)
+            )
+            fixed += 1
+    return fixed
+
+
+
+def _refresh_best_sellers_in_session() -> int:
+    db = SessionLocal()
+    try:
+        changed = refresh_best_sellers(db)
+        db.commit()
+        return changed
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def refresh_best_sellers_job():
+    """Job do scheduler: atualiza o ranking de mais vendidos e, se mudou, o cache da vitrine."""
+    try:
+        changed = await asyncio.to_thread(_refresh_best_sellers_in_session)
+    except Exception as e:
+        logger.error(f"Scheduler: Erro ao atualizar o ranking de mais vendidos: {e}", exc_info=True)
+        return
+    if changed:
+        await invalidate(BEST_SELLERS_TAG)
@@ -0,0 +1,489 @@
+import bisect
+import heapq
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from decimal import Decimal
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session, joinedload
+
+from app.database.db_config import SessionLocal
+from app.models.categories_orm import CategoriesORM
+from app.models.giftcard_orm import RegisterGiftCardORM
+
+logger = logging.getLogger(__name__)
+
+# Peso de cada campo na frequência do termo (BM25F simplificado)
+FIELD_WEIGHTS = {"title": 3, "category": 2, "description": 1}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "da", "do", "das", "dos", "e", "em", "no", "na",
+    "nos", "nas", "para", "por", "com", "sem", "ao", "aos", "que", "se", "ou",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Minúsculas e sem acentos: 'Cartão Presente' -> 'cartao presente'."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(normalize(text)) if token not in STOPWORDS]
+
+
+@dataclass
+class SearchDocument:
+    id: object
+    title: str
+    description: Optional[str]
+    category_id: Optional[int]
+    category_name: Optional[str]
+    valor: Decimal
+    average_rating: float
+    length: float = 0.0
+    # id em texto, calculado uma vez: desempate da ordenação e chave do cursor
+    sort_id: str = ""
+
+
+class SearchIndex:
+    """
+    Índice invertido em memória dos gift cards ativos, com ranking BM25.
+    Construído na subida da aplicação e mantido pelas rotas de escrita (upsert/remove).
+
+    Cada posting guarda o peso BM25 do termo no documento já normalizado pelo tamanho,
+    então a consulta só soma idf * peso. O tamanho médio usado na normalização é fixado
+    a cada rebuild (o job periódico o mantém atualizado).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs: Dict[object, SearchDocument] = {}
+        self._postings: Dict[str, Dict[object, float]] = {}
+        self._avg_length = 0.0
+
+    def __len__(self):
+        return len(self._docs)
+
+    # --- Escrita ---
+
+    def _weighted_terms(self, doc: SearchDocument) -> Counter:
+        terms = Counter()
+        for field, text in (("title", doc.title), ("category", doc.category_name), ("description", doc.description)):
+            for token in tokenize(text):
+                terms[token] += FIELD_WEIGHTS[field]
+        return terms
+
+    def _add(self, doc: SearchDocument, terms: Optional[Counter] = None):
+        terms = terms if terms is not None else self._weighted_terms(doc)
+        doc.length = float(sum(terms.values()))
+        doc.sort_id = str(doc.id)
+        if not self._avg_length:
+            self._avg_length = doc.length or 1.0
+        self._docs[doc.id] = doc
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc.length / self._avg_length)
+        for token, tf in terms.items():
+            self._postings.setdefault(token, {})[doc.id] = tf * (BM25_K1 + 1) / (tf + length_norm)
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for token in self._weighted_terms(doc):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+
+    @staticmethod
+    def document_from_orm(giftcard: RegisterGiftCardORM) -> SearchDocument:
+        return SearchDocument(
+            id=giftcard.id,
+            title=giftcard.title,
+            description=giftcard.description,
+            category_id=giftcard.category_id,
+            category_name=giftcard.category.name if giftcard.category else None,
+            valor=giftcard.valor,
+            average_rating=giftcard.average_rating,
+        )
+
+    def upsert(self, giftcard: RegisterGiftCardORM):
+        """Reindexa o produto (a categoria precisa estar carregada). Inativos saem do índice."""
+        with self._lock:
+            self._remove(giftcard.id)
+            if giftcard.ativo:
+                self._add(self.document_from_orm(giftcard))
+
+    def remove(self, giftcard_id):
+        with self._lock:
+            self._remove(giftcard_id)
+
+    def update_rating(self, giftcard_id, average_rating: float):
+        """A nota não entra no texto; só atualiza o valor usado por sort_by=nota_desc."""
+        with self._lock:
+            doc = self._docs.get(giftcard_id)
+            if doc is not None:
+                doc.average_rating = average_rating
+
+    def rename_category(self, category_id: int, name: str) -> List:
+        """Reindexa os produtos da categoria renomeada. Retorna os ids afetados."""
+        with self._lock:
+            affected = [doc for doc in self._docs.values() if doc.category_id == category_id]
+            for doc in affected:
+                self._remove(doc.id)
+                doc.category_name = name
+                self._add(doc)
+            return [doc.id for doc in affected]
+
+    def rebuild(self, db: Session, batch_size: int = 1000) -> int:
+        """Reconstrói o índice a partir do banco e troca o conteúdo de uma vez."""
+        fresh = SearchIndex()
+        giftcards = (
+            db.query(RegisterGiftCardORM)
+            .options(joinedload(RegisterGiftCardORM.category))
+            .filter(RegisterGiftCardORM.ativo == True)
+            .yield_per(batch_size)
+        )
+        documents = []
+        for giftcard in giftcards:
+            doc = self.document_from_orm(giftcard)
+            documents.append((doc, self._weighted_terms(doc)))
+        if documents:
+            fresh._avg_length = sum(sum(terms.values()) for _, terms in documents) / len(documents) or 1.0
+        for doc, terms in documents:
+            fresh._add(doc, terms)
+        with self._lock:
+            self._docs, self._postings, self._avg_length = fresh._docs, fresh._postings, fresh._avg_length
+        return len(fresh)
+
+    # --- Leitura ---
+
+    def search(
+        self,
+        q: str,
+        category_id: Optional[int] = None,
+        min_price: Optional[Decimal] = None,
+        max_price: Optional[Decimal] = None,
+        sort_by: Optional[str] = None,
+        limit: int = 50,
+        after: Optional[list] = None,
+    ) -> Tuple[List, Optional[list]]:
+        """
+        Retorna (ids da página, chave de ordenação do último item ou None na última página).
+        Sem sort_by, ordena por relevância BM25; qualquer termo da busca casa (OR), e produtos
+        com mais termos sobem no ranking. `after` é a chave devolvida pela página anterior.
+        """
+        tokens = list(dict.fromkeys(tokenize(q)))
+        with self._lock:
+            total_docs = len(self._docs)
+            if not tokens or not total_docs:
+                return [], None
+
+            scores: Dict[object, float] = {}
+            for token in tokens:
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                if not scores:
+                    scores = {doc_id: idf * weight for doc_id, weight in postings.items()}
+                    continue
+                get = scores.get
+                for doc_id, weight in postings.items():
+                    scores[doc_id] = get(doc_id, 0.0) + idf * weight
+
+            docs = self._docs
+            if category_id or min_price is not None or max_price is not None:
+                scores = {
+                    doc_id: score for doc_id, score in scores.items()
+                    if (not category_id or docs[doc_id].category_id == category_id)
+                    and (min_price is None or docs[doc_id].valor >= min_price)
+                    and (max_price is None or docs[doc_id].valor <= max_price)
+                }
+
+            if sort_by in ("price_asc", "price_desc", "nota_desc"):
+                page = self._page_by_field(scores, sort_by, limit, after)
+            else:
+                page = self._page_by_relevance(scores, limit, after)
+
+        next_key = page[limit - 1][0] if len(page) > limit else None
+        return [doc_id for _, doc_id in page[:limit]], next_key
+
+    def _page_by_relevance(self, scores: Dict[object, float], limit: int, after: Optional[list]) -> List:
+        """
+        Ordem (-score, id). O nlargest compara só o score (float); o id em texto entra apenas para
+        desempatar os candidatos empatados com o último da página.
+        """
+        docs = self._docs
+        if after is not None:
+            try:
+                last_score, last_id = -float(after[0]), str(after[1])
+            except (TypeError, ValueError, IndexError):
+                raise ValueError("Cursor de busca inválido.")
+            scores = {
+                doc_id: score for doc_id, score in scores.items()
+                if score < last_score or (score == last_score and docs[doc_id].sort_id > last_id)
+            }
+        top = heapq.nlargest(limit + 1, scores.items(), key=itemgetter(1))
+        if len(top) > limit:
+            # Empates no corte: todos os docs com o score do último candidato disputam as posições finais
+            boundary = top[-1][1]
+            above = [item for item in top if item[1] > boundary]
+            tied = [item for item in scores.items() if item[1] == boundary]
+            top = above + heapq.nsmallest(limit + 1 - len(above), tied, key=lambda item: docs[item[0]].sort_id)
+        top.sort(key=lambda item: (-item[1], docs[item[0]].sort_id))
+        return [([-score, docs[doc_id].sort_id], doc_id) for doc_id, score in top[:limit + 1]]
+
+    def _page_by_field(self, scores: Dict[object, float], sort_by: str, limit: int, after: Optional[list]) -> List:
+        """Ordem (campo, -score, id); chave total para o cursor ser estável entre páginas."""
+        docs = self._docs
+        if sort_by == "price_asc":
+            sort_key = lambda item: (float(docs[item[0]].valor), -item[1], docs[item[0]].sort_id)
+        elif sort_by == "price_desc":
+            sort_key = lambda item: (-float(docs[item[0]].valor), -item[1], docs[item[0]].sort_id)
+        else:
+            sort_key = lambda item: (-docs[item[0]].average_rating, -item[1], docs[item[0]].sort_id)
+
+        items = scores.items()
+        try:
+            if after is not None:
+                after = tuple(after)
+                items = [item for item in items if sort_key(item) > after]
+            # Só a página pedida precisa ficar ordenada
+            page = heapq.nsmallest(limit + 1, items, key=sort_key)
+        except TypeError:
+            raise ValueError("Cursor de busca inválido.")
+        return [(list(sort_key(item)), item[0]) for item in page]
+
+
+def trigrams(word: str) -> set:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestIndex:
+    """
+    Autocomplete da barra de busca: títulos dos produtos ativos e nomes de categorias.
+    A última palavra digitada casa por prefixo (busca binária no vocabulário ordenado);
+    palavras que não existem no vocabulário são corrigidas por similaridade de trigramas
+    ("netflx" -> "netflix").
+
+    Produtos com o mesmo título (empresas diferentes) formam uma única sugestão, e cada
+    palavra guarda em cache suas melhores sugestões, então uma tecla com uma palavra só
+    não percorre o catálogo.
+    """
+
+    MAX_PREFIX_WORDS = 30
+    MAX_FUZZY_WORDS = 3
+    MIN_SIMILARITY = 0.3
+    TOP_PER_WORD = 20
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries: Dict[tuple, dict] = {}        # (tipo, texto normalizado) -> sugestão
+        self._entry_of: Dict[tuple, tuple] = {}      # (tipo, id) -> chave da sugestão
+        self._word_entries: Dict[str, set] = {}      # palavra -> chaves das sugestões
+        self._words: List[str] = []                  # vocabulário ordenado
+        self._trigrams: Dict[str, set] = {}          # trigrama -> palavras
+        self._top: Dict[str, list] = {}              # cache palavra -> melhores sugestões
+
+    # --- Escrita ---
+
+    def _add_word(self, word: str, key: tuple):
+        entries = self._word_entries.get(word)
+        if entries is None:
+            entries = self._word_entries[word] = set()
+            bisect.insort(self._words, word)
+            for trigram in trigrams(word):
+                self._trigrams.setdefault(trigram, set()).add(word)
+        entries.add(key)
+
+    def _remove_word(self, word: str, key: tuple):
+        entries = self._word_entries.get(word)
+        if entries is None:
+            return
+        entries.discard(key)
+        if entries:
+            return
+        del self._word_entries[word]
+        del self._words[bisect.bisect_left(self._words, word)]
+        for trigram in trigrams(word):
+            words = self._trigrams.get(trigram)
+            if words is not None:
+                words.discard(word)
+                if not words:
+                    del self._trigrams[trigram]
+
+    def _touch(self, entry: dict):
+        for word in entry["words"]:
+            self._top.pop(word, None)
+
+    def put(self, kind: str, entry_id, text: str, weight: int = 0):
+        with self._lock:
+            self.discard(kind, entry_id)
+            words = frozenset(tokenize(text))
+            if not words:
+                return
+            key = (kind, normalize(text).strip())
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {"text": text, "words": words, "members": {}}
+                for word in words:
+                    self._add_word(word, key)
+            entry["members"][entry_id] = weight
+            entry["weight"] = max(entry["members"].values())
+            self._entry_of[(kind, entry_id)] = key
+            self._touch(entry)
+
+    def discard(self, kind: str, entry_id):
+        with self._lock:
+            key = self._entry_of.pop((kind, entry_id), None)
+            if key is None:
+                return
+            entry = self._entries[key]
+            entry["members"].pop(entry_id, None)
+            self._touch(entry)
+            if entry["members"]:
+                entry["weight"] = max(entry["members"].values())
+                return
+            del self._entries[key]
+            for word in entry["words"]:
+                self._remove_word(word, key)
+
+    # --- Leitura ---
+
+    def _rank(self, key: tuple, quality: float) -> tuple:
+        return quality, key[0] == "category", self._entries[key]["weight"]
+
+    def _top_for_word(self, word: str) -> list:
+        top = self._top.get(word)
+        if top is None:
+            top = self._top[word] = heapq.nlargest(
+                self.TOP_PER_WORD, self._word_entries.get(word, ()), key=lambda key: self._rank(key, 0)
+            )
+        return top
+
+    def _prefix_words(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._words, prefix)
+        matches = []
+        for word in self._words[start:start + self.MAX_PREFIX_WORDS]:
+            if not word.startswith(prefix):
+                break
+            matches.append(word)
+        return matches
+
+    def _fuzzy_words(self, token: str) -> List[tuple]:
+        """Palavras do vocabulário mais parecidas com `token` (similaridade de Jaccard dos trigramas)."""
+        token_trigrams = trigrams(token)
+        shared = Counter()
+        for trigram in token_trigrams:
+            shared.update(self._trigrams.get(trigram, ()))
+        scored = []
+        for word, count in shared.items():
+            similarity = count / (len(token_trigrams) + len(trigrams(word)) - count)
+            if similarity >= self.MIN_SIMILARITY:
+                scored.append((similarity, word))
+        return [(word, similarity) for similarity, word in heapq.nlargest(self.MAX_FUZZY_WORDS, scored)]
+
+    def _candidates(self, token: str, is_last: bool) -> Dict[str, float]:
+        """Palavras do vocabulário que podem corresponder ao token, com a qualidade do casamento."""
+        if is_last:
+            words = {word: (1.0 if word == token else 0.9) for word in self._prefix_words(token)}
+        else:
+            words = {token: 1.0} if token in self._word_entries else {}
+        if not words:
+            words = {word: similarity * 0.8 for word, similarity in self._fuzzy_words(token)}
+        return words
+
+    def suggest(self, q: str, limit: int = 8) -> List[Dict]:
+        tokens = list(dict.fromkeys(tokenize(q)))
+        if not tokens:
+            return []
+        with self._lock:
+            candidates = [self._candidates(token, i == len(tokens) - 1) for i, token in enumerate(tokens)]
+            if not all(candidates):
+                return []
+
+            scores: Dict[tuple, float] = {}
+            if len(candidates) == 1:
+                # Uma palavra: junta as listas em cache de cada palavra candidata
+                for word, quality in candidates[0].items():
+                    for key in self._top_for_word(word):
+                        scores[key] = max(scores.get(key, 0.0), quality)
+            else:
+                # Várias palavras: interseção dos conjuntos (em C) e só depois a pontuação
+                key_sets = [set().union(*(self._word_entries[word] for word in words)) for words in candidates]
+                key_sets.sort(key=len)
+                for key in key_sets[0].intersection(*key_sets[1:]):
+                    entry_words = self._entries[key]["words"]
+                    scores[key] = sum(
+                        max(quality for word, quality in words.items() if word in entry_words)
+                        for words in candidates
+                    )
+
+            ranked = heapq.nlargest(limit, scores, key=lambda key: self._rank(key, scores[key]))
+            suggestions = []
+            for key in ranked:
+                entry = self._entries[key]
+                entry_id = max(entry["members"], key=entry["members"].get)
+                suggestions.append({"type": key[0], "id": str(entry_id), "text": entry["text"]})
+            return suggestions
+
+    def rebuild(self, db: Session) -> int:
+        fresh = SuggestIndex()
+        giftcards = db.query(
+            RegisterGiftCardORM.id, RegisterGiftCardORM.title, RegisterGiftCardORM.units_sold
+        ).filter(RegisterGiftCardORM.ativo == True)
+        for giftcard_id, title, units_sold in giftcards:
+            fresh.put("giftcard", giftcard_id, title, units_sold or 0)
+        for category_id, name in db.query(CategoriesORM.id, CategoriesORM.name):
+            fresh.put("category", category_id, name)
+        with self._lock:
+            self._entries, self._entry_of, self._word_entries = fresh._entries, fresh._entry_of, fresh._word_entries
+            self._words, self._trigrams, self._top = fresh._words, fresh._trigrams, {}
+        return len(fresh._entries)
+
+search_index = SearchIndex()
+suggest_index = SuggestIndex()
+
+
+def index_giftcard(giftcard: RegisterGiftCardORM):
+    """Atualiza busca e autocomplete depois de criar/editar um produto (categoria carregada)."""
+    search_index.upsert(giftcard)
+    if giftcard.ativo:
+        suggest_index.put("giftcard", giftcard.id, giftcard.title, giftcard.units_sold or 0)
+    else:
+        suggest_index.discard("giftcard", giftcard.id)
+
+
+def unindex_giftcard(giftcard_id):
+    search_index.remove(giftcard_id)
+    suggest_index.discard("giftcard", giftcard_id)
+
+
+def rebuild_search_index() -> int:
+    """Reconstrói os índices globais (subida da aplicação e job periódico, para pegar escritas de outros workers)."""
+    db = SessionLocal()
+    try:
+        indexed = search_index.rebuild(db)
+        suggestions = suggest_index.rebuild(db)
+        logger.info(f"Índice de busca reconstruído: {indexed} produto(s), {suggestions} sugestão(ões).")
+        return indexed
+    except Exception as e:
+        logger.error(f"Erro ao reconstruir o índice de busca: {e}", exc_info=True)
+        return 0
+    finally:
+        db.close()
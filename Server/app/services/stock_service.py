@@ -0,0 +1,183 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.database.db_config import now_brt
+from app.models.giftcard_orm import RegisterGiftCardORM
+from app.models.order_orm import StockReservationORM
+
+logger = logging.getLogger(__name__)
+
+# Prazo previsto da reserva, gravado em expires_at: o scheduler expira o pedido (e libera a reserva)
+# depois de 5 min; a reserva vale até o pedido ser fechado, então um pagamento no limite ainda a encontra
+RESERVATION_TTL = timedelta(minutes=10)
+
+
+def take_stock(db: Session, giftcard_id, quantity: int) -> bool:
+    """
+    Baixa atômica: UPDATE ... SET quantityavailable = quantityavailable - n
+    WHERE id = ? AND quantityavailable - quantityreserved >= n.
+    O banco decide sob a trava da linha, então duas transações nunca vendem a mesma unidade, e as
+    unidades reservadas por pedidos pendentes ficam de fora. Retorna False (sem alterar nada) se não havia estoque.
+    """
+    result = db.execute(
+        update(RegisterGiftCardORM)
+        .where(
+            RegisterGiftCardORM.id == giftcard_id,
+            RegisterGiftCardORM.quantityavailable - RegisterGiftCardORM.quantityreserved >= quantity
+        )
+        .values(quantityavailable=RegisterGiftCardORM.quantityavailable - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def return_stock(db: Session, giftcard_id, quantity: int) -> None:
+    """Devolve unidades já baixadas (UPDATE relativo, sem ler antes)."""
+    db.execute(
+        update(RegisterGiftCardORM)
+        .where(RegisterGiftCardORM.id == giftcard_id)
+        .values(quantityavailable=RegisterGiftCardORM.quantityavailable + quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def set_stock(db: Session, giftcard_id, seen: int, quantity: int) -> bool:
+    """
+    Edição do estoque pela empresa: UPDATE ... SET quantityavailable = n
+    WHERE id = ? AND quantityavailable = seen AND quantityreserved <= n.
+    Retorna False (sem alterar nada) se uma venda/devolução mudou o estoque depois da leitura ou se
+    o novo valor ficaria abaixo das unidades reservadas por pedidos pendentes.
+    """
+    result = db.execute(
+        update(RegisterGiftCardORM)
+        .where(
+            RegisterGiftCardORM.id == giftcard_id,
+            RegisterGiftCardORM.quantityavailable == seen,
+            RegisterGiftCardORM.quantityreserved <= quantity
+        )
+        .values(quantityavailable=quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def sum_quantities(items: Iterable) -> Dict:
+    """Quantidade por produto de uma lista de itens de pedido."""
+    quantities: Dict = {}
+    for item in items:
+        quantities[item.register_giftcard_id] = quantities.get(item.register_giftcard_id, 0) + item.quantity
+    return quantities
+
+
+def return_stock_batch(db: Session, quantities: Dict) -> None:
+    for giftcard_id in sorted(quantities, key=str):
+        return_stock(db, giftcard_id, quantities[giftcard_id])
+
+
+# --- Reservas (pedidos pendentes) ---
+# Cada reserva é uma linha de stock_reservations e também está somada em quantityreserved do produto:
+# o disponível para venda é quantityavailable - quantityreserved, conferido no próprio UPDATE.
+
+def hold_stock(db: Session, giftcard_id, quantity: int) -> bool:
+    """
+    Reserva atômica: UPDATE ... SET quantityreserved = quantityreserved + n
+    WHERE id = ? AND quantityavailable - quantityreserved >= n. Sem SELECT ... FOR UPDATE: a linha
+    do produto só fica travada do UPDATE até o commit. Retorna False se não havia disponível.
+    """
+    result = db.execute(
+        update(RegisterGiftCardORM)
+        .where(
+            RegisterGiftCardORM.id == giftcard_id,
+            RegisterGiftCardORM.quantityavailable - RegisterGiftCardORM.quantityreserved >= quantity
+        )
+        .values(quantityreserved=RegisterGiftCardORM.quantityreserved + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def unhold_stock(db: Session, giftcard_id, quantity: int) -> None:
+    """Devolve unidades reservadas ao disponível (UPDATE relativo)."""
+    db.execute(
+        update(RegisterGiftCardORM)
+        .where(RegisterGiftCardORM.id == giftcard_id)
+        .values(quantityreserved=RegisterGiftCardORM.quantityreserved - quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def order_holds(db: Session, order_id) -> Dict:
+    """Unidades reservadas pelo pedido, por produto."""
+    return dict(db.execute(
+        select(StockReservationORM.register_giftcard_id, func.sum(StockReservationORM.quantity))
+        .where(StockReservationORM.order_id == order_id)
+        .group_by(StockReservationORM.register_giftcard_id)
+    ).all())
+
+
+def add_holds(db: Session, order_id, quantities: Dict, expires_at: datetime) -> None:
+    db.execute(insert(StockReservationORM), [
+        {"order_id": order_id, "register_giftcard_id": giftcard_id, "quantity": quantity, "expires_at": expires_at}
+        for giftcard_id, quantity in quantities.items()
+    ])
+
+
+def reserve_stock(db: Session, order_id, quantities: Dict) -> Optional[object]:
+    """
+    Checkout: grava as reservas do pedido e soma as unidades em quantityreserved (hold_stock, em ordem
+    de id para não haver deadlock entre carrinhos). Chame como última instrução antes de db.commit():
+    as linhas dos produtos ficam travadas só até o commit.
+    Retorna o id do primeiro produto sem disponível (nada é reservado nesse caso).
+    """
+    with db.begin_nested() as savepoint:
+        add_holds(db, order_id, quantities, now_brt() + RESERVATION_TTL)
+        for giftcard_id in sorted(quantities, key=str):
+            if not hold_stock(db, giftcard_id, quantities[giftcard_id]):
+                savepoint.rollback()
+                return giftcard_id
+    return None
+
+
+def release_reservations(db: Session, order_id) -> None:
+    """Pedido rejeitado, expirado ou sem preferência: apaga as reservas e devolve as unidades ao disponível."""
+    holds = order_holds(db, order_id)
+    db.execute(delete(StockReservationORM).where(StockReservationORM.order_id == order_id))
+    for giftcard_id in sorted(holds, key=str):
+        unhold_stock(db, giftcard_id, holds[giftcard_id])
+
+
+def commit_reservations(db: Session, order) -> Dict:
+    """
+    Aprovação: baixa o estoque e a reserva do pedido no mesmo UPDATE condicional e apaga as reservas.
+    Um pedido sem reserva só pode levar unidades livres. Sem unidades suficientes o produto não é
+    baixado (nem fica negativo) e entra no retorno, produto -> quantidade que faltou: o chamador
+    não pode entregar esses itens.
+    """
+    quantities = sum_quantities(order.items)
+    holds = order_holds(db, order.id)
+    shortfall = {}
+    for giftcard_id in sorted(quantities, key=str):
+        quantity, held = quantities[giftcard_id], holds.get(giftcard_id, 0)
+        result = db.execute(
+            update(RegisterGiftCardORM)
+            .where(
+                RegisterGiftCardORM.id == giftcard_id,
+                RegisterGiftCardORM.quantityavailable - RegisterGiftCardORM.quantityreserved + held >= quantity
+            )
+            .values(
+                quantityavailable=RegisterGiftCardORM.quantityavailable - quantity,
+                quantityreserved=RegisterGiftCardORM.quantityreserved - held
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            logger.error(f"Pedido {order.id} aprovado sem estoque suficiente do produto {giftcard_id}.")
+            shortfall[giftcard_id] = quantity
+            if held:
+                unhold_stock(db, giftcard_id, held)
+    db.execute(delete(StockReservationORM).where(StockReservationORM.order_id == order.id))
+    return shortfall
@@ -0,0 +1,294 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import BackgroundTasks
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database.db_config import AsyncSessionLocal, now_brt
+from app.models.order_orm import WebhookEventORM, WebhookEventStatus
+from app.services.email_service import hand_off_emails
+from app.services.payment_events_service import processed_cache, purge_processed_payments
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS") or 4)
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS") or 8)
+# Sem notificação nova, cada worker confere a fila nesse intervalo (eventos gravados por outros processos)
+POLL_SECONDS = 1.0
+LEASE = timedelta(minutes=2)
+RETRY_BASE_DELAY = timedelta(seconds=5)
+RETRY_MAX_DELAY = timedelta(minutes=10)
+# Eventos processados ficam um tempo para consulta e depois são apagados
+DONE_RETENTION = timedelta(days=7)
+
+# Processa um evento; uma exceção agenda nova tentativa. As tarefas de fundo rodam só depois do sucesso.
+EventHandler = Callable[[WebhookEventORM, BackgroundTasks], Awaitable[None]]
+
+
+def _naive(moment):
+    # As colunas DateTime guardam horário de Brasília sem fuso
+    return moment.replace(tzinfo=None)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Espera exponencial com jitter entre as tentativas de um evento."""
+    ceiling = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return ceiling * random.uniform(0.5, 1.0)
+
+
+class InboxStats:
+    """Contadores do processo e atraso (recebido -> processado) dos últimos eventos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.retried = 0
+        self.dead = 0
+        # Notificações descartadas no recebimento: pagamento já encerrado / agrupadas com a pendente
+        self.duplicates = 0
+        self.coalesced = 0
+        self.lags = deque(maxlen=1000)
+
+    def record(self, outcome: str, lag: Optional[float] = None):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            if lag is not None:
+                self.lags.append(lag)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            lags = sorted(self.lags)
+            return {
+                "processed": self.processed,
+                "retried": self.retried,
+                "dead": self.dead,
+                "duplicates": self.duplicates,
+                "coalesced": self.coalesced,
+                "lag_p50_ms": round(statistics.median(lags) * 1000, 1) if lags else None,
+                "lag_p95_ms": round(lags[min(len(lags) - 1, int(len(lags) * 0.95))] * 1000, 1) if lags else None,
+            }
+
+
+class KeyedLocks:
+    """Um asyncio.Lock por chave, descartado quando ninguém mais o usa."""
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+
+async def enqueue_webhook(db: AsyncSession, payment_id: str, payload: dict) -> bool:
+    """
+    Grava a notificação na caixa de entrada. Se o pagamento já tem um evento pendente, não grava outro:
+    o worker consulta o status atual no gateway, então um evento cobre todas as notificações repetidas.
+    Retorna False quando a notificação foi agrupada com a pendente.
+    """
+    # Entregas simultâneas do mesmo pagamento neste processo: uma grava, as outras encontram a pendente
+    async with _enqueue_locks.hold(payment_id):
+        pending = await db.scalar(
+            select(WebhookEventORM.id)
+            .where(WebhookEventORM.payment_id == payment_id, WebhookEventORM.status == WebhookEventStatus.PENDING)
+            .limit(1)
+        )
+        if pending is not None:
+            webhook_inbox.stats.record("coalesced")
+            return False
+        db.add(WebhookEventORM(payment_id=payment_id, payload=json.dumps(payload)))
+        await db.commit()
+    webhook_inbox.notify()
+    return True
+
+
+class WebhookInbox:
+    """
+    Pool de workers que esvazia webhook_inbox. Cada worker pega um evento com UPDATE condicional
+    (dois workers, mesmo em processos diferentes, nunca pegam o mesmo), chama o handler e marca DONE;
+    em erro agenda nova tentativa com espera crescente e, passado WEBHOOK_MAX_ATTEMPTS, marca DEAD.
+    """
+
+    def __init__(self):
+        self.stats = InboxStats()
+        # O handler segura o lock do pedido: notificações do mesmo pedido não rodam em paralelo
+        self.order_locks = KeyedLocks()
+        self._wakeup = asyncio.Event()
+        self._tasks = set()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def _ready(self, now):
+        return or_(
+            and_(WebhookEventORM.status == WebhookEventStatus.PENDING, WebhookEventORM.next_attempt_at <= now),
+            and_(WebhookEventORM.status == WebhookEventStatus.PROCESSING, WebhookEventORM.locked_until < now),
+        )
+
+    async def _claim(self) -> Optional[WebhookEventORM]:
+        now = _naive(now_brt())
+        async with AsyncSessionLocal() as db:
+            candidates = (await db.execute(
+                select(WebhookEventORM.id).where(self._ready(now)).order_by(WebhookEventORM.id).limit(WEBHOOK_WORKERS)
+            )).scalars().all()
+            for event_id in candidates:
+                result = await db.execute(
+                    update(WebhookEventORM)
+                    .where(WebhookEventORM.id == event_id, self._ready(now))
+                    .values(
+                        status=WebhookEventStatus.PROCESSING,
+                        locked_until=now + LEASE,
+                        attempts=WebhookEventORM.attempts + 1,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+                if result.rowcount == 1:
+                    return await db.get(WebhookEventORM, event_id)
+        return None
+
+    async def _finish(self, event: WebhookEventORM, error: Optional[BaseException]):
+        now = _naive(now_brt())
+        values = {"locked_until": None}
+        if error is None:
+            values.update(status=WebhookEventStatus.DONE, processed_at=now, last_error=None)
+            self.stats.record("processed", (now - event.received_at).total_seconds())
+        elif event.attempts >= WEBHOOK_MAX_ATTEMPTS:
+            values.update(status=WebhookEventStatus.DEAD, processed_at=now, last_error=repr(error))
+            self.stats.record("dead")
+            logger.critical(f"Webhook do pagamento {event.payment_id} desistido após {event.attempts} tentativa(s): {error!r}")
+        else:
+            values.update(
+                status=WebhookEventStatus.PENDING,
+                next_attempt_at=now + retry_delay(event.attempts),
+                last_error=repr(error),
+            )
+            self.stats.record("retried")
+            logger.warning(f"Webhook do pagamento {event.payment_id} falhou (tentativa {event.attempts}): {error!r}")
+        async with AsyncSessionLocal() as db:
+            # attempts confere que o evento ainda é deste worker (o prazo pode ter vencido e outro o pegou)
+            await db.execute(
+                update(WebhookEventORM)
+                .where(WebhookEventORM.id == event.id, WebhookEventORM.attempts == event.attempts)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def run_once(self, handler: EventHandler) -> bool:
+        """Processa um evento pronto, se houver. Retorna False com a fila vazia."""
+        event = await self._claim()
+        if event is None:
+            return False
+        background_tasks = BackgroundTasks()
+        try:
+            await handler(event, background_tasks)
+        except Exception as e:
+            await self._finish(event, e)
+        else:
+            await self._finish(event, None)
+            # E-mails saem fora do worker, que já pode pegar o próximo evento
+            hand_off_emails(background_tasks)
+        return True
+
+    async def drain(self, handler: EventHandler) -> int:
+        """Processa os eventos prontos até a fila esvaziar (scripts e testes). Retorna quantos processou."""
+        count = 0
+        while await self.run_once(handler):
+            count += 1
+        return count
+
+    async def _worker(self, handler: EventHandler):
+        while True:
+            try:
+                if await self.run_once(handler):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Falha do próprio banco da fila: espera e tenta de novo
+                logger.exception("Worker de webhooks: erro ao ler a caixa de entrada.")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self, handler: EventHandler, workers: int = WEBHOOK_WORKERS):
+        # Recriado aqui para pertencer ao event loop da aplicação
+        self._wakeup = asyncio.Event()
+        for _ in range(workers):
+            task = asyncio.create_task(self._worker(handler))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Interrompe os workers. Um evento interrompido no meio volta para a fila quando o prazo vence."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def metrics(self) -> Dict:
+        now = _naive(now_brt())
+        async with AsyncSessionLocal() as db:
+            by_status = dict((await db.execute(
+                select(WebhookEventORM.status, func.count()).group_by(WebhookEventORM.status)
+            )).all())
+            oldest = await db.scalar(
+                select(func.min(WebhookEventORM.received_at)).where(
+                    WebhookEventORM.status.in_([WebhookEventStatus.PENDING, WebhookEventStatus.PROCESSING])
+                )
+            )
+        return {
+            "queue_depth": by_status.get(WebhookEventStatus.PENDING, 0) + by_status.get(WebhookEventStatus.PROCESSING, 0),
+            "by_status": {status.value: by_status.get(status, 0) for status in WebhookEventStatus},
+            "oldest_pending_age_s": round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+            "workers": len(self._tasks),
+            **self.stats.snapshot(),
+            "dedup_cache": {"entries": await processed_cache.size(), **processed_cache.stats.snapshot()},
+        }
+
+
+webhook_inbox = WebhookInbox()
+_enqueue_locks = KeyedLocks()
+
+
+async def purge_processed_webhooks():
+    """
+    Job do scheduler: apaga eventos DONE mais antigos que DONE_RETENTION (os DEAD ficam para análise)
+    e as marcas de idempotência vencidas.
+    """
+    cutoff = _naive(now_brt()) - DONE_RETENTION
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            delete(WebhookEventORM).where(
+                WebhookEventORM.status == WebhookEventStatus.DONE, WebhookEventORM.processed_at < cutoff
+            )
+        )
+        payments = await purge_processed_payments(db)
+        await db.commit()
+    if result.rowcount or payments:
+        logger.info(
+            f"webhook_inbox: {result.rowcount} evento(s) processado(s) e {payments} marca(s) de pagamento apagado(s)."
+        )
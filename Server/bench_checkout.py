@@ -0,0 +1,82 @@
+# bench_checkout.py
+#
+# Teste de carga do checkout + webhook contra o gateway falso (fake_payment_gateway.py):
+# dispara checkouts concorrentes de um produto, mede requisições/s e latência e, no fim, espera
+# o gateway entregar os webhooks de pagamento e mostra os contadores dele.
+#
+#   python fake_payment_gateway.py --port 9000 --webhook-url http://localhost:8000/mercadopago/webhook
+#   PAYMENT_GATEWAY_URL=http://localhost:9000 uvicorn app.main:app --workers 1
+#   python bench_checkout.py --token <JWT de cliente> --product-id <id> --concurrency 20 --requests 500
+#
+# Use um produto com estoque suficiente: checkouts sem estoque voltam 400 e aparecem na contagem.
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+
+async def run_checkouts(client: httpx.AsyncClient, headers: dict, product_id: str, concurrency: int, total: int):
+    latencies = []
+    statuses = Counter()
+    remaining = iter(range(total))
+    body = {"items": [{"product_id": product_id, "quantity": 1}]}
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await client.post("/mercadopago/create_preference_cart", json=body, headers=headers)
+                statuses[response.status_code] += 1
+            except httpx.HTTPError:
+                statuses["erro de conexão"] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(
+        f"checkout {total / elapsed:8.1f} req/s  "
+        f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  status {dict(statuses)}"
+    )
+
+
+async def wait_for_webhooks(gateway_url: str, timeout: float):
+    async with httpx.AsyncClient(base_url=gateway_url, timeout=10) as gateway:
+        deadline = time.perf_counter() + timeout
+        while True:
+            stats = (await gateway.get("/stats")).json()
+            delivered = stats["webhooks_ok"] + stats["webhooks_failed"]
+            if (stats["pending_webhooks"] == 0 and delivered >= stats["payments"]) or time.perf_counter() > deadline:
+                break
+            await asyncio.sleep(0.5)
+    print(f"gateway {stats}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Teste de carga do checkout com o gateway falso")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--gateway-url", default="http://localhost:9000")
+    parser.add_argument("--token", required=True, help="JWT de um usuário CUSTOMER")
+    parser.add_argument("--product-id", required=True)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--webhook-timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.token}"}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        print(f"Concorrência {args.concurrency}, {args.requests} checkouts")
+        await run_checkouts(client, headers, args.product_id, args.concurrency, args.requests)
+    await wait_for_webhooks(args.gateway_url, args.webhook_timeout)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
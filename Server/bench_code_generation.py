@@ -0,0 +1,97 @@
+# bench_code_generation.py
+#
+# Mede a latência de aprovação de um pedido com N códigos aleatórios
+# (process_successful_order) com 10k / 100k / 1M códigos já emitidos.
+# Usa um banco SQLite temporário, não toca no MySQL do projeto.
+#
+# Uso: python bench_code_generation.py [quantidade_do_pedido]
+
+import os
+import sys
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+
+os.environ.setdefault("MERCADOPAGO_ACCESS_TOKEN", "TEST-bench")
+os.environ.setdefault("EMAIL_USER", "bench@example.com")
+os.environ.setdefault("EMAIL_PASS", "bench")
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker, joinedload
+
+from app.database.db_config import Base
+from app.models import user_orm, giftcard_orm, enterprise_orm, categories_orm, order_orm
+from app.models.giftcard_orm import RegisterGiftCardORM
+from app.models.order_orm import OrderORM, OrderItemORM, OrderStatus, IssuedCodeORM
+from app.services.order_cleanup_service import process_successful_order
+
+EXISTING_CODES = [10_000, 100_000, 1_000_000]
+ORDER_QUANTITY = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+SEED_BATCH = 50_000
+
+
+def seed(session, existing_codes):
+    giftcard = RegisterGiftCardORM(
+        user_id=1, title="Bench", desired_amount=Decimal("10"), valor=Decimal("10.30"),
+        quantityavailable=ORDER_QUANTITY, generaterandomly=True
+    )
+    session.add(giftcard)
+    session.flush()
+
+    history_order = OrderORM(owner_id=1, total_amount=Decimal("0"), status=OrderStatus.APPROVED)
+    session.add(history_order)
+    session.flush()
+    history_item = OrderItemORM(
+        order_id=history_order.id, register_giftcard_id=giftcard.id, enterprise_id=1,
+        quantity=existing_codes, unit_price=Decimal("10.30"), seller_amount=Decimal("10")
+    )
+    session.add(history_item)
+    session.flush()
+
+    for start in range(0, existing_codes, SEED_BATCH):
+        size = min(SEED_BATCH, existing_codes - start)
+        session.execute(insert(IssuedCodeORM), [
+            {"code": str(uuid.uuid4()), "order_item_id": history_item.id} for _ in range(size)
+        ])
+
+    order = OrderORM(owner_id=1, total_amount=Decimal("0"), status=OrderStatus.PENDING)
+    session.add(order)
+    session.flush()
+    session.add(OrderItemORM(
+        order_id=order.id, register_giftcard_id=giftcard.id, enterprise_id=1,
+        quantity=ORDER_QUANTITY, unit_price=Decimal("10.30"), seller_amount=Decimal("10")
+    ))
+    session.commit()
+    return order.id
+
+
+def run(existing_codes):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine, autoflush=False)
+
+        with Session() as session:
+            order_id = seed(session, existing_codes)
+
+        with Session() as session:
+            order = session.query(OrderORM).options(
+                joinedload(OrderORM.items).joinedload(OrderItemORM.original_giftcard),
+                joinedload(OrderORM.items).joinedload(OrderItemORM.gift_items),
+            ).filter(OrderORM.id == order_id).first()
+
+            started = time.perf_counter()
+            process_successful_order(session, order, {}, background_tasks=None)
+            session.commit()
+            elapsed = time.perf_counter() - started
+
+        engine.dispose()
+    return elapsed
+
+
+if __name__ == "__main__":
+    print(f"Aprovação de um pedido com {ORDER_QUANTITY} códigos aleatórios")
+    for existing in EXISTING_CODES:
+        elapsed = run(existing)
+        print(f"  {existing:>9,} códigos existentes: {elapsed * 1000:8.1f} ms")
@@ -0,0 +1,73 @@
+# bench_concurrency.py
+#
+# Mede requisições/s nas rotas de catálogo e de validação sob concorrência.
+# Rode contra o servidor antes e depois de uma mudança e compare os números:
+#
+#   uvicorn app.main:app --workers 1
+#   python bench_concurrency.py --base-url http://localhost:8000 \
+#       --token <JWT de empresa> --code <código emitido> --concurrency 50 --requests 2000
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def run_endpoint(client: httpx.AsyncClient, path: str, headers: dict, concurrency: int, total: int):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await client.get(path, headers=headers)
+                if response.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(
+        f"{path:<40} {total / elapsed:8.1f} req/s  "
+        f"p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  erros {errors}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark de concorrência da API GoGift")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", help="JWT de um usuário ENTERPRISE (rota de validação)")
+    parser.add_argument("--code", help="Código emitido para consultar em /validation/{code}")
+    parser.add_argument("--search", default="gift", help="Termo usado em /giftcards/search/")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    endpoints = [
+        ("/giftcards/", {}),
+        (f"/giftcards/search/?q={args.search}", {}),
+        ("/giftcards/best-sellers", {}),
+    ]
+    if args.token and args.code:
+        endpoints.append((f"/validation/{args.code}", {"Authorization": f"Bearer {args.token}"}))
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30) as client:
+        print(f"Concorrência {args.concurrency}, {args.requests} requisições por rota")
+        for path, headers in endpoints:
+            await run_endpoint(client, path, headers, args.concurrency, args.requests)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
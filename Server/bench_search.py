@@ -0,0 +1,119 @@
+# bench_search.py
+#
+# Compara a busca antiga (title ILIKE '%q%', sem limite) com o índice invertido BM25
+# (search_service) num catálogo sintético de 100k produtos, e mede o autocomplete
+# (/giftcards/suggest) com prefixos e erros de digitação.
+# Usa um banco SQLite temporário, não toca no MySQL do projeto.
+#
+# Uso: python bench_search.py [quantidade_de_produtos]
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from decimal import Decimal
+
+os.environ.setdefault("MERCADOPAGO_ACCESS_TOKEN", "TEST-bench")
+os.environ.setdefault("EMAIL_USER", "bench@example.com")
+os.environ.setdefault("EMAIL_PASS", "bench")
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database.db_config import Base
+from app.models import user_orm, giftcard_orm, enterprise_orm, categories_orm, order_orm
+from app.models.categories_orm import CategoriesORM
+from app.models.giftcard_orm import RegisterGiftCardORM
+from app.services.search_service import SearchIndex, SuggestIndex
+
+PRODUCTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+SEED_BATCH = 20_000
+RUNS = 50
+
+BRANDS = ["Netflix", "Spotify", "Steam", "PlayStation", "Xbox", "iFood", "Uber", "Amazon", "Google Play",
+          "Apple", "Nintendo", "Starbucks", "Cinemark", "Renner", "Centauro", "Magalu", "Riachuelo"]
+WORDS = ["cartão", "presente", "crédito", "vale", "assinatura", "mensal", "anual", "jogos", "música",
+         "filmes", "séries", "café", "restaurante", "moda", "esportes", "promoção", "digital", "recarga",
+         "família", "premium", "básico", "aniversário", "natal", "viagem", "livros", "educação"]
+CATEGORIES = ["Jogos", "Streaming", "Alimentação", "Moda", "Transporte", "Educação", "Música", "Varejo"]
+QUERIES = ["netflix", "cartao presente", "musica premium", "cafe", "jogos natal", "viagem familia", "steam"]
+SUGGEST_QUERIES = ["n", "net", "netflx", "playstaion", "spotify mus", "cartao pres", "starbuks cafe"]
+
+
+def seed(session):
+    categories = [CategoriesORM(name=name) for name in CATEGORIES]
+    session.add_all(categories)
+    session.flush()
+    category_ids = [c.id for c in categories]
+
+    rng = random.Random(42)
+    for start in range(0, PRODUCTS, SEED_BATCH):
+        rows = []
+        for _ in range(min(SEED_BATCH, PRODUCTS - start)):
+            amount = Decimal(rng.randint(10, 500))
+            rows.append({
+                "id": uuid.uuid4(), "user_id": 1,
+                "title": f"{rng.choice(BRANDS)} {' '.join(rng.sample(WORDS, 2))}",
+                "description": " ".join(rng.sample(WORDS, 8)),
+                "desired_amount": amount, "valor": amount * Decimal("1.03"),
+                "quantityavailable": 10, "ativo": True, "category_id": rng.choice(category_ids),
+            })
+        session.execute(insert(RegisterGiftCardORM), rows)
+    session.commit()
+
+
+def measure(fn):
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.median(timings) * 1000, timings[int(RUNS * 0.95) - 1] * 1000, result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        session = Session()
+
+        started = time.perf_counter()
+        seed(session)
+        print(f"Catálogo: {PRODUCTS} produtos ({time.perf_counter() - started:.1f}s para popular)")
+
+        index = SearchIndex()
+        started = time.perf_counter()
+        index.rebuild(session)
+        print(f"Índice montado em {time.perf_counter() - started:.1f}s\n")
+
+        print(f"{'consulta':<20} {'ILIKE p50/p95 (ms)':>22} {'linhas':>8}   {'índice p50/p95 (ms)':>22} {'página':>7}")
+        for q in QUERIES:
+            like = select(RegisterGiftCardORM.id).filter(
+                RegisterGiftCardORM.ativo == True, RegisterGiftCardORM.title.ilike(f"%{q}%")
+            )
+            like_p50, like_p95, like_rows = measure(lambda: session.execute(like).all())
+            idx_p50, idx_p95, (page, _) = measure(lambda: index.search(q, limit=50))
+            print(f"{q:<20} {like_p50:10.2f} / {like_p95:9.2f} {len(like_rows):>8}   "
+                  f"{idx_p50:10.2f} / {idx_p95:9.2f} {len(page):>7}")
+
+        suggester = SuggestIndex()
+        started = time.perf_counter()
+        suggester.rebuild(session)
+        print(f"\nAutocomplete montado em {time.perf_counter() - started:.1f}s\n")
+        print(f"{'digitado':<20} {'p50/p95 (ms)':>18}   sugestões")
+        for q in SUGGEST_QUERIES:
+            p50, p95, suggestions = measure(lambda: suggester.suggest(q))
+            print(f"{q:<20} {p50:7.3f} / {p95:7.3f}   {[s['text'] for s in suggestions[:3]]}")
+
+        print("\nObs.: ILIKE não ignora acentos nem olha descrição/categoria ('cafe' não acha 'café'),"
+              " e devolve o conjunto inteiro sem paginação.")
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# check_oversell.py
+#
+# Teste de concorrência do estoque (app/services/stock_service.py): vários threads ou processos
+# disputam o mesmo produto, cada um tentando comprar mais do que existe. No fim confere que nenhuma
+# unidade foi vendida além do estoque e que o saldo bate.
+#
+#   --flow direct        baixa condicional (take_stock) e 10% das compras devolvidas (return_stock)
+#   --flow reservations  checkout reserva (reserve_stock); 10% dos pedidos são rejeitados
+#                        (release_reservations), 5% perdem a reserva antes da aprovação (pagamento
+#                        que chega depois do pedido fechado) e o resto é aprovado (commit_reservations).
+#                        Aprovação sem reserva só baixa o que ainda houver livre; o que faltar volta
+#                        como falta e não conta como vendido.
+#
+# Nos dois fluxos 2% das tentativas são edições de estoque pela empresa (set_stock, de -3 a +5
+# unidades sobre o valor lido), que não podem sobrescrever vendas nem ficar abaixo das reservas.
+#
+# Sem argumentos usa um banco SQLite temporário; com --database-url roda contra o banco informado
+# (use um banco de teste: cria um usuário e um produto temporários e os apaga no fim).
+#
+# Uso: python check_oversell.py [--database-url URL] [--mode threads|processes]
+#          [--flow direct|reservations] [--workers 16] [--stock 2000] [--attempts 400]
+# Sai com código 1 se houver venda acima do estoque ou divergência no saldo.
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+from types import SimpleNamespace
+
+os.environ.setdefault("MERCADOPAGO_ACCESS_TOKEN", "TEST-oversell")
+os.environ.setdefault("EMAIL_USER", "oversell@example.com")
+os.environ.setdefault("EMAIL_PASS", "oversell")
+
+from sqlalchemy import create_engine, delete, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.database.db_config import Base
+from app.enums.roles import Role
+from app.models import user_orm, giftcard_orm, enterprise_orm, categories_orm, order_orm
+from app.models.giftcard_orm import RegisterGiftCardORM
+from app.models.order_orm import OrderORM, OrderStatus, StockReservationORM
+from app.models.user_orm import UserORM
+from app.services.stock_service import (
+    commit_reservations, release_reservations, reserve_stock, return_stock, set_stock, take_stock
+)
+
+RETURN_RATE = 0.1
+LAPSE_RATE = 0.05
+EDIT_RATE = 0.02
+
+_engines = {}
+
+
+def make_engine(url):
+    if url.startswith("sqlite"):
+        # O SQLite serializa as escritas; espera a trava em vez de falhar com "database is locked"
+        return create_engine(url, connect_args={"timeout": 60, "check_same_thread": False})
+    return create_engine(url, pool_size=32, max_overflow=0)
+
+
+def engine_for(url):
+    # Um engine por processo (e compartilhado pelos threads dele)
+    key = (os.getpid(), url)
+    if key not in _engines:
+        _engines[key] = make_engine(url)
+    return _engines[key]
+
+
+def transaction(Session, fn):
+    """Roda fn(db) numa transação; deadlock/timeout de trava desfaz tudo e tenta de novo. Devolve (resultado, repetições)."""
+    retried = 0
+    while True:
+        db = Session()
+        try:
+            result = fn(db)
+            db.commit()
+            return result, retried
+        except OperationalError:
+            db.rollback()
+            retried += 1
+        finally:
+            db.close()
+
+
+def worker(url, flow, giftcard_id, owner_id, attempts, seed):
+    """Cada tentativa compra 1-3 unidades; a devolução (ou rejeição) acontece numa transação seguinte."""
+    rng = random.Random(seed)
+    Session = sessionmaker(bind=engine_for(url))
+    sold = returned = returned_count = refused = retried = short = lapsed = added = edits = 0
+    for _ in range(attempts):
+        if rng.random() < EDIT_RATE:
+            delta = rng.randint(-3, 5)
+
+            def edit(db):
+                seen = db.scalar(select(RegisterGiftCardORM.quantityavailable).where(RegisterGiftCardORM.id == giftcard_id))
+                return set_stock(db, giftcard_id, seen, max(0, seen + delta)) and max(0, seen + delta) - seen
+
+            changed, retries = transaction(Session, edit)
+            retried += retries
+            added += changed or 0
+            edits += 1
+        quantity = rng.randint(1, 3)
+        if flow == "direct":
+            taken, retries = transaction(Session, lambda db: take_stock(db, giftcard_id, quantity))
+            retried += retries
+            if not taken:
+                refused += 1
+                continue
+            sold += quantity
+            if rng.random() < RETURN_RATE:
+                _, retries = transaction(Session, lambda db: return_stock(db, giftcard_id, quantity))
+                retried += retries
+                returned += quantity
+                returned_count += 1
+            continue
+
+        order = SimpleNamespace(id=uuid.uuid4(), items=[SimpleNamespace(register_giftcard_id=giftcard_id, quantity=quantity)])
+
+        def checkout(db):
+            db.add(OrderORM(id=order.id, owner_id=owner_id, total_amount=Decimal("10.50"), status=OrderStatus.PENDING))
+            db.flush()
+            return reserve_stock(db, order.id, {giftcard_id: quantity}) is None
+
+        reserved, retries = transaction(Session, checkout)
+        retried += retries
+        if not reserved:
+            refused += 1
+            continue
+        outcome = rng.random()
+        if outcome < RETURN_RATE:
+            _, retries = transaction(Session, lambda db: release_reservations(db, order.id))
+            retried += retries
+            continue
+        if outcome < RETURN_RATE + LAPSE_RATE:
+            _, retries = transaction(Session, lambda db: release_reservations(db, order.id))
+            retried += retries
+            lapsed += 1
+        shortfall, retries = transaction(Session, lambda db: commit_reservations(db, order))
+        retried += retries
+        if shortfall:
+            short += 1
+        else:
+            sold += quantity
+    # Transações confirmadas: a compra de cada tentativa mais a devolução/aprovação/rejeição seguinte
+    transactions = attempts + edits + (attempts - refused + lapsed if flow == "reservations" else returned_count)
+    return sold, returned, refused, retried, short, lapsed, added, transactions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de venda acima do estoque sob concorrência")
+    parser.add_argument("--database-url")
+    parser.add_argument("--mode", choices=["threads", "processes"], default="threads")
+    parser.add_argument("--flow", choices=["direct", "reservations"], default="direct")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--stock", type=int, default=2000)
+    parser.add_argument("--attempts", type=int, default=400, help="Tentativas de compra por worker")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite:///{os.path.join(tmp, 'oversell.db')}"
+        engine = make_engine(url)
+        Base.metadata.create_all(engine)
+
+        setup = sessionmaker(bind=engine)()
+        marker = uuid.uuid4().hex[:12]
+        owner = UserORM(
+            username="oversell", email=f"oversell-{marker}@example.com", password="-",
+            role=Role.ENTERPRISE, account_type="enterprise",
+        )
+        setup.add(owner)
+        setup.flush()
+        giftcard = RegisterGiftCardORM(
+            user_id=owner.id, title=f"Oversell {marker}", desired_amount=Decimal("10"),
+            valor=Decimal("10.30"), quantityavailable=args.stock, generaterandomly=True,
+        )
+        setup.add(giftcard)
+        setup.commit()
+        giftcard_id = giftcard.id
+
+        demand = args.workers * args.attempts * 2
+        print(f"{args.flow}/{args.mode}: {args.workers} workers, estoque {args.stock}, demanda média {demand} unidades")
+        pool = ProcessPoolExecutor if args.mode == "processes" else ThreadPoolExecutor
+        pool_args = {"mp_context": multiprocessing.get_context("spawn")} if args.mode == "processes" else {}
+        started = time.perf_counter()
+        with pool(max_workers=args.workers, **pool_args) as executor:
+            results = list(executor.map(
+                worker, [url] * args.workers, [args.flow] * args.workers, [giftcard_id] * args.workers,
+                [owner.id] * args.workers, [args.attempts] * args.workers, range(args.workers),
+            ))
+        elapsed = time.perf_counter() - started
+
+        sold = sum(r[0] for r in results)
+        returned = sum(r[1] for r in results)
+        refused = sum(r[2] for r in results)
+        retried = sum(r[3] for r in results)
+        short = sum(r[4] for r in results)
+        lapsed = sum(r[5] for r in results)
+        added = sum(r[6] for r in results)
+        transactions = sum(r[7] for r in results) + retried
+        final, reserved = setup.execute(
+            select(RegisterGiftCardORM.quantityavailable, RegisterGiftCardORM.quantityreserved)
+            .where(RegisterGiftCardORM.id == giftcard_id)
+        ).one()
+
+        print(f"{transactions / elapsed:.0f} transações/s ({elapsed:.1f} s), {retried} repetida(s) por trava")
+        holds = setup.scalar(select(func.count()).where(StockReservationORM.register_giftcard_id == giftcard_id))
+        print(f"vendidas {sold}, devolvidas {returned}, recusadas {refused}, ajuste manual {added:+d}, estoque final {final}")
+        if args.flow == "reservations":
+            print(f"reservas perdidas {lapsed}, aprovadas sem estoque {short}, reservas restantes {holds}/{reserved}")
+        # Só pedido que perdeu a reserva pode ficar sem estoque na aprovação
+        ok = (
+            final >= 0 and sold - returned <= args.stock + added and final == args.stock + added - sold + returned
+            and short <= lapsed and holds == 0 and reserved == 0
+        )
+        print("OK: nenhuma venda acima do estoque" if ok else "FALHOU: estoque inconsistente")
+
+        setup.execute(delete(OrderORM).where(OrderORM.owner_id == owner.id))
+        setup.execute(delete(RegisterGiftCardORM).where(RegisterGiftCardORM.id == giftcard_id))
+        setup.execute(delete(UserORM).where(UserORM.id == owner.id))
+        setup.commit()
+        setup.close()
+        engine.dispose()
+        for cached in _engines.values():
+            cached.dispose()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
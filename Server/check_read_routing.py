@@ -0,0 +1,189 @@
+# check_read_routing.py
+#
+# Confere o roteamento de app/database/read_replicas.py sem precisar de MySQL: um SQLite faz o papel
+# do primário e outros dois o das réplicas. Cada banco guarda o próprio nome numa tabela, então cada
+# leitura mostra de onde veio. Confere que:
+#
+#   - leituras vão para uma réplica, sempre a mesma durante a sessão (e as sessões se espalham entre elas);
+#   - flush, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE, o cabeçalho X-Read-Primary e use_primary()
+#     mandam a sessão para o primário, e as leituras seguintes também vão para ele.
+#
+# Roda tudo com a sessão síncrona (get_read_db) e com a assíncrona (get_async_read_db).
+#
+# Uso: python check_read_routing.py
+# Sai com código 1 se alguma leitura for para o banco errado.
+
+import asyncio
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.TemporaryDirectory()
+REPLICAS = ["replica-0", "replica-1"]
+
+
+def _url(name, driver="sqlite"):
+    return f"{driver}:///{os.path.join(_tmp.name, name + '.db')}"
+
+
+# Antes de importar app.database: os engines são criados na importação
+os.environ["DATABASE_URL"] = _url("primary")
+os.environ["ASYNC_DATABASE_URL"] = _url("primary", "sqlite+aiosqlite")
+os.environ["REPLICA_DATABASE_URLS"] = ",".join(_url(name) for name in REPLICAS)
+os.environ["ASYNC_REPLICA_DATABASE_URLS"] = ",".join(_url(name, "sqlite+aiosqlite") for name in REPLICAS)
+
+from sqlalchemy import Column, Integer, String, create_engine, select, update
+from sqlalchemy.orm import declarative_base
+from starlette.requests import Request
+
+from app.database.db_config import engine, async_engine
+from app.database.read_replicas import (
+    READ_PRIMARY_HEADER, AsyncReadSessionLocal, ReadSessionLocal, async_replica_engines, get_async_read_db,
+    get_read_db, replica_engines, use_primary
+)
+
+MarkerBase = declarative_base()
+SESSIONS_FOR_SPREAD = 20
+
+
+class Marker(MarkerBase):
+    __tablename__ = "read_routing_marker"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(20), nullable=False)
+
+
+def seed():
+    for name in ["primary"] + REPLICAS:
+        seed_engine = create_engine(_url(name))
+        MarkerBase.metadata.create_all(seed_engine)
+        with seed_engine.begin() as conn:
+            conn.execute(Marker.__table__.insert().values(name=name))
+        seed_engine.dispose()
+
+
+def read(db):
+    return db.scalar(select(Marker.name).limit(1))
+
+
+def request(read_primary=False):
+    headers = [(READ_PRIMARY_HEADER.lower().encode(), b"1")] if read_primary else []
+    return Request({"type": "http", "headers": headers})
+
+
+# Cada cenário recebe a sessão síncrona (no caso async, via run_sync) e devolve o banco de cada leitura
+def only_reads(db):
+    return [read(db) for _ in range(5)]
+
+
+def after_flush(db):
+    first = read(db)
+    db.add(Marker(name="flush"))
+    db.flush()
+    return [first, read(db)]
+
+
+def after_dml(db):
+    first = read(db)
+    db.execute(update(Marker).where(Marker.id == -1).values(name="dml"))
+    return [first, read(db)]
+
+
+def for_update(db):
+    return [read(db), db.scalar(select(Marker.name).with_for_update().limit(1)), read(db)]
+
+
+def after_use_primary(db):
+    first = read(db)
+    use_primary(db)
+    return [first, read(db)]
+
+
+SCENARIOS = [
+    ("só leituras", only_reads, ["replica"] * 5),
+    ("flush", after_flush, ["replica", "primary"]),
+    ("UPDATE", after_dml, ["replica", "primary"]),
+    ("SELECT ... FOR UPDATE", for_update, ["replica", "primary", "primary"]),
+    ("use_primary()", after_use_primary, ["replica", "primary"]),
+]
+
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+
+    def expect(self, label, names, expected):
+        kinds = ["replica" if name in REPLICAS else name for name in names]
+        # Todas as leituras de réplica da sessão devem ter ido para a mesma
+        sticky = len({name for name in names if name in REPLICAS}) <= 1
+        ok = kinds == expected and sticky
+        self.failures += not ok
+        print(f"{'OK     ' if ok else 'FALHOU '} {label}: {' -> '.join(names)}")
+
+    def spread(self, label, names):
+        ok = set(names) == set(REPLICAS)
+        self.failures += not ok
+        print(f"{'OK     ' if ok else 'FALHOU '} {label}: {len(names)} sessões em {sorted(set(names))}")
+
+
+def check_sync(checker):
+    for label, scenario, expected in SCENARIOS:
+        db = ReadSessionLocal()
+        try:
+            checker.expect(f"sync, {label}", scenario(db), expected)
+        finally:
+            db.close()
+
+    for read_primary, expected in ((False, "replica"), (True, "primary")):
+        dependency = get_read_db(request(read_primary))
+        db = next(dependency)
+        checker.expect(f"sync, get_read_db {READ_PRIMARY_HEADER}={read_primary}", [read(db), read(db)], [expected] * 2)
+        dependency.close()
+
+    names = []
+    for _ in range(SESSIONS_FOR_SPREAD):
+        db = ReadSessionLocal()
+        names.append(read(db))
+        db.close()
+    checker.spread("sync, réplica sorteada por sessão", names)
+
+
+async def check_async(checker):
+    for label, scenario, expected in SCENARIOS:
+        async with AsyncReadSessionLocal() as db:
+            checker.expect(f"async, {label}", await db.run_sync(scenario), expected)
+
+    for read_primary, expected in ((False, "replica"), (True, "primary")):
+        dependency = get_async_read_db(request(read_primary))
+        db = await dependency.__anext__()
+        names = [await db.run_sync(read), await db.run_sync(read)]
+        checker.expect(f"async, get_async_read_db {READ_PRIMARY_HEADER}={read_primary}", names, [expected] * 2)
+        await dependency.aclose()
+
+    names = []
+    for _ in range(SESSIONS_FOR_SPREAD):
+        async with AsyncReadSessionLocal() as db:
+            names.append(await db.run_sync(read))
+    checker.spread("async, réplica sorteada por sessão", names)
+
+    await async_engine.dispose()
+    for replica in async_replica_engines:
+        await replica.dispose()
+
+
+def main():
+    seed()
+    checker = Checker()
+    check_sync(checker)
+    asyncio.run(check_async(checker))
+
+    engine.dispose()
+    for replica in replica_engines:
+        replica.dispose()
+    _tmp.cleanup()
+    print("OK: roteamento de leitura correto" if not checker.failures else f"FALHOU: {checker.failures} verificação(ões)")
+    sys.exit(1 if checker.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
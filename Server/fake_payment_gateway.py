@@ -0,0 +1,176 @@
+# fake_payment_gateway.py
+#
+# Gateway de pagamento falso, compatível com as rotas da API do Mercado Pago usadas pela aplicação
+# (POST /checkout/preferences e GET /v1/payments/{id}), para testar checkout e webhook sem internet.
+# Cada preferência criada é "paga" depois de --pay-delay segundos: o pagamento é registrado e o
+# webhook da aplicação recebe a notificação, como no Mercado Pago.
+#
+#   python fake_payment_gateway.py --port 9000 --webhook-url http://localhost:8000/mercadopago/webhook
+#   PAYMENT_GATEWAY_URL=http://localhost:9000 uvicorn app.main:app
+#   python bench_checkout.py --token <JWT de cliente> --product-id <id> --gateway-url http://localhost:9000
+#
+# --latency-ms e --error-rate simulam lentidão e falhas (503) para exercitar timeouts e novas tentativas;
+# --duplicates repete cada webhook, como o Mercado Pago faz, para exercitar a deduplicação.
+# GET /stats mostra contadores e a latência das entregas de webhook.
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from typing import Dict, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Gateway de pagamento falso")
+settings = argparse.Namespace(
+    latency_ms=0, error_rate=0.0, pay_delay=1.0, approve_rate=0.9, duplicates=0, webhook_url=None,
+    public_url="http://localhost:9000",
+)
+
+preferences: Dict[str, dict] = {}
+preferences_by_key: Dict[str, str] = {}
+payments: Dict[str, dict] = {}
+stats = {"preferences": 0, "idempotent_replays": 0, "payments": 0, "injected_errors": 0, "webhooks_ok": 0, "webhooks_failed": 0}
+webhook_latencies = []
+background = set()
+webhook_client: Optional[httpx.AsyncClient] = None
+
+
+async def simulate_network():
+    if settings.latency_ms:
+        await asyncio.sleep(settings.latency_ms / 1000 * random.uniform(0.5, 1.5))
+    if random.random() < settings.error_rate:
+        stats["injected_errors"] += 1
+        return JSONResponse(status_code=503, content={"message": "falha simulada"})
+    return None
+
+
+async def deliver_webhook(url: str, payment_id: str):
+    global webhook_client
+    if webhook_client is None:
+        webhook_client = httpx.AsyncClient(timeout=30)
+    started = time.perf_counter()
+    try:
+        response = await webhook_client.post(url, json={"type": "payment", "data": {"id": payment_id}})
+        stats["webhooks_ok" if response.status_code < 400 else "webhooks_failed"] += 1
+    except httpx.HTTPError:
+        stats["webhooks_failed"] += 1
+    webhook_latencies.append(time.perf_counter() - started)
+
+
+def register_payment(preference: dict, payment_status: str) -> dict:
+    payment_id = str(random.randint(10**10, 10**11))
+    total = sum(item["unit_price"] * item["quantity"] for item in preference.get("items", []))
+    payment = {
+        "id": int(payment_id),
+        "status": payment_status,
+        "status_detail": "accredited" if payment_status == "approved" else "cc_rejected_other_reason",
+        "external_reference": preference.get("external_reference"),
+        "transaction_amount": round(total, 2),
+        "transaction_details": {"net_received_amount": round(total * 0.95, 2)},
+    }
+    payments[payment_id] = payment
+    stats["payments"] += 1
+    return payment
+
+
+async def pay_later(preference: dict):
+    await asyncio.sleep(settings.pay_delay)
+    payment_status = "approved" if random.random() < settings.approve_rate else "rejected"
+    payment = register_payment(preference, payment_status)
+    url = settings.webhook_url or preference.get("notification_url")
+    if url:
+        # A primeira entrega e as repetidas chegam juntas, como nas novas tentativas do Mercado Pago
+        await asyncio.gather(*(deliver_webhook(url, str(payment["id"])) for _ in range(1 + settings.duplicates)))
+
+
+@app.post("/checkout/preferences", status_code=201)
+async def create_preference(request: Request, x_idempotency_key: Optional[str] = Header(None)):
+    failure = await simulate_network()
+    if failure:
+        return failure
+    if x_idempotency_key in preferences_by_key:
+        stats["idempotent_replays"] += 1
+        return preferences[preferences_by_key[x_idempotency_key]]
+
+    data = await request.json()
+    preference_id = f"fake-{uuid.uuid4()}"
+    preference = {
+        **data,
+        "id": preference_id,
+        "init_point": f"{settings.public_url}/checkout/{preference_id}",
+    }
+    preferences[preference_id] = preference
+    if x_idempotency_key:
+        preferences_by_key[x_idempotency_key] = preference_id
+    stats["preferences"] += 1
+    if settings.pay_delay >= 0:
+        task = asyncio.create_task(pay_later(preference))
+        background.add(task)
+        task.add_done_callback(background.discard)
+    return preference
+
+
+@app.get("/v1/payments/{payment_id}")
+async def get_payment(payment_id: str):
+    failure = await simulate_network()
+    if failure:
+        return failure
+    if payment_id not in payments:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    return payments[payment_id]
+
+
+@app.post("/simulate/payments")
+async def simulate_payment(preference_id: str, status: str = "approved"):
+    """Paga uma preferência manualmente (útil com --pay-delay -1)."""
+    preference = preferences.get(preference_id)
+    if not preference:
+        raise HTTPException(status_code=404, detail="Preferência não encontrada")
+    payment = register_payment(preference, status)
+    url = settings.webhook_url or preference.get("notification_url")
+    if url:
+        await deliver_webhook(url, str(payment["id"]))
+    return payment
+
+
+@app.get("/stats")
+async def get_stats():
+    latencies = sorted(webhook_latencies)
+    return {
+        **stats,
+        "pending_webhooks": len(background),
+        "webhook_p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "webhook_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gateway de pagamento falso (API do Mercado Pago)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latência média por chamada à API")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração de chamadas que respondem 503")
+    parser.add_argument("--pay-delay", type=float, default=1.0, help="Segundos até pagar a preferência (-1 desliga)")
+    parser.add_argument("--approve-rate", type=float, default=0.9, help="Fração dos pagamentos aprovados")
+    parser.add_argument("--duplicates", type=int, default=0, help="Entregas repetidas de cada webhook")
+    parser.add_argument("--webhook-url", help="Substitui o notification_url das preferências")
+    args = parser.parse_args()
+
+    settings.latency_ms = args.latency_ms
+    settings.error_rate = args.error_rate
+    settings.pay_delay = args.pay_delay
+    settings.approve_rate = args.approve_rate
+    settings.duplicates = args.duplicates
+    settings.webhook_url = args.webhook_url
+    settings.public_url = f"http://{args.host}:{args.port}"
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()